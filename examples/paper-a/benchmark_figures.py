@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the Paper A figure pipeline, on synthetic data.
+
+Every benchmark runs against a synthetic dataset (synthetic_phevs.py) of
+each requested size, written to a temporary directory, so the suite needs
+neither the private RDS file nor a network connection. The suite covers
+the stages of a figure build:
+
+    load/*      Parquet cache build and column-pruned load_phevs()
+    stats/*     grouped statistics, KDE and 2-D binning (phev_stats)
+    sample/*    seeded and stratified row sampling (phev_sampling)
+    compute/*   each figure's compute function
+    render/*    each figure's draw function and save_figure(), on its summary
+
+Each benchmark is timed `--repeat` times and the median and minimum are
+kept. --save-baseline stores the results as JSON; --compare checks a run
+against a stored baseline, prints a Markdown report and exits with status
+1 if any benchmark is more than --threshold times slower, so CI can gate
+merges on it. Baselines are only comparable on the same machine.
+
+Usage:
+    python3 benchmark_figures.py --sizes 100k,1M --save-baseline benchmarks/baseline.json
+    python3 benchmark_figures.py --sizes 100k,1M --compare benchmarks/baseline.json
+    python3 benchmark_figures.py --sizes 100k --filter stats/ --repeat 10
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from pathlib import Path
+
+import numpy as np
+
+script_dir = Path(__file__).parent.absolute()
+baseline_path = script_dir / "benchmarks" / "baseline.json"
+
+BENCHMARK_VERSION = 1
+DEFAULT_SIZES = '100k,1M,2.5M'
+DEFAULT_REPEAT = 5
+# Slowdown (current / baseline median) reported as a regression
+DEFAULT_THRESHOLD = 1.25
+# Differences below this many seconds are timer noise, never regressions
+NOISE_SECONDS = 0.005
+# Rows drawn by the sampling benchmarks
+SAMPLE_ROWS = 50_000
+
+# Benchmark registry, in run order
+Benchmark = namedtuple('Benchmark', ['name', 'setup', 'repeat'])
+BENCHMARKS = {}
+
+
+def benchmark(name, repeat=None):
+    """Register setup(context) -> zero-argument callable to time.
+
+    `repeat` overrides --repeat for benchmarks too slow to run many times.
+    """
+    def register(setup):
+        BENCHMARKS[name] = Benchmark(name, setup, repeat)
+        return setup
+    return register
+
+
+class BenchContext:
+    """One synthetic dataset on disk and the frame loaded from it."""
+
+    def __init__(self, directory, rows):
+        from phev_data import load_phevs
+        from synthetic_phevs import synthetic_phevs, write_dataset
+
+        self.directory = Path(directory)
+        self.rows = rows
+        self.source = write_dataset(synthetic_phevs(rows), self.directory / 'data')
+        self.fig_dir = self.directory / 'figures'
+        self.fig_dir.mkdir()
+        self.phevs = load_phevs(directory=self.source.parent)
+        self._summaries = {}
+
+    def summary(self, fig_id):
+        """The figure's summary, computed once."""
+        if fig_id not in self._summaries:
+            self._summaries[fig_id] = figures().FIGURES[fig_id].compute(self.phevs)
+        return self._summaries[fig_id]
+
+
+def figures():
+    """The figure script, imported on first use (it sets up matplotlib)."""
+    import create_figures_markos_python
+    return create_figures_markos_python
+
+
+#==============================================================================
+# Benchmarks
+#==============================================================================
+@benchmark('load/build_cache', repeat=1)
+def bench_build_cache(ctx):
+    from phev_data import build_cache
+    return lambda: build_cache(ctx.source)
+
+
+@benchmark('load/load_phevs')
+def bench_load_phevs(ctx):
+    from phev_data import load_phevs
+    return lambda: load_phevs(directory=ctx.source.parent)
+
+
+@benchmark('stats/grouped_stats')
+def bench_grouped_stats(ctx):
+    from phev_stats import grouped_stats
+    return lambda: grouped_stats(ctx.phevs, 'Country', ['EDSen_mech', 'EnTot_final100km'])
+
+
+@benchmark('stats/binned_kde')
+def bench_binned_kde(ctx):
+    from phev_stats import binned_kde
+    values = ctx.phevs['EDSen_mech'].dropna().to_numpy(dtype=np.float64)
+    return lambda: binned_kde(values, num=200)
+
+
+@benchmark('stats/binned_grid')
+def bench_binned_grid(ctx):
+    from phev_stats import binned_grid, equal_width_edges
+    data = ctx.phevs[['Mass', 'EDSen_mech', 'EnTot_final100km']].dropna()
+    mass = data['Mass'].to_numpy(dtype=np.float64)
+    eds = data['EDSen_mech'].to_numpy(dtype=np.float64)
+    energy = data['EnTot_final100km'].to_numpy(dtype=np.float64)
+    mass_edges, eds_edges = equal_width_edges(mass, 20), equal_width_edges(eds, 20)
+    return lambda: binned_grid(mass, eds, energy, mass_edges, eds_edges, ('n', 'median', 'mean'))
+
+
+def _unversioned(ctx):
+    # Without a dataset version sample_indices() neither reads nor writes its cache
+    phevs = ctx.phevs.copy(deep=False)
+    phevs.attrs = {}
+    return phevs
+
+
+@benchmark('sample/uniform')
+def bench_sample_uniform(ctx):
+    from phev_sampling import sample_indices
+    phevs = _unversioned(ctx)
+    return lambda: sample_indices(phevs, SAMPLE_ROWS)
+
+
+@benchmark('sample/stratified')
+def bench_sample_stratified(ctx):
+    from phev_sampling import MASS_CATEGORY, sample_indices
+    phevs = _unversioned(ctx)
+    return lambda: sample_indices(phevs, SAMPLE_ROWS, strata=('Country', MASS_CATEGORY))
+
+
+def _register_figures():
+    for fig_id in figures().FIGURES:
+        benchmark(f'compute/{fig_id}')(
+            lambda ctx, fig_id=fig_id: lambda: figures().FIGURES[fig_id].compute(ctx.phevs))
+        benchmark(f'render/{fig_id}', repeat=3)(
+            lambda ctx, fig_id=fig_id: _render(ctx, fig_id))
+
+
+def _render(ctx, fig_id):
+    module = figures()
+    task = module.FIGURES[fig_id]
+    summary = ctx.summary(fig_id)
+    if summary is None:
+        return None
+    options = module.save_options(task)
+
+    def render():
+        with contextlib.redirect_stdout(io.StringIO()):
+            module.save_figure(task.draw(summary), task.filename, **options)
+    return render
+
+
+#==============================================================================
+# Runner
+#==============================================================================
+def time_call(function, repeat):
+    """Wall-clock seconds of `repeat` calls of `function`."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def run_suite(rows, names, repeat=DEFAULT_REPEAT, log=print):
+    """Run the benchmarks `names` on an `rows`-row dataset; {name: result}."""
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='phev-bench-') as directory:
+        log(f"Generating {rows:,} synthetic rows...")
+        ctx = BenchContext(directory, rows)
+        module = figures()
+        saved_fig_dir, module.fig_dir = module.fig_dir, ctx.fig_dir
+        try:
+            for name in names:
+                bench = BENCHMARKS[name]
+                function = bench.setup(ctx)
+                if function is None:
+                    log(f"  {name:<24} skipped")
+                    continue
+                times = time_call(function, bench.repeat or repeat)
+                results[name] = {'median': statistics.median(times), 'min': min(times),
+                                 'runs': len(times)}
+                log(f"  {name:<24} {results[name]['median'] * 1000:10.1f} ms")
+        finally:
+            module.fig_dir = saved_fig_dir
+    return results
+
+
+def machine_info():
+    import matplotlib
+    import pandas as pd
+    return {'python': platform.python_version(), 'platform': platform.platform(),
+            'processor': platform.processor() or platform.machine(),
+            'numpy': np.__version__, 'pandas': pd.__version__,
+            'matplotlib': matplotlib.__version__}
+
+
+def load_results(path):
+    with open(path) as f:
+        results = json.load(f)
+    if results.get('version') != BENCHMARK_VERSION:
+        raise ValueError(f"{path} was written by another version of the benchmark suite")
+    return results
+
+
+def save_results(path, results):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix('.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """Rows (size, name, baseline s, current s, ratio, status) for the report."""
+    rows = []
+    for size, results in current['results'].items():
+        reference = baseline['results'].get(size, {})
+        for name, result in results.items():
+            if name not in reference:
+                rows.append((size, name, None, result['median'], None, 'new'))
+                continue
+            before, after = reference[name]['median'], result['median']
+            ratio = after / before if before else float('inf')
+            if ratio > threshold and after - before > NOISE_SECONDS:
+                status = 'REGRESSION'
+            elif ratio < 1 / threshold and before - after > NOISE_SECONDS:
+                status = 'faster'
+            else:
+                status = 'ok'
+            rows.append((size, name, before, after, ratio, status))
+    return rows
+
+
+def markdown_report(rows, current, baseline, threshold):
+    lines = ["# Benchmark comparison", "",
+             f"Baseline: {baseline['created']} ({baseline['machine']['python']}, "
+             f"numpy {baseline['machine']['numpy']}, pandas {baseline['machine']['pandas']})",
+             f"Current: {current['created']} ({current['machine']['python']}, "
+             f"numpy {current['machine']['numpy']}, pandas {current['machine']['pandas']})",
+             f"Regression threshold: {threshold:.2f}x", "",
+             "| Rows | Benchmark | Baseline (ms) | Current (ms) | Ratio | Status |",
+             "|---:|---|---:|---:|---:|---|"]
+    for size, name, before, after, ratio, status in rows:
+        before_text = f"{before * 1000:.1f}" if before is not None else "-"
+        ratio_text = f"{ratio:.2f}x" if ratio is not None else "-"
+        lines.append(f"| {size} | {name} | {before_text} | {after * 1000:.1f} | {ratio_text} "
+                     f"| {status} |")
+    regressions = sum(row[-1] == 'REGRESSION' for row in rows)
+    lines += ["", f"{regressions} regression(s) in {len(rows)} benchmarks."]
+    return "\n".join(lines)
+
+
+def parse_args(argv=None):
+    from synthetic_phevs import parse_rows
+
+    parser = argparse.ArgumentParser(description="Benchmark the figure pipeline on synthetic data.")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help=f"comma-separated dataset sizes (default: {DEFAULT_SIZES})")
+    parser.add_argument('--filter', '-k', default='',
+                        help="only run benchmarks whose name contains this text (or one of "
+                             "several, comma-separated), e.g. stats/,sample/")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help=f"timed runs per benchmark (default: {DEFAULT_REPEAT})")
+    parser.add_argument('--output', '-o', type=Path, help="write the results as JSON")
+    parser.add_argument('--save-baseline', nargs='?', type=Path, const=baseline_path,
+                        help=f"store the results as the baseline (default: {baseline_path})")
+    parser.add_argument('--compare', nargs='?', type=Path, const=baseline_path,
+                        help="compare against a stored baseline; exit status 1 on regressions")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f"slowdown counted as a regression (default: {DEFAULT_THRESHOLD})")
+    parser.add_argument('--report', type=Path, help="also write the comparison as Markdown")
+    args = parser.parse_args(argv)
+    args.sizes = {size.strip(): parse_rows(size.strip())
+                  for size in args.sizes.split(',') if size.strip()}
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    _register_figures()
+    patterns = [pattern.strip() for pattern in args.filter.split(',')]
+    names = [name for name in BENCHMARKS if any(pattern in name for pattern in patterns)]
+    if not names:
+        print(f"No benchmarks match '{args.filter}' (choose from {', '.join(BENCHMARKS)})")
+        return 1
+
+    baseline = None
+    if args.compare:
+        try:
+            baseline = load_results(args.compare)
+        except (OSError, ValueError) as e:
+            print(f"Error: cannot read the baseline: {e}")
+            return 1
+
+    current = {'version': BENCHMARK_VERSION,
+               'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'machine': machine_info(),
+               'repeat': args.repeat,
+               'results': {}}
+    for size, rows in args.sizes.items():
+        current['results'][size] = run_suite(rows, names, args.repeat)
+
+    if args.output:
+        save_results(args.output, current)
+    if args.save_baseline:
+        save_results(args.save_baseline, current)
+        print(f"\nSaved baseline: {args.save_baseline}")
+    if baseline is None:
+        return 0
+
+    rows = compare(current, baseline, args.threshold)
+    report = markdown_report(rows, current, baseline, args.threshold)
+    print("\n" + report)
+    if args.report:
+        args.report.write_text(report + "\n")
+    return 1 if any(row[-1] == 'REGRESSION' for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
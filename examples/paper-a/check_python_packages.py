@@ -2,33 +2,100 @@
 """
 Python Package Checker for Figure Generation Script
 Checks if all required packages are installed and provides installation instructions
+
+Packages are found with importlib.util.find_spec and their versions read
+from importlib.metadata, so nothing is imported and the check takes
+milliseconds. --deep also imports every installed package, each in its own
+subprocess (in parallel), and reports how long the import took.
+
+Usage:
+    python check_python_packages.py
+    python check_python_packages.py --deep
+    python check_python_packages.py --json     # machine-readable; exit status 1 if anything required is missing
 """
 
-import sys
+import argparse
+import importlib.metadata
+import importlib.util
+import json
+import os
 import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+# Distribution (pip) name -> import name
 required_packages = {
     'pandas': 'pandas',
     'numpy': 'numpy',
     'matplotlib': 'matplotlib',
     'seaborn': 'seaborn',
-    'scipy': 'scipy',
     'pyreadr': 'pyreadr'  # For reading RDS files
 }
 
 optional_packages = {
-    'scikit-learn': 'scikit-learn',  # For GAM if needed
+    'pyarrow': 'pyarrow',  # For the Parquet cache of the RDS data
+    'scikit-learn': 'sklearn',  # For GAM if needed
 }
 
+# Run in a fresh interpreter by --deep; prints the import time in seconds
+IMPORT_TIMER = "import time; t = time.perf_counter(); import {0}; print(time.perf_counter() - t)"
+
 def check_package(package_name, import_name=None):
-    """Check if a package is installed"""
+    """Installed state and version of a package, without importing it."""
     if import_name is None:
         import_name = package_name
     try:
-        __import__(import_name)
-        return True
-    except ImportError:
-        return False
+        installed = importlib.util.find_spec(import_name) is not None
+    except (ImportError, ValueError):
+        installed = False
+    try:
+        version = importlib.metadata.version(package_name)
+    except importlib.metadata.PackageNotFoundError:
+        version = None
+    return {'package': package_name, 'import': import_name, 'installed': installed, 'version': version}
+
+def time_import(import_name, timeout=120):
+    """Import a module in a fresh interpreter: (seconds, None) or (None, error)."""
+    try:
+        result = subprocess.run([sys.executable, '-c', IMPORT_TIMER.format(import_name)],
+                                capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return None, f'import timed out after {timeout} s'
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        return None, lines[-1] if lines else f'exit status {result.returncode}'
+    return float(result.stdout.strip().splitlines()[-1]), None
+
+def check_packages(deep=False, jobs=None):
+    """Probe the required and optional packages.
+
+    Returns a report dict: per-package entries under 'required' and
+    'optional', the 'missing' required packages and an overall 'ok'. With
+    `deep`, installed packages are also imported in parallel subprocesses and
+    their entries get 'import_seconds' and 'import_error'.
+    """
+    start = time.perf_counter()
+    report = {
+        'python': sys.version.split()[0],
+        'executable': sys.executable,
+        'required': [check_package(name, import_name) for name, import_name in required_packages.items()],
+        'optional': [check_package(name, import_name) for name, import_name in optional_packages.items()],
+    }
+
+    if deep:
+        entries = [entry for entry in report['required'] + report['optional'] if entry['installed']]
+        with ThreadPoolExecutor(jobs or min(len(entries), os.cpu_count() or 1) or 1) as pool:
+            timings = pool.map(time_import, [entry['import'] for entry in entries])
+            for entry, (seconds, error) in zip(entries, timings):
+                entry['import_seconds'] = seconds
+                entry['import_error'] = error
+
+    report['missing'] = [entry['package'] for entry in report['required']
+                         if not entry['installed'] or entry.get('import_error')]
+    report['ok'] = not report['missing']
+    report['seconds'] = time.perf_counter() - start
+    return report
 
 def install_package(package_name):
     """Install a package using pip"""
@@ -38,38 +105,60 @@ def install_package(package_name):
     except subprocess.CalledProcessError:
         return False
 
-def main():
+def describe(entry, optional=False):
+    """One result line for the console report."""
+    if not entry['installed']:
+        return f"○ {entry['package']} is not installed (optional)" if optional else f"✗ {entry['package']} is NOT installed"
+    line = f"✓ {entry['package']} {entry['version'] or '(unknown version)'} is installed"
+    if optional:
+        line += " (optional)"
+    if entry.get('import_error'):
+        line = f"✗ {entry['package']} is installed but fails to import: {entry['import_error']}"
+    elif entry.get('import_seconds') is not None:
+        line += f" - imports in {entry['import_seconds']:.2f} s"
+    return line
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Check the Python packages needed by the figure script.')
+    parser.add_argument('--deep', action='store_true',
+                        help='also import each package in a subprocess and report its import time')
+    parser.add_argument('--jobs', '-j', type=int, default=None,
+                        help='with --deep: imports to run at once (default: one per CPU)')
+    parser.add_argument('--json', action='store_true',
+                        help='print the report as JSON and never offer to install')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = check_packages(deep=args.deep, jobs=args.jobs)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0 if report['ok'] else 1
+
     print("=" * 60)
     print("Python Package Checker for Figure Generation")
     print("=" * 60)
     print()
-    
-    missing_packages = []
-    installed_packages = []
-    
+
     print("Checking required packages...")
     print("-" * 60)
-    
-    for package_name, import_name in required_packages.items():
-        if check_package(package_name, import_name):
-            print(f"✓ {package_name} is installed")
-            installed_packages.append(package_name)
-        else:
-            print(f"✗ {package_name} is NOT installed")
-            missing_packages.append(package_name)
-    
+
+    for entry in report['required']:
+        print(describe(entry))
+
     print()
     print("Checking optional packages...")
     print("-" * 60)
-    
-    for package_name, import_name in optional_packages.items():
-        if check_package(package_name, import_name):
-            print(f"✓ {package_name} is installed (optional)")
-        else:
-            print(f"○ {package_name} is not installed (optional)")
-    
+
+    for entry in report['optional']:
+        print(describe(entry, optional=True))
+
+    print()
+    print(f"Checked in {report['seconds'] * 1000:.0f} ms")
     print()
-    
+
+    missing_packages = report['missing']
     if missing_packages:
         print("=" * 60)
         print("MISSING PACKAGES DETECTED")
@@ -83,7 +172,7 @@ def main():
         for pkg in missing_packages:
             print(f"  pip install {pkg}")
         print()
-        
+
         # Ask if user wants to install automatically
         try:
             if sys.stdin.isatty():  # Only ask if running interactively
@@ -98,18 +187,19 @@ def main():
                         else:
                             print("✗ installation failed")
                     print()
-                    
+
                     # Re-check
                     print("Re-checking packages...")
+                    importlib.invalidate_caches()
                     still_missing = []
                     for pkg in missing_packages:
                         import_name = required_packages[pkg]
-                        if check_package(pkg, import_name):
+                        if check_package(pkg, import_name)['installed']:
                             print(f"✓ {pkg} is now installed")
                         else:
                             print(f"✗ {pkg} installation failed")
                             still_missing.append(pkg)
-                    
+
                     if still_missing:
                         print()
                         print("Some packages failed to install. Please install manually:")
@@ -122,7 +212,7 @@ def main():
         except (EOFError, KeyboardInterrupt):
             print("\nInstallation cancelled.")
             return 1
-        
+
         return 1
     else:
         print("=" * 60)
@@ -135,5 +225,4 @@ def main():
         return 0
 
 if __name__ == "__main__":
-    import sys
     sys.exit(main())
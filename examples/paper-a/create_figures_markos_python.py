@@ -8,439 +8,574 @@
 # - EDS figures BEFORE energy figures (better flow)
 # - Information-dense figures with good color palettes
 # - Recreate Markos's 3 screenshots as better quality figures
+#
+# Each figure is a registered task: a compute function (phevs frame -> small
+# plot-ready summary), a draw function (summary -> Figure) and the columns it
+# reads. Only the columns of the selected figures are loaded, and with
+# --jobs N the figures render in parallel on a process pool that shares the
+# loaded data. Figures whose data columns, code (including the constants,
+# shared functions and helper modules it uses) and style are unchanged since
+# the last run (see figures_manifest.json) are reused rather than re-rendered.
+#
+# With --stream CSV the summaries come from chunked, out-of-core aggregates
+# (phev_streaming.py) instead, so memory is bounded by the chunk size.
+#
+# Usage:
+#   python create_figures_markos_python.py
+#   python create_figures_markos_python.py --jobs 8
+#   python create_figures_markos_python.py --only figure03,figure07
+#   python create_figures_markos_python.py --force   # re-render everything
+#   python create_figures_markos_python.py --formats pdf,svg
+#   python create_figures_markos_python.py --stream obfcm_phevs.csv
+#   python create_figures_markos_python.py --profile-imports
+#   python create_figures_markos_python.py --report run_report.md --trace-memory --profile
+#
+# Startup is kept light for per-figure runs: matplotlib renders with the Agg
+# backend (no display needed) and seaborn is only imported by Figure 7. With
+# --profile-imports the cost of every module import is timed (import_timer.py)
+# and summarised at the end of the run.
+#
+# With --report the data load and each figure's compute, draw and save phases
+# are timed (wall, CPU, peak RSS growth; with --trace-memory also the top
+# tracemalloc allocation sites) and written as a JSON or Markdown run report
+# (run_report.py). --profile dumps a cProfile of each figure to profiles/.
+#
+# While iterating on a figure, figure_server.py keeps the data loaded in
+# shared memory and re-renders only the figures whose code changed on save.
 #==============================================================================
 
+import argparse
+import contextlib
+import multiprocessing
 import os
 import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+# Has to be seen before the imports below, which it times
+if '--profile-imports' in sys.argv[1:]:
+    from import_timer import ImportTimer
+    _import_timer = ImportTimer().install()
+else:
+    _import_timer = None
+
 import pandas as pd
 import numpy as np
+import matplotlib
+matplotlib.use('agg')  # headless: figures are only ever saved
 import matplotlib.pyplot as plt
-import seaborn as sns
-from pathlib import Path
-import pickle
+
+from figure_manifest import (figure_fingerprint, is_fresh, load_manifest, record,
+                             save_manifest, style_fingerprint)
+from figure_scatter import POINT_LAYER, apply_scatter_mode
+from phev_data import (column_fingerprints, load_phevs, mass_category, memory_report,
+                       period_labels)
+from phev_sampling import sample_indices, take_sample
+from phev_stats import (bin_centres, bin_codes, binned_grid, binned_kde, binned_stats,
+                        equal_width_edges, grouped_stats, summary_stats)
+from phev_trends import (TREND_GROUPS, binned_trend, bootstrap_trends, bootstrap_weights,
+                         group_labels, line_band, smooth_edges, solve_trends, trend_sums)
+from run_report import RunReport
+
+# seaborn's default 6-colour "husl" palette, as RGB, so that setting the
+# colour cycle does not need seaborn (sns.color_palette("husl"))
+HUSL_PALETTE = [
+    (0.9677975592919913, 0.44127456009157356, 0.5358103155058701),
+    (0.7350228985632719, 0.5952719904750953, 0.1944419133847522),
+    (0.3126890019504329, 0.6928754610296064, 0.1923704830330379),
+    (0.21044753832183283, 0.6773105080456748, 0.6433941168468681),
+    (0.23299120924703914, 0.639586552066035, 0.9260706093977744),
+    (0.9082572436765556, 0.40195790729656516, 0.9576909250290225),
+]
+
+# Colormaps whose colours are used as listed rather than sampled
+QUALITATIVE_COLORMAPS = ('Accent', 'Dark2', 'Paired', 'Pastel1', 'Pastel2', 'Set1', 'Set2',
+                         'Set3', 'tab10', 'tab20', 'tab20b', 'tab20c')
+
+
+def colormap_palette(name, n_colors):
+    """`n_colors` RGB colours from a matplotlib colormap, as sns.color_palette(name, n_colors).
+
+    Continuous colormaps are sampled evenly without their two end colours;
+    qualitative ones give their first `n_colors` colours.
+    """
+    cmap = matplotlib.colormaps[name]
+    if name in QUALITATIVE_COLORMAPS:
+        bins = np.linspace(0, 1, cmap.N)[:n_colors]
+    else:
+        bins = np.linspace(0, 1, n_colors + 2)[1:-1]
+    return list(map(tuple, cmap(bins)[:, :3]))
+
 
 # Set style
 plt.style.use('seaborn-v0_8-darkgrid')
-sns.set_palette("husl")
+plt.rcParams['axes.prop_cycle'] = matplotlib.cycler('color', HUSL_PALETTE)
 
-# Set working directory
 script_dir = Path(__file__).parent.absolute()
-os.chdir(script_dir)
-
 fig_dir = script_dir / "figures"
+manifest_path = script_dir / "figures_manifest.json"
+profile_dir = script_dir / "profiles"
 data_dir = script_dir / "data" / "processed"
 
-fig_dir.mkdir(exist_ok=True, parents=True)
+# Define color palettes
+palette_eds = colormap_palette("plasma", 100)
+palette_energy = colormap_palette("magma", 100)
+palette_regional = colormap_palette("Set2", 4)
 
-# Load data
-print("Loading data...")
-data_file = data_dir / "obfcm_phevs_unflagged.rds"
+# Figure registry, in paper order
+FigureTask = namedtuple('FigureTask', ['id', 'compute', 'draw', 'filename', 'title', 'columns',
+                                       'save'])
+FIGURES = {}
 
-if not data_file.exists():
-    # Try alternative path
-    data_file = data_dir / "obfcm_phevs_unflagged.pkl"
-    if data_file.exists():
-        with open(data_file, 'rb') as f:
-            phevs = pickle.load(f)
-    else:
-        print(f"Error: Data file not found at {data_file}")
-        sys.exit(1)
-else:
-    # RDS files need R to read, so convert first or use pandas with pyreadr
-    try:
-        import pyreadr
-        result = pyreadr.read_r(str(data_file))
-        phevs = result[list(result.keys())[0]]
-    except ImportError:
-        print("pyreadr not installed. Install with: pip install pyreadr")
-        print("Or convert RDS to CSV/PKL first")
-        sys.exit(1)
 
-print(f"Loaded {len(phevs)} records")
+def figure(fig_id, filename, title, columns, compute, save=None):
+    """Register a draw function (summary -> Figure) with its compute function.
+
+    compute(phevs) returns the summary dict the draw function plots, or None
+    to skip the figure. `save` holds per-figure save_figure() options.
+    """
+    def register(draw):
+        FIGURES[fig_id] = FigureTask(fig_id, compute, draw, filename, title, list(columns),
+                                     dict(save or {}))
+        return draw
+    return register
 
-# Define color palettes
-palette_eds = sns.color_palette("plasma", 100)
-palette_energy = sns.color_palette("magma", 100)
-palette_regional = sns.color_palette("Set2", 4)
 
 # Function to save figures
-def save_figure(fig, filename, dpi=300):
-    """Save figure with consistent settings"""
+def save_figure(fig, filename, dpi=300, scatter='points', formats=()):
+    """Save figure with consistent settings, then release it
+
+    `scatter` selects how point layers are written (see figure_scatter.py);
+    `formats` adds copies in other formats, e.g. ('pdf', 'svg').
+    """
+    apply_scatter_mode(fig, scatter, dpi)
     filepath = fig_dir / filename
     fig.savefig(filepath, dpi=dpi, bbox_inches='tight', facecolor='white')
-    print(f"Saved: {filename}")
+    for suffix in formats:
+        fig.savefig(filepath.with_suffix(f'.{suffix}'), dpi=dpi, bbox_inches='tight',
+                    facecolor='white')
+    plt.close(fig)
+    print(f"Saved: {filename}" + ''.join(f", .{suffix}" for suffix in formats))
+
 
 #==============================================================================
 # FIGURE 1: EDS Distribution (Markos wants this FIRST)
 #==============================================================================
-print("\nCreating Figure 1: EDS Distribution...")
+def compute_distribution(values, n_records, bins=100, points=200):
+    """Histogram, density curve and quartiles of one column (Figures 1 and 6)."""
+    values = values.dropna().to_numpy(dtype=np.float64)
+    density, edges = np.histogram(values, bins=bins, density=True)
+    kde_x, kde_y = binned_kde(values, num=points)
+    quartiles = summary_stats(values, ('median', 'q25', 'q75'))
+    return dict(n_records=n_records, edges=edges, density=density,
+                kde_x=kde_x, kde_y=kde_y, **quartiles)
+
 
-fig, ax = plt.subplots(figsize=(10, 6))
+def compute_figure01(phevs):
+    return compute_distribution(phevs['EDSen_mech'], len(phevs))
 
-# Remove NaN values
-eds_data = phevs['EDSen_mech'].dropna()
 
-# Histogram
-ax.hist(eds_data, bins=100, density=True, alpha=0.7, 
-        color=palette_eds[50], edgecolor='white', linewidth=0.1)
+@figure('figure01', "figure01_eds_distribution.png", 'EDS Distribution',
+        columns=['EDSen_mech'], compute=compute_figure01)
+def figure01(s):
+    fig, ax = plt.subplots(figsize=(10, 6))
 
-# Density curve
-from scipy import stats
-kde = stats.gaussian_kde(eds_data)
-x_range = np.linspace(eds_data.min(), eds_data.max(), 200)
-ax.plot(x_range, kde(x_range), color=palette_eds[80], linewidth=1.5)
+    # Histogram
+    ax.hist(s['edges'][:-1], bins=s['edges'], weights=s['density'], alpha=0.7,
+            color=palette_eds[50], edgecolor='white', linewidth=0.1)
 
-# Median and quartiles
-median_val = eds_data.median()
-q25 = eds_data.quantile(0.25)
-q75 = eds_data.quantile(0.75)
+    # Density curve
+    ax.plot(s['kde_x'], s['kde_y'], color=palette_eds[80], linewidth=1.5)
 
-ax.axvline(median_val, color='red', linestyle='--', linewidth=1, label=f'Median: {median_val:.1f}%')
-ax.axvline(q25, color='orange', linestyle='--', linewidth=0.8)
-ax.axvline(q75, color='orange', linestyle='--', linewidth=0.8)
+    # Median and quartiles
+    median_val, q25, q75 = s['median'], s['q25'], s['q75']
 
-ax.set_xlabel('Electric Driving Share (EDSen_mech, %)', fontsize=11, fontweight='bold')
-ax.set_ylabel('Density', fontsize=11, fontweight='bold')
-ax.set_title(f'Electric Driving Share (EDS) Distribution\n'
-             f'n = {len(phevs):,} PHEV records | Median: {median_val:.1f}% | '
-             f'IQR: {q25:.1f}-{q75:.1f}%', 
-             fontsize=13, fontweight='bold')
-ax.legend()
-ax.grid(alpha=0.3)
+    ax.axvline(median_val, color='red', linestyle='--', linewidth=1, label=f'Median: {median_val:.1f}%')
+    ax.axvline(q25, color='orange', linestyle='--', linewidth=0.8)
+    ax.axvline(q75, color='orange', linestyle='--', linewidth=0.8)
+
+    ax.set_xlabel('Electric Driving Share (EDSen_mech, %)', fontsize=11, fontweight='bold')
+    ax.set_ylabel('Density', fontsize=11, fontweight='bold')
+    ax.set_title(f'Electric Driving Share (EDS) Distribution\n'
+                 f'n = {s["n_records"]:,} PHEV records | Median: {median_val:.1f}% | '
+                 f'IQR: {q25:.1f}-{q75:.1f}%', 
+                 fontsize=13, fontweight='bold')
+    ax.legend()
+    ax.grid(alpha=0.3)
+
+    return fig
 
-save_figure(fig, "figure01_eds_distribution.png")
 
 #==============================================================================
 # FIGURE 2: EDS by Country/Region (Information-dense)
 #==============================================================================
-print("\nCreating Figure 2: EDS by Country...")
+def compute_figure02(phevs):
+    country_eds = grouped_stats(phevs, 'Country', 'EDSen_mech', ('n', 'median', 'q25', 'q75'))
+    return {'country_eds': country_eds}
+
 
-country_eds = phevs.groupby('Country')['EDSen_mech'].agg([
-    ('median_eds', 'median'),
-    ('q25_eds', lambda x: x.quantile(0.25)),
-    ('q75_eds', lambda x: x.quantile(0.75)),
-    ('n', 'count')
-]).reset_index()
+@figure('figure02', "figure02_eds_by_country.png", 'EDS by Country',
+        columns=['Country', 'EDSen_mech'], compute=compute_figure02)
+def figure02(s):
+    # Top 15 countries by sample size, ordered by median EDS
+    country_eds = (s['country_eds'].nlargest(15, 'EDSen_mech_n')
+                   .sort_values('EDSen_mech_median', ascending=False))
 
-country_eds = country_eds.sort_values('median_eds', ascending=False).head(15)
+    fig, ax = plt.subplots(figsize=(14, 7))
 
-fig, ax = plt.subplots(figsize=(14, 7))
+    x_pos = np.arange(len(country_eds))
+    bars = ax.bar(x_pos, country_eds['EDSen_mech_median'], 
+                  color=palette_eds[60], alpha=0.8)
 
-x_pos = np.arange(len(country_eds))
-bars = ax.bar(x_pos, country_eds['median_eds'], 
-              color=palette_eds[60], alpha=0.8)
+    # Error bars for IQR
+    ax.errorbar(x_pos, country_eds['EDSen_mech_median'],
+                yerr=[country_eds['EDSen_mech_median'] - country_eds['EDSen_mech_q25'],
+                      country_eds['EDSen_mech_q75'] - country_eds['EDSen_mech_median']],
+                fmt='none', color='0.3', linewidth=0.5, capsize=3)
 
-# Error bars for IQR
-ax.errorbar(x_pos, country_eds['median_eds'],
-            yerr=[country_eds['median_eds'] - country_eds['q25_eds'],
-                  country_eds['q75_eds'] - country_eds['median_eds']],
-            fmt='none', color='gray30', linewidth=0.5, capsize=3)
+    # Add value labels
+    for i, median in enumerate(country_eds['EDSen_mech_median']):
+        ax.text(i, median + 1, f"{median:.1f}",
+                ha='center', va='bottom', fontsize=9, color='0.2')
 
-# Add value labels
-for i, (idx, row) in enumerate(country_eds.iterrows()):
-    ax.text(i, row['median_eds'] + 1, f"{row['median_eds']:.1f}",
-            ha='center', va='bottom', fontsize=9, color='gray20')
+    ax.set_xticks(x_pos)
+    ax.set_xticklabels(country_eds['Country'].astype(str), rotation=45, ha='right', fontsize=9)
+    ax.set_ylabel('Median EDS (%)', fontsize=11, fontweight='bold')
+    ax.set_title('Electric Driving Share by Country\n'
+                 'Median EDS with IQR bars | Top 15 countries by sample size',
+                 fontsize=13, fontweight='bold')
+    ax.grid(axis='y', alpha=0.3)
 
-ax.set_xticks(x_pos)
-ax.set_xticklabels(country_eds['Country'], rotation=45, ha='right', fontsize=9)
-ax.set_ylabel('Median EDS (%)', fontsize=11, fontweight='bold')
-ax.set_title('Electric Driving Share by Country\n'
-             'Median EDS with IQR bars | Top 15 countries by sample size',
-             fontsize=13, fontweight='bold')
-ax.grid(axis='y', alpha=0.3)
+    return fig
 
-save_figure(fig, "figure02_eds_by_country.png")
 
 #==============================================================================
 # FIGURE 3: EDS Density Plot with Timeline (Recreating Markos's Screenshot 1)
 #==============================================================================
-print("\nCreating Figure 3: EDS Density with Timeline...")
+def compute_figure03(phevs):
+    # Create period variable if year exists (on a copy: phevs is shared)
+    phevs = phevs[['EDSen_mech']].assign(period=period_labels(phevs))
+
+    # Density by period, on a shared grid
+    x_range = np.linspace(phevs['EDSen_mech'].min(), phevs['EDSen_mech'].max(), 200)
+    curves = []
+    for period in phevs['period'].cat.categories:
+        eds_period = phevs[phevs['period'] == period]['EDSen_mech'].dropna()
+        if len(eds_period) > 1:
+            curves.append((f'Period {period}', *binned_kde(eds_period, grid=x_range)))
+
+    eds_by_period = grouped_stats(phevs, 'period', 'EDSen_mech', ('n', 'median', 'mean'))
+    return {'curves': curves, 'eds_by_period': eds_by_period}
+
+
+@figure('figure03', "figure03_eds_density_timeline.png", 'EDS Density with Timeline',
+        columns=['year', 'EDSen_mech'], compute=compute_figure03)
+def figure03(s):
+    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 10), 
+                                    gridspec_kw={'height_ratios': [2, 1]})
+
+    # Top panel: Density by period
+    for label, x_range, density in s['curves']:
+        ax1.plot(x_range, density, alpha=0.8, label=label, linewidth=1.5)
+
+    ax1.set_xlabel('Electric Driving Share (%)', fontsize=11, fontweight='bold')
+    ax1.set_ylabel('Density', fontsize=11, fontweight='bold')
+    ax1.set_title('EDS Distribution Over Time', fontsize=12, fontweight='bold')
+    ax1.legend()
+    ax1.grid(alpha=0.3)
+
+    # Bottom panel: Timeline
+    eds_by_period = s['eds_by_period']
+
+    ax2.plot(range(len(eds_by_period)), eds_by_period['EDSen_mech_median'], 
+             color=palette_eds[70], linewidth=1.5, marker='o', markersize=6)
+    ax2.set_xticks(range(len(eds_by_period)))
+    ax2.set_xticklabels(eds_by_period['period'].astype(str), rotation=45, ha='right')
+    ax2.set_ylabel('Median EDS (%)', fontsize=11, fontweight='bold')
+    ax2.set_title('Median EDS Timeline', fontsize=12, fontweight='bold')
+    ax2.grid(alpha=0.3)
+
+    # Add value labels
+    for i, median in enumerate(eds_by_period['EDSen_mech_median']):
+        ax2.annotate(f"{median:.1f}%", (i, median), xytext=(0, 4),
+                     textcoords='offset points',
+                     ha='center', va='bottom', fontsize=9, color='0.3')
+
+    fig.suptitle('EDS Distribution and Temporal Trends', 
+                 fontsize=14, fontweight='bold', y=0.98)
+
+    fig.tight_layout()
+    return fig
 
-# Create period variable if year exists
-if 'year' in phevs.columns:
-    phevs['period'] = phevs['year'].astype(str)
-else:
-    phevs['period'] = '2021-2023'
-
-fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 10), 
-                                gridspec_kw={'height_ratios': [2, 1]})
-
-# Top panel: Density by period
-periods = phevs['period'].unique()
-for period in periods:
-    eds_period = phevs[phevs['period'] == period]['EDSen_mech'].dropna()
-    if len(eds_period) > 0:
-        ax1.hist(eds_period, bins=50, density=True, alpha=0.6, 
-                label=f'Period {period}', histtype='step', linewidth=1.5)
-
-ax1.set_xlabel('Electric Driving Share (%)', fontsize=11, fontweight='bold')
-ax1.set_ylabel('Density', fontsize=11, fontweight='bold')
-ax1.set_title('EDS Distribution Over Time', fontsize=12, fontweight='bold')
-ax1.legend()
-ax1.grid(alpha=0.3)
-
-# Bottom panel: Timeline
-eds_by_period = phevs.groupby('period')['EDSen_mech'].agg([
-    ('median_eds', 'median'),
-    ('mean_eds', 'mean'),
-    ('n', 'count')
-]).reset_index()
-
-ax2.plot(range(len(eds_by_period)), eds_by_period['median_eds'], 
-         color=palette_eds[70], linewidth=1.5, marker='o', markersize=6)
-ax2.set_xticks(range(len(eds_by_period)))
-ax2.set_xticklabels(eds_by_period['period'], rotation=45, ha='right')
-ax2.set_ylabel('Median EDS (%)', fontsize=11, fontweight='bold')
-ax2.set_title('Median EDS Timeline', fontsize=12, fontweight='bold')
-ax2.grid(alpha=0.3)
-
-# Add value labels
-for i, row in eds_by_period.iterrows():
-    ax2.text(i, row['median_eds'] + 1, f"{row['median_eds']:.1f}%",
-            ha='center', va='bottom', fontsize=9, color='gray30')
-
-fig.suptitle('EDS Distribution and Temporal Trends', 
-             fontsize=14, fontweight='bold', y=0.98)
-
-plt.tight_layout()
-save_figure(fig, "figure03_eds_density_timeline.png")
 
 #==============================================================================
 # FIGURE 4: EDS vs Key Variables (Information-dense scatter)
 #==============================================================================
-print("\nCreating Figure 4: EDS vs Key Variables...")
-
-fig, axes = plt.subplots(2, 2, figsize=(14, 10))
-
-# Sample data for faster plotting
-sample_data = phevs.sample(min(50000, len(phevs)))
-
-# EDS vs Electric Range
-ax = axes[0, 0]
-ax.scatter(sample_data['Electric_range'], sample_data['EDSen_mech'],
-          alpha=0.3, s=0.5, color=palette_eds[50])
-z = np.polyfit(sample_data['Electric_range'].dropna(), 
-               sample_data.loc[sample_data['Electric_range'].notna(), 'EDSen_mech'],
-               1)
-p = np.poly1d(z)
-x_range = np.linspace(sample_data['Electric_range'].min(), 
-                      sample_data['Electric_range'].max(), 100)
-ax.plot(x_range, p(x_range), color=palette_eds[80], linewidth=1.5)
-ax.set_xlabel('Electric Range (km)', fontsize=10)
-ax.set_ylabel('EDS (%)', fontsize=10)
-ax.set_title('EDS vs Electric Range', fontsize=11)
-ax.grid(alpha=0.3)
-
-# EDS vs Total Mileage
-ax = axes[0, 1]
-mileage_data = sample_data[['Mileage_Tot', 'EDSen_mech']].dropna()
-ax.scatter(mileage_data['Mileage_Tot'], mileage_data['EDSen_mech'],
-          alpha=0.3, s=0.5, color=palette_eds[50])
-ax.set_xscale('log')
-z = np.polyfit(np.log10(mileage_data['Mileage_Tot']), 
-               mileage_data['EDSen_mech'], 1)
-x_range_log = np.logspace(np.log10(mileage_data['Mileage_Tot'].min()),
-                          np.log10(mileage_data['Mileage_Tot'].max()), 100)
-ax.plot(x_range_log, z[0]*np.log10(x_range_log) + z[1], 
-        color=palette_eds[80], linewidth=1.5)
-ax.set_xlabel('Total Mileage (km, log scale)', fontsize=10)
-ax.set_ylabel('EDS (%)', fontsize=10)
-ax.set_title('EDS vs Total Mileage', fontsize=11)
-ax.grid(alpha=0.3)
-
-# EDS vs Mass
-ax = axes[1, 0]
-mass_data = sample_data[['Mass', 'EDSen_mech']].dropna()
-ax.scatter(mass_data['Mass'], mass_data['EDSen_mech'],
-          alpha=0.3, s=0.5, color=palette_eds[50])
-z = np.polyfit(mass_data['Mass'], mass_data['EDSen_mech'], 1)
-x_range = np.linspace(mass_data['Mass'].min(), mass_data['Mass'].max(), 100)
-ax.plot(x_range, p(x_range), color=palette_eds[80], linewidth=1.5)
-ax.set_xlabel('Mass (kg)', fontsize=10)
-ax.set_ylabel('EDS (%)', fontsize=10)
-ax.set_title('EDS vs Vehicle Mass', fontsize=11)
-ax.grid(alpha=0.3)
-
-# EDS vs AER/Mass ratio (if available)
-ax = axes[1, 1]
-if 'AER_to_Mass' in sample_data.columns:
-    aer_data = sample_data[['AER_to_Mass', 'EDSen_mech']].dropna()
-    ax.scatter(aer_data['AER_to_Mass'], aer_data['EDSen_mech'],
-              alpha=0.3, s=0.5, color=palette_eds[50])
-    z = np.polyfit(aer_data['AER_to_Mass'], aer_data['EDSen_mech'], 1)
-    x_range = np.linspace(aer_data['AER_to_Mass'].min(), 
-                          aer_data['AER_to_Mass'].max(), 100)
-    ax.plot(x_range, p(x_range), color=palette_eds[80], linewidth=1.5)
-    ax.set_xlabel('AER/Mass (km/kg)', fontsize=10)
-    ax.set_ylabel('EDS (%)', fontsize=10)
-    ax.set_title('EDS vs AER/Mass Ratio', fontsize=11)
-else:
-    ax.text(0.5, 0.5, 'AER/Mass not available', ha='center', va='center')
-    ax.set_title('AER/Mass Ratio', fontsize=11)
-ax.grid(alpha=0.3)
+# The panels are drawn as density images, so they plot every vehicle
+FIGURE4_SAMPLE = None
+# (regressor, x label, panel title, log-scale x)
+FIGURE4_PANELS = [
+    ('Electric_range', 'Electric Range (km)', 'EDS vs Electric Range', False),
+    ('Mileage_Tot', 'Total Mileage (km, log scale)', 'EDS vs Total Mileage', True),
+    ('Mass', 'Mass (kg)', 'EDS vs Vehicle Mass', False),
+    ('AER_to_Mass', 'AER/Mass (km/kg)', 'EDS vs AER/Mass Ratio', False),
+]
+
+
+def compute_figure04(phevs):
+    # Same seeded sample on every run, if the panels are sampled at all
+    indices = sample_indices(phevs, FIGURE4_SAMPLE) if FIGURE4_SAMPLE else slice(None)
+
+    # Every trend from one pass over the full data (log10 x for log panels);
+    # the bands come from bootstrap resamples of per-group sums
+    present = [panel for panel in FIGURE4_PANELS if panel[0] in phevs.columns]
+    eds = phevs['EDSen_mech'].to_numpy(dtype=np.float64, na_value=np.nan)
+    columns = []
+    for column, _, _, log in present:
+        x = phevs[column].to_numpy(dtype=np.float64, na_value=np.nan)
+        if log:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                x = np.log10(x)
+        columns.append(x)
+    regressors = np.column_stack(columns) if columns else np.empty((len(phevs), 0))
+    groups = group_labels(len(phevs))
+    weights = bootstrap_weights(TREND_GROUPS)
+    group_sums = trend_sums(regressors, eds, groups, TREND_GROUPS)
+    slopes, intercepts = solve_trends(group_sums.sum(axis=0))
+    boot_slopes, boot_intercepts = bootstrap_trends(group_sums, weights)
+
+    panels = {}
+    for j, (column, _, _, log) in enumerate(present):
+        x = regressors[:, j]
+        valid = np.isfinite(x) & np.isfinite(eds)
+        if valid.sum() < 2:
+            continue
+        fit_x = np.linspace(x[valid].min(), x[valid].max(), 100)
+        band_lower, band_upper = line_band(boot_slopes[:, j], boot_intercepts[:, j], fit_x)
+        smooth = binned_trend(x, eds, smooth_edges(x[valid]), groups, weights)
+        smooth['x'] = 10 ** smooth['x'] if log else smooth['x']
+
+        data = take_sample(phevs, [column, 'EDSen_mech'], indices).dropna()
+        panels[column] = dict(x=data[column].to_numpy(dtype=np.float64),
+                              y=data['EDSen_mech'].to_numpy(dtype=np.float64),
+                              line_x=10 ** fit_x if log else fit_x,
+                              line_y=slopes[j] * fit_x + intercepts[j],
+                              band_lower=band_lower, band_upper=band_upper,
+                              smooth=smooth, slope=slopes[j], n=int(valid.sum()))
+    return {'panels': [panels.get(column) for column, _, _, _ in FIGURE4_PANELS]}
+
+
+@figure('figure04', "figure04_eds_correlates.png", 'EDS vs Key Variables',
+        columns=['EDSen_mech', 'Electric_range', 'Mileage_Tot', 'Mass', 'AER_to_Mass'],
+        compute=compute_figure04, save={'scatter': 'density'})
+def figure04(s):
+    fig, axes = plt.subplots(2, 2, figsize=(14, 10))
+
+    for ax, panel, (column, xlabel, title, log) in zip(axes.flat, s['panels'], FIGURE4_PANELS):
+        if panel is None:
+            ax.text(0.5, 0.5, 'AER/Mass not available', ha='center', va='center')
+            ax.set_title('AER/Mass Ratio', fontsize=11)
+            ax.grid(alpha=0.3)
+            continue
+        ax.scatter(panel['x'], panel['y'],
+                  alpha=0.3, s=0.5, color=palette_eds[50], gid=POINT_LAYER)
+        if log:
+            ax.set_xscale('log')
+        # Streamed summaries carry the linear fit only
+        if 'band_lower' in panel:
+            ax.fill_between(panel['line_x'], panel['band_lower'], panel['band_upper'],
+                            color=palette_eds[80], alpha=0.3, linewidth=0)
+        ax.plot(panel['line_x'], panel['line_y'], color=palette_eds[80], linewidth=1.5,
+                label='Linear fit')
+        smooth = panel.get('smooth')
+        if smooth is not None and len(smooth['x']):
+            ax.fill_between(smooth['x'], smooth['mean_lower'], smooth['mean_upper'],
+                            color=palette_eds[20], alpha=0.3, linewidth=0)
+            ax.plot(smooth['x'], smooth['mean'], color=palette_eds[20], linewidth=1.2,
+                    marker='o', markersize=2.5, label='Binned mean')
+            ax.plot(smooth['x'], smooth['median'], color=palette_eds[20], linewidth=1,
+                    linestyle='--', label='Binned median')
+            ax.legend(fontsize=8, loc='best')
+        ax.set_xlabel(xlabel, fontsize=10)
+        ax.set_ylabel('EDS (%)', fontsize=10)
+        ax.set_title(title, fontsize=11)
+        ax.grid(alpha=0.3)
+
+    fig.suptitle('EDS Relationships with Key Variables\n'
+                 'All vehicles | Shaded: 95% bootstrap bands', 
+                 fontsize=14, fontweight='bold')
+    fig.tight_layout()
+    return fig
 
-fig.suptitle('EDS Relationships with Key Variables', 
-             fontsize=14, fontweight='bold')
-plt.tight_layout()
-save_figure(fig, "figure04_eds_correlates.png")
 
 #==============================================================================
 # FIGURE 5: Energy Split vs EDS (After EDS figures, as Markos requested)
 #==============================================================================
-print("\nCreating Figure 5: Energy Split vs EDS...")
-
-sample_data = phevs[['EDSen_mech', 'EnTot_final100km', 'EnICE_final100km', 
-                     'EnEl_final100km']].dropna().sample(min(100000, len(phevs)))
-
-# Create bins for EDS
-sample_data['eds_bin'] = pd.cut(sample_data['EDSen_mech'], 
-                                bins=20, 
-                                labels=range(20))
-
-energy_by_eds = sample_data.groupby('eds_bin', observed=True).agg({
-    'EnTot_final100km': 'median',
-    'EnICE_final100km': 'median',
-    'EnEl_final100km': 'median'
-}).reset_index()
-
-# Convert bin labels to numeric centers
-energy_by_eds['eds_center'] = pd.cut(sample_data['EDSen_mech'], bins=20).apply(
-    lambda x: x.mid if pd.notna(x) else np.nan
-).drop_duplicates().values[:len(energy_by_eds)]
-
-fig, ax = plt.subplots(figsize=(12, 8))
-
-# Stacked area
-ax.fill_between(energy_by_eds['eds_center'], 
-                energy_by_eds['EnICE_final100km'],
-                energy_by_eds['EnTot_final100km'],
-                alpha=0.6, color=palette_energy[30], label='ICE Energy')
-ax.fill_between(energy_by_eds['eds_center'], 
-                0,
-                energy_by_eds['EnICE_final100km'],
-                alpha=0.6, color=palette_energy[70], label='Electric Energy')
-
-# Lines
-ax.plot(energy_by_eds['eds_center'], energy_by_eds['EnTot_final100km'],
-        color='black', linewidth=1.5, label='Total Energy')
-ax.plot(energy_by_eds['eds_center'], energy_by_eds['EnICE_final100km'],
-        color=palette_energy[50], linewidth=1, linestyle='--')
-ax.plot(energy_by_eds['eds_center'], energy_by_eds['EnEl_final100km'],
-        color=palette_energy[90], linewidth=1, linestyle='--')
-
-ax.set_xlabel('Electric Driving Share (%)', fontsize=12, fontweight='bold')
-ax.set_ylabel('Energy Consumption (kWh/100 km)', fontsize=12, fontweight='bold')
-ax.set_title('Energy Split vs Electric Driving Share\n'
-             'Stacked area showing ICE (red) and Electric (purple) energy contributions',
-             fontsize=13, fontweight='bold')
-ax.legend()
-ax.grid(alpha=0.3)
-
-save_figure(fig, "figure05_energy_split_vs_eds.png")
+def compute_figure05(phevs):
+    data = phevs[['EDSen_mech', 'EnTot_final100km', 'EnICE_final100km',
+                  'EnEl_final100km']].dropna()
+    eds = data['EDSen_mech'].to_numpy(dtype=np.float64)
+
+    # 20 equal-width EDS bins over the full data
+    edges = equal_width_edges(eds, 20)
+    codes = bin_codes(eds, edges)
+    energy_by_eds = pd.DataFrame({'eds_bin': np.arange(20), 'eds_center': bin_centres(edges)})
+    for column in ['EnTot_final100km', 'EnICE_final100km', 'EnEl_final100km']:
+        stats = binned_stats(codes, 20, data[column], ('n', 'median'))
+        energy_by_eds[column] = stats['median']
+    energy_by_eds = energy_by_eds[stats['n'] > 0].reset_index(drop=True)
+    return {'energy_by_eds': energy_by_eds}
+
+
+@figure('figure05', "figure05_energy_split_vs_eds.png", 'Energy Split vs EDS',
+        columns=['EDSen_mech', 'EnTot_final100km', 'EnICE_final100km', 'EnEl_final100km'],
+        compute=compute_figure05)
+def figure05(s):
+    energy_by_eds = s['energy_by_eds']
+
+    fig, ax = plt.subplots(figsize=(12, 8))
+
+    # Stacked area
+    ax.fill_between(energy_by_eds['eds_center'], 
+                    energy_by_eds['EnICE_final100km'],
+                    energy_by_eds['EnTot_final100km'],
+                    alpha=0.6, color=palette_energy[30], label='ICE Energy')
+    ax.fill_between(energy_by_eds['eds_center'], 
+                    0,
+                    energy_by_eds['EnICE_final100km'],
+                    alpha=0.6, color=palette_energy[70], label='Electric Energy')
+
+    # Lines
+    ax.plot(energy_by_eds['eds_center'], energy_by_eds['EnTot_final100km'],
+            color='black', linewidth=1.5, label='Total Energy')
+    ax.plot(energy_by_eds['eds_center'], energy_by_eds['EnICE_final100km'],
+            color=palette_energy[50], linewidth=1, linestyle='--')
+    ax.plot(energy_by_eds['eds_center'], energy_by_eds['EnEl_final100km'],
+            color=palette_energy[90], linewidth=1, linestyle='--')
+
+    ax.set_xlabel('Electric Driving Share (%)', fontsize=12, fontweight='bold')
+    ax.set_ylabel('Energy Consumption (kWh/100 km)', fontsize=12, fontweight='bold')
+    ax.set_title('Energy Split vs Electric Driving Share\n'
+                 'Stacked area showing ICE (red) and Electric (purple) energy contributions',
+                 fontsize=13, fontweight='bold')
+    ax.legend()
+    ax.grid(alpha=0.3)
+
+    return fig
+
 
 #==============================================================================
 # FIGURE 6: Total Energy Distribution
 #==============================================================================
-print("\nCreating Figure 6: Total Energy Distribution...")
+def compute_figure06(phevs):
+    return compute_distribution(phevs['EnTot_final100km'], len(phevs))
 
-fig, ax = plt.subplots(figsize=(10, 6))
 
-energy_data = phevs['EnTot_final100km'].dropna()
+@figure('figure06', "figure06_total_energy_distribution.png", 'Total Energy Distribution',
+        columns=['EnTot_final100km'], compute=compute_figure06)
+def figure06(s):
+    fig, ax = plt.subplots(figsize=(10, 6))
 
-ax.hist(energy_data, bins=100, density=True, alpha=0.7,
-        color=palette_energy[50], edgecolor='white', linewidth=0.1)
+    ax.hist(s['edges'][:-1], bins=s['edges'], weights=s['density'], alpha=0.7,
+            color=palette_energy[50], edgecolor='white', linewidth=0.1)
 
-# Density curve
-kde = stats.gaussian_kde(energy_data)
-x_range = np.linspace(energy_data.min(), energy_data.max(), 200)
-ax.plot(x_range, kde(x_range), color=palette_energy[80], linewidth=1.5)
+    # Density curve
+    ax.plot(s['kde_x'], s['kde_y'], color=palette_energy[80], linewidth=1.5)
 
-# Median and quartiles
-median_val = energy_data.median()
-q25 = energy_data.quantile(0.25)
-q75 = energy_data.quantile(0.75)
+    # Median and quartiles
+    median_val, q25, q75 = s['median'], s['q25'], s['q75']
 
-ax.axvline(median_val, color='red', linestyle='--', linewidth=1,
-           label=f'Median: {median_val:.1f} kWh/100km')
-ax.axvline(q25, color='orange', linestyle='--', linewidth=0.8)
-ax.axvline(q75, color='orange', linestyle='--', linewidth=0.8)
+    ax.axvline(median_val, color='red', linestyle='--', linewidth=1,
+               label=f'Median: {median_val:.1f} kWh/100km')
+    ax.axvline(q25, color='orange', linestyle='--', linewidth=0.8)
+    ax.axvline(q75, color='orange', linestyle='--', linewidth=0.8)
 
-ax.set_xlabel('Total Energy (kWh/100 km)', fontsize=11, fontweight='bold')
-ax.set_ylabel('Density', fontsize=11, fontweight='bold')
-ax.set_title(f'Total Energy Consumption Distribution\n'
-             f'n = {len(phevs):,} | Median: {median_val:.1f} kWh/100km | '
-             f'IQR: {q25:.1f}-{q75:.1f}',
-             fontsize=13, fontweight='bold')
-ax.legend()
-ax.grid(alpha=0.3)
+    ax.set_xlabel('Total Energy (kWh/100 km)', fontsize=11, fontweight='bold')
+    ax.set_ylabel('Density', fontsize=11, fontweight='bold')
+    ax.set_title(f'Total Energy Consumption Distribution\n'
+                 f'n = {s["n_records"]:,} | Median: {median_val:.1f} kWh/100km | '
+                 f'IQR: {q25:.1f}-{q75:.1f}',
+                 fontsize=13, fontweight='bold')
+    ax.legend()
+    ax.grid(alpha=0.3)
+
+    return fig
 
-save_figure(fig, "figure06_total_energy_distribution.png")
 
 #==============================================================================
 # FIGURE 7: Energy vs Mass by EDS (Information-dense heatmap style)
 #==============================================================================
-print("\nCreating Figure 7: Energy Heatmap (Mass vs EDS)...")
+def compute_figure07(phevs):
+    data = phevs[['Mass', 'EDSen_mech', 'EnTot_final100km']].dropna()
+    mass = data['Mass'].to_numpy(dtype=np.float64)
+    eds = data['EDSen_mech'].to_numpy(dtype=np.float64)
 
-sample_data = phevs[['Mass', 'EDSen_mech', 'EnTot_final100km']].dropna().sample(
-    min(100000, len(phevs)))
+    # Median energy on a 20 x 20 mass-by-EDS grid over the full data
+    mass_edges = equal_width_edges(mass, 20)
+    eds_edges = equal_width_edges(eds, 20)
+    grid = binned_grid(mass, eds, data['EnTot_final100km'], mass_edges, eds_edges,
+                       ('median',))
 
-# Create bins
-sample_data['mass_bin'] = pd.cut(sample_data['Mass'], bins=20)
-sample_data['eds_bin'] = pd.cut(sample_data['EDSen_mech'], bins=20)
+    heatmap = pd.DataFrame(grid['median'],
+                           index=pd.Index(bin_centres(mass_edges).round(), name='mass_center'),
+                           columns=pd.Index(bin_centres(eds_edges).round(1), name='eds_center'))
+    return {'heatmap': heatmap}
 
-energy_heatmap = sample_data.groupby(['mass_bin', 'eds_bin'], observed=True).agg({
-    'EnTot_final100km': 'median'
-}).reset_index()
 
-# Extract bin centers
-energy_heatmap['mass_center'] = energy_heatmap['mass_bin'].apply(
-    lambda x: x.mid if pd.notna(x) else np.nan
-)
-energy_heatmap['eds_center'] = energy_heatmap['eds_bin'].apply(
-    lambda x: x.mid if pd.notna(x) else np.nan
-)
+@figure('figure07', "figure07_energy_heatmap_mass_eds.png", 'Energy Heatmap (Mass vs EDS)',
+        columns=['Mass', 'EDSen_mech', 'EnTot_final100km'], compute=compute_figure07)
+def figure07(s):
+    import seaborn as sns  # only this figure needs seaborn, and it is slow to import
 
-# Pivot for heatmap
-heatmap_pivot = energy_heatmap.pivot(index='mass_center', 
-                                     columns='eds_center',
-                                     values='EnTot_final100km')
+    fig, ax = plt.subplots(figsize=(12, 8))
 
-fig, ax = plt.subplots(figsize=(12, 8))
+    sns.heatmap(s['heatmap'], cmap='magma', cbar_kws={'label': 'Energy (kWh/100km)'},
+                ax=ax, linewidths=0, rasterized=True)
 
-sns.heatmap(heatmap_pivot, cmap='magma', cbar_kws={'label': 'Energy (kWh/100km)'},
-            ax=ax, linewidths=0, rasterized=True)
+    ax.set_xlabel('Electric Driving Share (%)', fontsize=12, fontweight='bold')
+    ax.set_ylabel('Vehicle Mass (kg)', fontsize=12, fontweight='bold')
+    ax.set_title('Energy Consumption Heatmap: Mass vs EDS\n'
+                 'Darker colors = higher energy consumption',
+                 fontsize=13, fontweight='bold')
 
-ax.set_xlabel('Electric Driving Share (%)', fontsize=12, fontweight='bold')
-ax.set_ylabel('Vehicle Mass (kg)', fontsize=12, fontweight='bold')
-ax.set_title('Energy Consumption Heatmap: Mass vs EDS\n'
-             'Darker colors = higher energy consumption',
-             fontsize=13, fontweight='bold')
+    return fig
 
-save_figure(fig, "figure07_energy_heatmap_mass_eds.png")
 
 #==============================================================================
 # FIGURE 8: Regional Energy Comparison (Recreating Markos's Screenshot 2)
 #==============================================================================
-print("\nCreating Figure 8: Regional Comparison...")
+def compute_figure08(phevs):
+    if 'Region' not in phevs.columns:
+        print("Region variable not found, skipping Figure 8")
+        return None
 
-if 'Region' in phevs.columns:
     regional_data = phevs[['Region', 'EnTot_final100km', 'EDSen_mech']].dropna()
-    
-    regional_summary = regional_data.groupby('Region').agg({
-        'EnTot_final100km': ['median', lambda x: x.quantile(0.25), lambda x: x.quantile(0.75)],
-        'EDSen_mech': 'median',
-        'EnTot_final100km': 'count'
-    }).reset_index()
-    
-    regional_summary.columns = ['Region', 'median_energy', 'q25_energy', 'q75_energy', 
-                                'median_eds', 'n']
-    
+
+    regional_summary = grouped_stats(regional_data, 'Region',
+                                     ['EnTot_final100km', 'EDSen_mech'],
+                                     ('n', 'median', 'q25', 'q75'))
+    return {'regional_summary': regional_summary}
+
+
+@figure('figure08', "figure08_regional_comparison.png", 'Regional Comparison',
+        columns=['Region', 'EnTot_final100km', 'EDSen_mech'], compute=compute_figure08)
+def figure08(s):
+    regional_summary = s['regional_summary'].rename(columns={
+        'EnTot_final100km_median': 'median_energy',
+        'EnTot_final100km_q25': 'q25_energy',
+        'EnTot_final100km_q75': 'q75_energy',
+        'EDSen_mech_median': 'median_eds',
+        'EnTot_final100km_n': 'n',
+    })
+
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 7))
-    
+
     # Energy by region
-    regions = regional_summary['Region'].values
+    regions = regional_summary['Region'].astype(str).values
     x_pos = np.arange(len(regions))
-    
+
     bars1 = ax1.bar(x_pos, regional_summary['median_energy'],
                    color=palette_regional[:len(regions)], alpha=0.8)
     ax1.errorbar(x_pos, regional_summary['median_energy'],
@@ -452,7 +587,7 @@ if 'Region' in phevs.columns:
     ax1.set_ylabel('Median Energy (kWh/100 km)', fontsize=11, fontweight='bold')
     ax1.set_title('Total Energy Consumption by Region', fontsize=12, fontweight='bold')
     ax1.grid(axis='y', alpha=0.3)
-    
+
     # EDS by region
     bars2 = ax2.bar(x_pos, regional_summary['median_eds'],
                    color=palette_regional[:len(regions)], alpha=0.8)
@@ -461,96 +596,359 @@ if 'Region' in phevs.columns:
     ax2.set_ylabel('Median EDS (%)', fontsize=11, fontweight='bold')
     ax2.set_title('Median EDS by Region', fontsize=12, fontweight='bold')
     ax2.grid(axis='y', alpha=0.3)
-    
+
     fig.suptitle('Regional Patterns: Energy and EDS', 
                  fontsize=14, fontweight='bold')
-    plt.tight_layout()
-    save_figure(fig, "figure08_regional_comparison.png")
-else:
-    print("Region variable not found, skipping Figure 8")
+    fig.tight_layout()
+    return fig
+
 
 #==============================================================================
 # FIGURE 9: EDS Density Plot with Material Space Below (Markos's Screenshot 3)
 #==============================================================================
-print("\nCreating Figure 9: EDS Density with Mass Category...")
-
-# Create mass categories
-phevs['mass_cat'] = pd.cut(phevs['Mass'],
-                          bins=[0, 1600, 2000, np.inf],
-                          labels=['Light (<1600 kg)', 'Medium (1600-2000 kg)', 'Heavy (≥2000 kg)'])
-
-mass_eds_data = phevs[['mass_cat', 'EDSen_mech', 'EnTot_final100km', 'Mass']].dropna()
-
-fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 10),
-                                gridspec_kw={'height_ratios': [2, 1]})
-
-# Top panel: EDS density by mass category
-for cat in mass_eds_data['mass_cat'].cat.categories:
-    cat_data = mass_eds_data[mass_eds_data['mass_cat'] == cat]['EDSen_mech']
-    if len(cat_data) > 0:
-        ax1.hist(cat_data, bins=50, density=True, alpha=0.6,
-                label=str(cat), histtype='step', linewidth=1.5)
-
-ax1.set_xlabel('Electric Driving Share (%)', fontsize=11, fontweight='bold')
-ax1.set_ylabel('Density', fontsize=11, fontweight='bold')
-ax1.set_title('EDS Distribution by Vehicle Mass Category', 
-             fontsize=12, fontweight='bold')
-ax1.legend()
-ax1.grid(alpha=0.3)
-
-# Bottom panel: Summary statistics
-mass_summary = mass_eds_data.groupby('mass_cat').agg({
-    'EDSen_mech': 'median',
-    'EnTot_final100km': 'median',
-    'Mass': 'median'
-}).reset_index()
-
-x_pos = np.arange(len(mass_summary))
-width = 0.35
-
-bars1 = ax2.bar(x_pos - width/2, mass_summary['EDSen_eds'],
-               width, label='Median EDS (%)', color=palette_eds[60], alpha=0.8)
-bars2 = ax2.bar(x_pos + width/2, mass_summary['EnTot_final100km']/10,
-               width, label='Median Energy/10', color=palette_energy[50], alpha=0.6)
-
-ax2.set_xlabel('Mass Category', fontsize=11, fontweight='bold')
-ax2.set_ylabel('Median EDS (%)', fontsize=11, fontweight='bold')
-ax2.set_title('Summary Statistics by Mass Category', fontsize=12, fontweight='bold')
-ax2.set_xticks(x_pos)
-ax2.set_xticklabels([str(cat) for cat in mass_summary['mass_cat']], rotation=45, ha='right')
-ax2.legend()
-ax2.grid(axis='y', alpha=0.3)
-
-# Add value labels
-for i, row in mass_summary.iterrows():
-    ax2.text(i - width/2, row['EDSen_mech'] + 1,
-            f"{row['EDSen_mech']:.1f}%", ha='center', va='bottom',
-            fontsize=9, color='gray30')
-
-fig.suptitle('EDS Patterns by Vehicle Mass Category',
-             fontsize=14, fontweight='bold')
-plt.tight_layout()
-save_figure(fig, "figure09_eds_density_mass_category.png")
+def compute_figure09(phevs):
+    # Create mass categories
+    mass_eds_data = phevs[['EDSen_mech', 'EnTot_final100km', 'Mass']].assign(
+        mass_cat=mass_category(phevs['Mass'])).dropna()
+
+    # EDS density by mass category, on a shared grid
+    x_range = np.linspace(mass_eds_data['EDSen_mech'].min(),
+                          mass_eds_data['EDSen_mech'].max(), 200)
+    curves = []
+    for cat in mass_eds_data['mass_cat'].cat.categories:
+        cat_data = mass_eds_data[mass_eds_data['mass_cat'] == cat]['EDSen_mech']
+        if len(cat_data) > 1:
+            curves.append((str(cat), *binned_kde(cat_data, grid=x_range)))
+
+    mass_summary = grouped_stats(mass_eds_data, 'mass_cat',
+                                ['EDSen_mech', 'EnTot_final100km', 'Mass'], ('n', 'median'))
+    return {'curves': curves, 'mass_summary': mass_summary}
+
+
+@figure('figure09', "figure09_eds_density_mass_category.png", 'EDS Density with Mass Category',
+        columns=['Mass', 'EDSen_mech', 'EnTot_final100km'], compute=compute_figure09)
+def figure09(s):
+    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 10),
+                                    gridspec_kw={'height_ratios': [2, 1]})
+
+    # Top panel: EDS density by mass category
+    for label, x_range, density in s['curves']:
+        ax1.plot(x_range, density, alpha=0.8, label=label, linewidth=1.5)
+
+    ax1.set_xlabel('Electric Driving Share (%)', fontsize=11, fontweight='bold')
+    ax1.set_ylabel('Density', fontsize=11, fontweight='bold')
+    ax1.set_title('EDS Distribution by Vehicle Mass Category', 
+                 fontsize=12, fontweight='bold')
+    ax1.legend()
+    ax1.grid(alpha=0.3)
+
+    # Bottom panel: Summary statistics
+    mass_summary = s['mass_summary']
+
+    x_pos = np.arange(len(mass_summary))
+    width = 0.35
+
+    bars1 = ax2.bar(x_pos - width/2, mass_summary['EDSen_mech_median'],
+                   width, label='Median EDS (%)', color=palette_eds[60], alpha=0.8)
+    bars2 = ax2.bar(x_pos + width/2, mass_summary['EnTot_final100km_median']/10,
+                   width, label='Median Energy/10', color=palette_energy[50], alpha=0.6)
+
+    ax2.set_xlabel('Mass Category', fontsize=11, fontweight='bold')
+    ax2.set_ylabel('Median EDS (%)', fontsize=11, fontweight='bold')
+    ax2.set_title('Summary Statistics by Mass Category', fontsize=12, fontweight='bold')
+    ax2.set_xticks(x_pos)
+    ax2.set_xticklabels([str(cat) for cat in mass_summary['mass_cat']], rotation=45, ha='right')
+    ax2.legend()
+    ax2.grid(axis='y', alpha=0.3)
+
+    # Add value labels
+    for i, median in enumerate(mass_summary['EDSen_mech_median']):
+        ax2.text(i - width/2, median + 1,
+                f"{median:.1f}%", ha='center', va='bottom',
+                fontsize=9, color='0.3')
+
+    fig.suptitle('EDS Patterns by Vehicle Mass Category',
+                 fontsize=14, fontweight='bold')
+    fig.tight_layout()
+    return fig
+
 
 #==============================================================================
-# Summary
+# Task runner
 #==============================================================================
-print("\n" + "="*60)
-print("Figure Generation Complete!")
-print("="*60)
-print(f"Figures saved to: {fig_dir}")
-print("\nGenerated figures:")
-print("  1. EDS Distribution")
-print("  2. EDS by Country")
-print("  3. EDS Density with Timeline")
-print("  4. EDS vs Key Variables")
-print("  5. Energy Split vs EDS")
-print("  6. Total Energy Distribution")
-print("  7. Energy Heatmap (Mass vs EDS)")
-print("  8. Regional Comparison")
-print("  9. EDS Density by Mass Category")
-print("\nFigures follow Markos's instructions:")
-print("  - EDS figures come before energy figures")
-print("  - Information-dense with good color palettes")
-print("  - Recreated Markos's 3 screenshot concepts")
-print("\n")
+
+# Data shared with worker processes. Forked workers inherit the parent's frame
+# copy-on-write; spawned workers (Windows) read it from the Parquet cache.
+_phevs = None
+# Stage records of this run (--report, --trace-memory, --profile), or None
+_run_report = None
+
+
+def _stage(name):
+    return _run_report.stage(name) if _run_report else contextlib.nullcontext()
+
+
+def required_columns(fig_ids):
+    """Union of the columns read by the given figures, in first-use order."""
+    columns = []
+    for fig_id in fig_ids:
+        columns.extend(c for c in FIGURES[fig_id].columns if c not in columns)
+    return columns
+
+
+def _init_worker(columns, report_options=None):
+    global _phevs, _run_report
+    if _phevs is None and columns:
+        _phevs = load_phevs(columns, data_dir)
+    # A fresh report: a forked worker would otherwise repeat the parent's stages
+    _run_report = RunReport(**report_options) if report_options is not None else None
+
+
+def save_options(task, formats=()):
+    """save_figure() options for a task, with `formats` added to its own."""
+    options = dict(task.save)
+    options['formats'] = tuple(dict.fromkeys(tuple(options.get('formats', ())) + tuple(formats)))
+    return options
+
+
+def render_figure(fig_id, summary=None, formats=()):
+    """Build, save and close one figure; return (id, filename or None, seconds).
+
+    The summary is computed from the shared frame unless one is passed in.
+    """
+    task = FIGURES[fig_id]
+    start = time.perf_counter()
+    print(f"\nCreating Figure {int(fig_id[-2:])}: {task.title}...")
+    with _run_report.profile(fig_id) if _run_report else contextlib.nullcontext():
+        if summary is None:
+            with _stage(f'{fig_id}/compute'):
+                summary = task.compute(_phevs)
+        if summary is None:
+            return fig_id, None, time.perf_counter() - start
+        with _stage(f'{fig_id}/draw'):
+            fig = task.draw(summary)
+        with _stage(f'{fig_id}/save'):
+            save_figure(fig, task.filename, **save_options(task, formats))
+    return fig_id, task.filename, time.perf_counter() - start
+
+
+def _render_in_worker(fig_id, summary=None, formats=()):
+    """render_figure() in a pool worker, with the stage records it made."""
+    result = render_figure(fig_id, summary, formats)
+    if _run_report is None:
+        return result, [], []
+    stages, profiles = _run_report.stages, _run_report.profiles
+    _run_report.stages, _run_report.profiles = [], []
+    return result, stages, profiles
+
+
+def run_figures(fig_ids, jobs=1, summaries=None, formats=()):
+    """Render the figures serially or on a pool of `jobs` processes.
+
+    With `summaries` (figure id -> summary) nothing is computed from _phevs.
+    """
+    summaries = summaries or {}
+    if jobs <= 1 or len(fig_ids) <= 1:
+        return [render_figure(fig_id, summaries.get(fig_id), formats) for fig_id in fig_ids]
+
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+    results = []
+    columns = [] if summaries else required_columns(fig_ids)
+    report_options = None
+    if _run_report is not None:
+        report_options = {'trace_memory': _run_report.trace_memory,
+                          'profile_dir': _run_report.profile_dir, 'top': _run_report.top}
+    with ProcessPoolExecutor(max_workers=min(jobs, len(fig_ids)), mp_context=context,
+                             initializer=_init_worker, initargs=(columns, report_options)) as pool:
+        futures = [pool.submit(_render_in_worker, fig_id, summaries.get(fig_id), formats)
+                   for fig_id in fig_ids]
+        for future in as_completed(futures):
+            result, stages, profiles = future.result()
+            results.append(result)
+            if _run_report is not None:
+                _run_report.extend(stages, profiles)
+    order = {fig_id: i for i, fig_id in enumerate(fig_ids)}
+    return sorted(results, key=lambda result: order[result[0]])
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Create the Paper A figures.")
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help="number of figures to render in parallel (default: 1)")
+    parser.add_argument('--only', default='',
+                        help="comma-separated figure ids, e.g. figure03,figure07")
+    parser.add_argument('--force', action='store_true',
+                        help="re-render figures even if their fingerprint is unchanged")
+    parser.add_argument('--stream', metavar='CSV', type=Path,
+                        help="aggregate this CSV chunk by chunk instead of loading the dataset")
+    parser.add_argument('--chunksize', type=int, default=250_000,
+                        help="rows per chunk in --stream mode (default: 250000)")
+    parser.add_argument('--formats', default='',
+                        help="extra output formats besides PNG, e.g. pdf,svg")
+    parser.add_argument('--profile-imports', action='store_true',
+                        help="time every module import and summarise the costs at the end")
+    parser.add_argument('--report', metavar='PATH',
+                        help="write a per-stage timing/memory report (.md for Markdown, "
+                             "otherwise JSON; '-' prints it)")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="trace allocations with tracemalloc for the report (slow)")
+    parser.add_argument('--profile', action='store_true',
+                        help=f"dump a cProfile of each figure to {profile_dir.name}/<figure>.pstats")
+    args = parser.parse_args(argv)
+    args.formats = tuple(f.strip().lstrip('.') for f in args.formats.split(',') if f.strip())
+    args.only = [fig_id.strip() for fig_id in args.only.split(',') if fig_id.strip()]
+    unknown = [fig_id for fig_id in args.only if fig_id not in FIGURES]
+    if unknown:
+        parser.error(f"unknown figure id(s): {', '.join(unknown)} "
+                     f"(choose from {', '.join(FIGURES)})")
+    return args
+
+
+def figure_fingerprints(fig_ids, column_hashes, formats=()):
+    """Build-manifest fingerprint of each figure, from its data columns' hashes.
+
+    The code part covers the compute and draw functions, what they use from
+    this script and the helper modules, and save_figure().
+    """
+    style_hash = style_fingerprint(plt.rcParams, {'eds': palette_eds,
+                                                  'energy': palette_energy,
+                                                  'regional': palette_regional})
+    return {fig_id: figure_fingerprint(FIGURES[fig_id], column_hashes, style_hash,
+                                       save_options(FIGURES[fig_id], formats),
+                                       shared=(save_figure,))
+            for fig_id in fig_ids}
+
+
+def report_imports():
+    """--profile-imports: print the import costs recorded so far."""
+    if _import_timer is not None:
+        print("\n" + "\n".join(_import_timer.report()))
+
+
+def finish_report(args):
+    """Print or save the run report, if one was recorded."""
+    if _run_report is None:
+        return
+    if _import_timer is not None:
+        _run_report.imports = {'total': _import_timer.total(),
+                               'modules': len(_import_timer.modules),
+                               'packages': _import_timer.by_package()[:10]}
+    if args.report and args.report != '-':
+        _run_report.save(args.report)
+        print(f"\nRun report: {args.report}")
+    else:
+        print("\n" + _run_report.to_markdown())
+
+
+def stream_figures(args, fig_ids):
+    """--stream mode: render from chunked aggregates, bypassing the manifest."""
+    from phev_streaming import aggregate_csv, figure_summaries
+
+    print(f"Streaming {args.stream} in chunks of {args.chunksize:,} rows...")
+    try:
+        with _stage('aggregate'):
+            aggregates = aggregate_csv(args.stream, chunksize=args.chunksize)
+    except (FileNotFoundError, KeyError) as e:
+        print(f"Error: {e}")
+        return 1
+    print(f"Aggregated {aggregates.n_records:,} records")
+
+    summaries = figure_summaries(aggregates, fig_ids)
+    fig_ids = [fig_id for fig_id in fig_ids if summaries.get(fig_id) is not None]
+    results = run_figures(fig_ids, args.jobs, summaries, args.formats)
+    print("\nStreamed figures:")
+    for fig_id, filename, seconds in results:
+        print(f"  {int(fig_id[-2:])}. {FIGURES[fig_id].title} ({seconds:.1f}s)")
+    report_imports()
+    finish_report(args)
+    return 0
+
+
+def main(argv=None):
+    global _phevs, _import_timer, _run_report
+    args = parse_args(argv)
+    if args.profile_imports and _import_timer is None:
+        # Called with argv rather than from the command line: only the
+        # imports from here on are seen
+        from import_timer import ImportTimer
+        _import_timer = ImportTimer().install()
+    fig_ids = args.only or list(FIGURES)
+    if args.report and args.report != '-':
+        args.report = Path(args.report).absolute()  # before the chdir below
+    if args.report or args.trace_memory or args.profile:
+        _run_report = RunReport(trace_memory=args.trace_memory,
+                                profile_dir=profile_dir if args.profile else None)
+
+    os.chdir(script_dir)
+    fig_dir.mkdir(exist_ok=True, parents=True)
+
+    if args.stream:
+        return stream_figures(args, fig_ids)
+
+    # Fingerprint each figure from the cache metadata, without reading data
+    try:
+        column_hashes = column_fingerprints(required_columns(fig_ids), data_dir)
+    except (FileNotFoundError, ImportError) as e:
+        print(f"Error: {e}")
+        return 1
+
+    manifest = load_manifest(manifest_path)
+    fingerprints = {}
+    if column_hashes is not None:
+        fingerprints = figure_fingerprints(fig_ids, column_hashes, args.formats)
+    reused = [fig_id for fig_id in fig_ids
+              if not args.force and fig_id in fingerprints
+              and is_fresh(manifest, FIGURES[fig_id], fingerprints[fig_id],
+                           fig_dir / FIGURES[fig_id].filename,
+                           save_options(FIGURES[fig_id], args.formats)['formats'])]
+    stale = [fig_id for fig_id in fig_ids if fig_id not in reused]
+
+    results = []
+    if stale:
+        # Load data (column-pruned Parquet cache, rebuilt when the RDS/PKL changes)
+        print("Loading data...")
+        try:
+            with _stage('load'):
+                _phevs = load_phevs(required_columns(stale), data_dir)
+        except (FileNotFoundError, ImportError) as e:
+            print(f"Error: {e}")
+            return 1
+
+        print(f"Loaded {len(_phevs)} records")
+        print(memory_report(_phevs))
+
+        results = run_figures(stale, args.jobs, formats=args.formats)
+        for fig_id, filename, seconds in results:
+            if filename and fig_id in fingerprints:
+                record(manifest, FIGURES[fig_id], fingerprints[fig_id], fig_dir / filename,
+                       save_options(FIGURES[fig_id], args.formats)['formats'])
+        save_manifest(manifest_path, manifest)
+
+    #==========================================================================
+    # Summary
+    #==========================================================================
+    print("\n" + "="*60)
+    print("Figure Generation Complete!")
+    print("="*60)
+    print(f"Figures saved to: {fig_dir}")
+    print("\nRegenerated figures:" if results else "\nNo figures needed regenerating.")
+    for fig_id, filename, seconds in results:
+        if filename:
+            print(f"  {int(fig_id[-2:])}. {FIGURES[fig_id].title} ({seconds:.1f}s)")
+    if reused:
+        print("\nReused (unchanged since last build):")
+        for fig_id in reused:
+            print(f"  {int(fig_id[-2:])}. {FIGURES[fig_id].title}")
+    report_imports()
+    finish_report(args)
+    print("\nFigures follow Markos's instructions:")
+    print("  - EDS figures come before energy figures")
+    print("  - Information-dense with good color palettes")
+    print("  - Recreated Markos's 3 screenshot concepts")
+    print("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
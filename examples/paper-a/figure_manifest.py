@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Build manifest for incremental figure rebuilds.
+
+figures_manifest.json (next to figures/) records, for every output PNG, the
+fingerprint it was rendered from: content hashes of the data columns the
+figure reads, a hash of the code it runs, a hash of the matplotlib style
+settings and the save options (scatter mode, extra formats). A figure whose
+fingerprint is unchanged and whose outputs (the PNG and any extra formats)
+are all still on disk is reused instead of re-rendered.
+
+The code hash starts from the figure's compute and draw functions and
+follows the global names they use: functions and plain-data constants of
+the figure script (FIGURE4_PANELS, compute_distribution, ...) are hashed
+by source or value, and any of the local helper modules next to the script
+(phev_stats, phev_data, ...) by their whole source, including the local
+modules they import in turn. Editing one figure's code or a constant only
+it uses therefore re-renders just that figure; editing a helper module
+re-renders the figures that call into it.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import sys
+import types
+from datetime import datetime
+from pathlib import Path
+
+MANIFEST_VERSION = 2
+# Global values hashed by value when a figure's code refers to them
+PLAIN_TYPES = (str, int, float, bool, type(None), tuple, list, dict, set, frozenset)
+
+
+def _hash(obj):
+    text = json.dumps(obj, sort_keys=True, default=repr)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def style_fingerprint(rc_params, palettes):
+    """Hash of the matplotlib rcParams and the named colour palettes.
+
+    The backend settings are left out: they do not change the saved files.
+    """
+    return _hash({'rc': {key: repr(value) for key, value in rc_params.items()
+                         if not key.startswith('backend')},
+                  'palettes': {name: [list(map(float, c)) for c in colors]
+                               for name, colors in palettes.items()}})
+
+
+def _is_plain(value):
+    if isinstance(value, dict):
+        return all(_is_plain(k) and _is_plain(v) for k, v in value.items())
+    if isinstance(value, (tuple, list, set, frozenset)):
+        return all(_is_plain(v) for v in value)
+    return isinstance(value, PLAIN_TYPES)
+
+
+def _code_names(code):
+    """Global names used by a code object and the functions nested in it."""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _code_names(const)
+    return names
+
+
+def _module_file(obj):
+    module = obj if isinstance(obj, types.ModuleType) else sys.modules.get(
+        getattr(obj, '__module__', None) or '')
+    path = getattr(module, '__file__', None)
+    return (module, Path(path).resolve()) if path else (None, None)
+
+
+def code_fingerprint(functions):
+    """Hash of `functions` and the local code and constants they depend on.
+
+    Local means defined in a module file in the same directory as the first
+    function's module; everything else (numpy, matplotlib, ...) is left out.
+    """
+    functions = list(functions)
+    root, root_file = _module_file(functions[0])
+    local_dir = root_file.parent
+    sources, constants, modules = {}, {}, {}
+
+    def add_module(module, path):
+        if path in modules:
+            return
+        modules[path] = inspect.getsource(module)
+        for value in vars(module).values():
+            other, other_path = _module_file(value)
+            if other_path is not None and other_path.parent == local_dir and other is not root:
+                add_module(other, other_path)
+
+    pending = list(functions)
+    while pending:
+        function = pending.pop()
+        # By name only: the script hashes the same as __main__ or imported
+        if function.__qualname__ in sources:
+            continue
+        sources[function.__qualname__] = inspect.getsource(function)
+        scope = function.__globals__
+        for name in _code_names(function.__code__):
+            if name not in scope:
+                continue
+            value = scope[name]
+            module, path = _module_file(value)
+            if module is root and isinstance(value, types.FunctionType):
+                pending.append(value)
+            elif path is not None and path.parent == local_dir and module is not root:
+                add_module(module, path)
+            elif module is None and _is_plain(value) and not name.startswith('_'):
+                constants[name] = value
+    return _hash({'functions': sources, 'constants': constants,
+                  'modules': {path.name: source for path, source in modules.items()}})
+
+
+def figure_fingerprint(task, column_hashes, style_hash, save_options=None, shared=()):
+    """Fingerprint parts for one registered figure task and its save options.
+
+    `shared` lists functions every figure runs through (e.g. save_figure).
+    """
+    return {
+        'data': _hash({c: column_hashes.get(c) for c in task.columns}),
+        'code': code_fingerprint([task.compute, task.draw, *shared]),
+        'style': style_hash,
+        'save': _hash(save_options or {}),
+    }
+
+
+def load_manifest(path):
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {'version': MANIFEST_VERSION, 'figures': {}}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {'version': MANIFEST_VERSION, 'figures': {}}
+    return manifest
+
+
+def save_manifest(path, manifest):
+    """Write the manifest atomically."""
+    manifest['updated'] = datetime.now().isoformat()
+    tmp_path = path.with_suffix('.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _outputs(output_path, formats=()):
+    """The PNG and its copies in the extra `formats`, as save_figure() writes them."""
+    output_path = Path(output_path)
+    return [output_path] + [output_path.with_suffix(f'.{suffix}') for suffix in formats]
+
+
+def is_fresh(manifest, task, fingerprint, output_path, formats=()):
+    """True if `output_path` and its `formats` copies exist and were rendered from `fingerprint`."""
+    entry = manifest['figures'].get(task.id)
+    if not entry or entry.get('fingerprint') != fingerprint:
+        return False
+    if entry.get('filename') != task.filename:
+        return False
+    recorded = entry.get('outputs', {})
+    for path in _outputs(output_path, formats):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        if recorded.get(path.name) != {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}:
+            return False
+    return True
+
+
+def record(manifest, task, fingerprint, output_path, formats=()):
+    """Store the fingerprint a freshly rendered figure was built from."""
+    outputs = {}
+    for path in _outputs(output_path, formats):
+        st = os.stat(path)
+        outputs[path.name] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+    manifest['figures'][task.id] = {
+        'filename': task.filename,
+        'fingerprint': fingerprint,
+        'outputs': outputs,
+    }
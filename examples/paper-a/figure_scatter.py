@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Scatter rendering modes for the large point panels.
+
+Draw code tags its point layers with `ax.scatter(..., gid=POINT_LAYER)` and
+save_figure() picks how they are written, per figure:
+
+- 'points':     as drawn (one vector marker per point in PDF/SVG)
+- 'rasterized': the point layers become one bitmap at the output dpi, while
+                axes, lines and text stay vector
+- 'density':    each point layer is replaced by a pixel-resolution image of
+                its point counts, composited as `count` overlapping markers
+                of the layer's colour and alpha, each point covering its
+                marker's footprint in pixels (one FFT convolution). The
+                image is made at draw time (DensityLayer), over the axes
+                limits and size being saved, in float32 buffers and handed
+                to the renderer as uint8 RGBA. Cost and file size no longer
+                depend on the number of points.
+"""
+
+import numpy as np
+from matplotlib.artist import Artist
+
+POINT_LAYER = 'points'
+SCATTER_MODES = ('points', 'rasterized', 'density')
+
+
+def point_layers(fig):
+    """The tagged scatter collections of `fig`, with their axes."""
+    return [(ax, collection) for ax in fig.axes for collection in ax.collections
+            if collection.get_gid() == POINT_LAYER]
+
+
+def marker_diameter(collection):
+    """Marker diameter in points, including its edge."""
+    sizes = collection.get_sizes()
+    size = float(np.sqrt(sizes[0])) if len(sizes) else 6.0
+    widths = collection.get_linewidths()
+    return size + (float(widths[0]) if len(widths) else 0.0)
+
+
+def disk_kernel(diameter):
+    """float32 mask of the pixels within a disk of `diameter` pixels."""
+    radius = int(diameter // 2)
+    offsets = np.arange(-radius, radius + 1)
+    return (offsets[:, None] ** 2 + offsets[None, :] ** 2
+            <= (diameter / 2) ** 2).astype(np.float32)
+
+
+def fft_length(n):
+    """Smallest 2^a 3^b 5^c >= n: sizes pocketfft transforms fastest."""
+    best = 2 * n
+    power5 = 1
+    while power5 < best:
+        power35 = power5
+        while power35 < best:
+            length = power35
+            while length < n:
+                length *= 2
+            best = min(best, length)
+            power35 *= 3
+        power5 *= 5
+    return best
+
+
+def spread(counts, diameter):
+    """Sum of `counts` under a disk of `diameter` pixels centred on each pixel.
+
+    One FFT convolution in float32, whatever the disk size.
+    """
+    radius = int(diameter // 2)
+    if radius < 1:
+        return counts
+    counts = np.asarray(counts, dtype=np.float32)
+    ny, nx = counts.shape
+    shape = (fft_length(ny + 2 * radius), fft_length(nx + 2 * radius))
+    product = (np.fft.rfft2(counts, shape)
+               * np.fft.rfft2(disk_kernel(diameter), shape))
+    out = np.fft.irfft2(product, shape)[radius:radius + ny, radius:radius + nx]
+    # Counts are integers; rounding clears the FFT round-off (and any -0)
+    np.rint(out, out=out)
+    return np.maximum(out, 0, out=out)
+
+
+def axes_fraction(ax, values, axis):
+    """Position of data `values` along `axis` ('x' or 'y') as a fraction of the axes.
+
+    Taken from the current limits and the axis scale, so log scales and
+    inverted axes come out right.
+    """
+    scale = (ax.xaxis if axis == 'x' else ax.yaxis).get_transform()
+    limits = ax.get_xlim() if axis == 'x' else ax.get_ylim()
+    lo, hi = scale.transform(np.asarray(limits, dtype=np.float64))
+    return (scale.transform(values) - lo) / (hi - lo)
+
+
+def density_image(ax, offsets, rgba, diameter, nx, ny):
+    """uint8 RGBA image (rows bottom-up, nx x ny pixels) of points over `ax`.
+
+    `offsets` are the points in data coordinates, binned over the current
+    axes limits; each covers a disk of `diameter` pixels in colour `rgba`.
+    """
+    # Pixel of each point, from its position as a fraction of the axes
+    fx = axes_fraction(ax, offsets[:, 0], 'x')
+    fy = axes_fraction(ax, offsets[:, 1], 'y')
+    inside = (fx >= 0) & (fx <= 1) & (fy >= 0) & (fy <= 1)
+    ix = np.minimum((fx[inside] * nx).astype(np.intp), nx - 1)
+    iy = np.minimum((fy[inside] * ny).astype(np.intp), ny - 1)
+    counts = np.zeros((ny, nx), dtype=np.float32)
+    np.add.at(counts, (iy, ix), 1)
+
+    coverage = spread(counts, diameter)
+    del counts
+
+    rgba = np.asarray(rgba, dtype=np.float32)
+    # alpha = 1 - (1 - a) ** coverage, in place in the coverage buffer
+    alpha = np.power(np.float32(1 - rgba[3]), coverage, out=coverage)
+    np.subtract(1, alpha, out=alpha)
+    alpha *= 255
+    image = np.empty((ny, nx, 4), dtype=np.uint8)
+    image[..., :3] = np.rint(rgba[:3] * 255).astype(np.uint8)
+    image[..., 3] = np.rint(alpha, out=alpha)
+    return image
+
+
+class DensityLayer(Artist):
+    """A point layer drawn as its density image, computed at draw time.
+
+    The image is binned for the renderer's pixel grid over the axes as they
+    are when drawn (after layout and autoscaling), and handed to the
+    renderer as uint8 RGBA: no resampling, and no float copies of it.
+    """
+
+    def __init__(self, collection):
+        super().__init__()
+        self.offsets = np.asarray(collection.get_offsets(), dtype=np.float64)
+        self.rgba = np.asarray(collection.get_facecolor(), dtype=np.float32)[0]
+        self.diameter = marker_diameter(collection)
+        self.set_zorder(collection.get_zorder())
+
+    def draw(self, renderer):
+        if not self.get_visible():
+            return
+        ax = self.axes
+        magnification = renderer.get_image_magnification()
+        bbox = ax.bbox
+        nx = max(1, int(round(bbox.width * magnification)))
+        ny = max(1, int(round(bbox.height * magnification)))
+        pixels_per_point = ax.figure.dpi * magnification / 72
+        image = density_image(ax, self.offsets, self.rgba,
+                              self.diameter * pixels_per_point, nx, ny)
+        gc = renderer.new_gc()
+        gc.set_clip_rectangle(bbox)
+        renderer.draw_image(gc, bbox.x0, bbox.y0, image)
+        gc.restore()
+        self.stale = False
+
+
+def densify(fig):
+    """Replace every tagged point layer of `fig` by a DensityLayer.
+
+    Not being collections, the layers are not scanned by loc='best' legends.
+    """
+    for ax, collection in point_layers(fig):
+        ax.add_artist(DensityLayer(collection))
+        collection.remove()
+
+
+def apply_scatter_mode(fig, mode, dpi):
+    """Prepare `fig`'s point layers for saving in the given mode."""
+    if mode not in SCATTER_MODES:
+        raise ValueError(f"Unknown scatter mode: {mode}")
+    if mode == 'rasterized':
+        for _, collection in point_layers(fig):
+            collection.set_rasterized(True)
+    elif mode == 'density':
+        # Rendered at the dpi the figure is saved at
+        densify(fig)
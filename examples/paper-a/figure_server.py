@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Long-lived figure server: load the PHEV data once, re-render figures as
+their code changes.
+
+The server loads the dataset a single time and copies its columns into
+shared memory (shared_frame.py). It then watches
+create_figures_markos_python.py and, at start and after every save, runs
+one round in a fresh worker process: the worker imports the figure script
+as it is on disk, attaches the shared columns as a zero-copy frame and
+renders only the figures whose build-manifest fingerprint (data, code,
+style, save options; see figure_manifest.py) changed. A figure tweak
+therefore costs one render, not a data load, the imports and every figure.
+
+A new process per round is what makes the reload reliable: nothing of the
+previous version of the module survives, and matplotlib, numpy and pandas
+are already imported in the server, so a forked worker starts in
+milliseconds. Errors in the edited code are printed and the server waits
+for the next save.
+
+The code part of a fingerprint follows what each figure uses: the script's
+shared functions and constants and the helper modules. Saves to the helper
+modules in HELPER_MODULES are watched too, and the worker re-imports them,
+so such an edit re-renders exactly the figures that depend on it.
+
+Usage:
+    python3 figure_server.py
+    python3 figure_server.py --only figure04,figure07 --interval 0.5
+    python3 figure_server.py --once --force
+"""
+
+import argparse
+import gc
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import matplotlib
+matplotlib.use('agg')
+import matplotlib.pyplot  # noqa: E402,F401  (imported once, shared by every worker)
+
+from phev_data import column_hash, column_fingerprints, load_phevs, memory_report  # noqa: E402
+from shared_frame import SharedFrame  # noqa: E402
+
+script_dir = Path(__file__).parent.absolute()
+data_dir = script_dir / "data" / "processed"
+FIGURE_SCRIPT = script_dir / "create_figures_markos_python.py"
+# Modules the figures call into, watched alongside the figure script
+HELPER_MODULES = ('figure_scatter.py', 'figure_manifest.py', 'phev_data.py',
+                  'phev_sampling.py', 'phev_stats.py', 'phev_trends.py')
+POLL_INTERVAL = 1.0
+
+
+def _mtimes():
+    paths = [FIGURE_SCRIPT] + [script_dir / name for name in HELPER_MODULES]
+    return {path.name: path.stat().st_mtime_ns for path in paths if path.exists()}
+
+
+def _forget_local_modules():
+    """Drop the modules of this directory the worker inherited from the server.
+
+    The server imported phev_data (and with it the versions of the helpers
+    at start-up); without this the worker would run that old code.
+    """
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, '__file__', None)
+        if (path and name not in ('__main__', '__mp_main__')
+                and Path(path).parent.resolve() == script_dir.resolve()):
+            del sys.modules[name]
+
+
+def render_changed(spec, column_hashes, only=None, formats=(), force=False):
+    """One round, run in a fresh worker: render the figures that changed.
+
+    Returns a list of (fig_id, filename or None, seconds, error text or None).
+    """
+    _forget_local_modules()
+    try:
+        import create_figures_markos_python as cf
+    except Exception:
+        return [(None, None, 0.0, traceback.format_exc())]
+
+    fig_ids = [fig_id for fig_id in (only or cf.FIGURES) if fig_id in cf.FIGURES]
+    fingerprints = cf.figure_fingerprints(fig_ids, column_hashes, formats)
+    manifest = cf.load_manifest(cf.manifest_path)
+    outputs = {fig_id: cf.save_options(cf.FIGURES[fig_id], formats)['formats']
+               for fig_id in fig_ids}
+    stale = [fig_id for fig_id in fig_ids
+             if force or not cf.is_fresh(manifest, cf.FIGURES[fig_id], fingerprints[fig_id],
+                                         cf.fig_dir / cf.FIGURES[fig_id].filename,
+                                         outputs[fig_id])]
+    if not stale:
+        return []
+
+    shared = SharedFrame.attach(spec)
+    cf._phevs = shared.frame()
+    cf.fig_dir.mkdir(exist_ok=True, parents=True)
+    results = []
+    try:
+        for fig_id in stale:
+            try:
+                _, filename, seconds = cf.render_figure(fig_id, formats=formats)
+            except Exception:
+                cf.plt.close('all')
+                results.append((fig_id, None, 0.0, traceback.format_exc()))
+                continue
+            if filename:
+                cf.record(manifest, cf.FIGURES[fig_id], fingerprints[fig_id],
+                          cf.fig_dir / filename, outputs[fig_id])
+            results.append((fig_id, filename, seconds, None))
+        cf.save_manifest(cf.manifest_path, manifest)
+    finally:
+        cf._phevs = None
+        gc.collect()
+        shared.close()
+    return results
+
+
+def run_round(context, spec, column_hashes, args, force):
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        try:
+            results = pool.submit(render_changed, spec, column_hashes, args.only,
+                                  args.formats, force).result()
+        except Exception:
+            # The worker died (e.g. a crash in native code); keep serving
+            results = [(None, None, 0.0, traceback.format_exc())]
+    for fig_id, filename, seconds, error in results:
+        if error:
+            print(f"\n{fig_id or 'create_figures_markos_python.py'} failed:\n{error}")
+        elif filename:
+            print(f"  {fig_id}: {filename} ({seconds:.2f}s)")
+    rendered = sum(1 for result in results if result[1])
+    print(f"Round done in {time.perf_counter() - start:.2f}s: "
+          f"{rendered} figure(s) rendered" if results else "Nothing changed.")
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Keep the PHEV data in memory and re-render figures when their code changes.")
+    parser.add_argument('--only', type=lambda s: [f.strip() for f in s.split(',') if f.strip()],
+                        help="comma-separated figure ids to serve, e.g. figure03,figure07")
+    parser.add_argument('--formats', type=lambda s: tuple(f.strip() for f in s.split(',') if f.strip()),
+                        default=(), help="extra vector formats, as for the figure script")
+    parser.add_argument('--interval', type=float, default=POLL_INTERVAL,
+                        help=f"seconds between checks for changes (default: {POLL_INTERVAL})")
+    parser.add_argument('--force', action='store_true',
+                        help="re-render every served figure in the first round")
+    parser.add_argument('--once', action='store_true',
+                        help="run a single round and exit")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.chdir(script_dir)
+
+    print("Loading data...")
+    try:
+        phevs = load_phevs(None, data_dir)
+        column_hashes = column_fingerprints(phevs.columns, data_dir)
+    except (FileNotFoundError, ImportError) as e:
+        print(f"Error: {e}")
+        return 1
+    if column_hashes is None:
+        # No Parquet cache (pyarrow missing): hash the loaded columns once
+        column_hashes = {c: column_hash(phevs[c]) for c in phevs.columns}
+    print(f"Loaded {len(phevs)} records")
+    print(memory_report(phevs))
+
+    shared = SharedFrame.create(phevs)
+    del phevs
+    gc.collect()
+    print(f"Shared {len(shared.spec['columns'])} columns "
+          f"({shared.nbytes() / 2**20:.1f} MiB)")
+
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+    try:
+        mtimes = _mtimes()
+        run_round(context, shared.spec, column_hashes, args, args.force)
+        if args.once:
+            return 0
+        print(f"\nWatching {FIGURE_SCRIPT.name} and {len(HELPER_MODULES)} helper modules (Ctrl-C to stop)...")
+        while True:
+            time.sleep(args.interval)
+            current = _mtimes()
+            if current == mtimes:
+                continue
+            changed = sorted(name for name in current if current[name] != mtimes.get(name))
+            mtimes = current
+            print(f"\nChanged: {', '.join(changed)}")
+            run_round(context, shared.spec, column_hashes, args, False)
+    except KeyboardInterrupt:
+        print("\nStopped.")
+        return 0
+    finally:
+        shared.unlink()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
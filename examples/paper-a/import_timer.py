@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Per-module import cost, for the figure script's --profile-imports mode.
+
+ImportTimer wraps builtins.__import__ and times every import of a module
+that is not loaded yet, like `python -X importtime`: 'self' is the time
+spent in the module itself and 'cumulative' includes the imports it
+triggers. report() sums the costs by top-level package and lists the
+slowest modules, for the run report.
+
+It only uses the standard library, and it has to be installed before the
+imports it should see.
+"""
+
+import builtins
+import importlib.util
+import sys
+import time
+
+
+class ImportTimer:
+    """Times the module imports made between install() and uninstall()."""
+
+    def __init__(self):
+        # Module name -> [self seconds, cumulative seconds]
+        self.modules = {}
+        self._stack = []
+        self._original = None
+
+    def install(self):
+        self._original = builtins.__import__
+        builtins.__import__ = self._import
+        return self
+
+    def uninstall(self):
+        if self._original is not None:
+            builtins.__import__ = self._original
+            self._original = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        module = name
+        if level:
+            try:
+                module = importlib.util.resolve_name('.' * level + name, (globals or {}).get('__package__'))
+            except (ImportError, ValueError):
+                pass
+        if module in sys.modules:
+            return self._original(name, globals, locals, fromlist, level)
+
+        start = time.perf_counter()
+        self._stack.append(0.0)
+        try:
+            return self._original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += elapsed
+            entry = self.modules.setdefault(module, [0.0, 0.0])
+            entry[0] += elapsed - nested
+            entry[1] += elapsed
+
+    def total(self):
+        """Seconds spent importing, in all modules."""
+        return sum(own for own, _ in self.modules.values())
+
+    def by_package(self):
+        """Self time summed per top-level package, slowest first."""
+        packages = {}
+        for name, (own, _) in self.modules.items():
+            top = name.split('.')[0]
+            packages[top] = packages.get(top, 0.0) + own
+        return sorted(packages.items(), key=lambda item: -item[1])
+
+    def slowest(self, limit=10):
+        """(module, self, cumulative) of the `limit` modules with the largest cumulative time."""
+        ranked = sorted(self.modules.items(), key=lambda item: -item[1][1])[:limit]
+        return [(name, own, cumulative) for name, (own, cumulative) in ranked]
+
+    def report(self, limit=10):
+        """Lines summarising the import costs, for printing."""
+        lines = [f"Import time: {self.total():.2f}s in {len(self.modules)} modules", "  By package (self time):"]
+        for package, seconds in self.by_package()[:limit]:
+            lines.append(f"    {package:<24} {seconds * 1000:8.1f} ms")
+        lines.append("  Slowest modules (cumulative / self):")
+        for name, own, cumulative in self.slowest(limit):
+            lines.append(f"    {name:<40} {cumulative * 1000:8.1f} / {own * 1000:6.1f} ms")
+        return lines
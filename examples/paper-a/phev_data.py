@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+PHEV dataset loader for the Paper A figure scripts.
+
+The preprocessed dataset (data/processed/obfcm_phevs_unflagged.rds, or the
+.pkl fallback) is parsed once and written to a column-pruned Parquet cache
+under data/processed/.cache. Later runs memory-map the cache and read only
+the columns they ask for. The cache is rebuilt when the source file's
+mtime/size changes and its content hash no longer matches.
+
+PHEV_SCHEMA is applied when the cache is built and again on load: string
+columns become categoricals, measurements float32 and counters nullable
+small ints.
+
+Usage:
+    python3 phev_data.py            # build or refresh the cache
+    python3 phev_data.py --refresh  # force a rebuild
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+script_dir = Path(__file__).parent.absolute()
+data_dir = script_dir / "data" / "processed"
+
+DATASET_NAME = "obfcm_phevs_unflagged"
+
+# Columns read by the figure scripts. Anything else in the source is dropped
+# when the cache is built.
+PHEV_COLUMNS = [
+    'EDSen_mech',
+    'EnTot_final100km',
+    'EnICE_final100km',
+    'EnEl_final100km',
+    'Mass',
+    'Electric_range',
+    'Mileage_Tot',
+    'AER_to_Mass',
+    'Country',
+    'Region',
+    'year',
+]
+
+# Compact dtypes for the loaded frame. Columns missing from the source are
+# ignored; columns not listed keep whatever dtype the source gave them.
+PHEV_SCHEMA = {
+    # Strings with a handful of distinct values
+    'Country': 'category',
+    'Region': 'category',
+    'OEM': 'category',
+    'Model': 'category',
+    # Measurements
+    'EDSen_mech': 'float32',
+    'EnTot_final100km': 'float32',
+    'EnICE_final100km': 'float32',
+    'EnEl_final100km': 'float32',
+    'Mass': 'float32',
+    'Electric_range': 'float32',
+    'Mileage_Tot': 'float32',
+    'AER_to_Mass': 'float32',
+    # Counters
+    'year': 'Int16',
+}
+
+CACHE_VERSION = 4
+HASH_CHUNK_SIZE = 1 << 20
+
+# Mass categories used by Figure 9
+MASS_BINS = [0, 1600, 2000, float('inf')]
+MASS_LABELS = ['Light (<1600 kg)', 'Medium (1600-2000 kg)', 'Heavy (≥2000 kg)']
+# Period label when the data has no 'year' column
+DEFAULT_PERIOD = '2021-2023'
+
+
+def find_source(directory=data_dir):
+    """Return the RDS source file, or the pickle fallback if there is no RDS."""
+    directory = Path(directory)
+    for suffix in ('.rds', '.pkl'):
+        candidate = directory / f"{DATASET_NAME}{suffix}"
+        if candidate.exists():
+            return candidate
+    raise FileNotFoundError(
+        f"Data file not found at {directory / (DATASET_NAME + '.rds')} "
+        f"or {directory / (DATASET_NAME + '.pkl')}")
+
+
+def file_hash(path):
+    """SHA-256 of a file, read in 1 MiB chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_source(path):
+    """Parse the full RDS/pickle source into a DataFrame."""
+    path = Path(path)
+    if path.suffix == '.pkl':
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    try:
+        import pyreadr
+    except ImportError:
+        raise ImportError("pyreadr not installed. Install with: pip install pyreadr\n"
+                          "Or convert RDS to CSV/PKL first")
+    result = pyreadr.read_r(str(path))
+    return result[list(result.keys())[0]]
+
+
+def apply_schema(df, schema=PHEV_SCHEMA):
+    """Cast the columns named in `schema` to their compact dtypes, in place."""
+    for column, dtype in schema.items():
+        if column not in df.columns or str(df[column].dtype) == dtype:
+            continue
+        values = df[column]
+        if dtype == 'Int16' and values.dtype.kind == 'f':
+            # Years/counts stored as doubles in the RDS
+            values = values.round()
+        df[column] = values.astype(dtype)
+    return df
+
+
+def mass_category(mass):
+    """Categorical Light/Medium/Heavy mass class."""
+    return pd.cut(mass, bins=MASS_BINS, labels=MASS_LABELS)
+
+
+def period_labels(df):
+    """Categorical reporting period: the year as text, or DEFAULT_PERIOD."""
+    if 'year' in df.columns:
+        return df['year'].astype('string').astype('category')
+    return pd.Categorical.from_codes(np.zeros(len(df), dtype=np.int8), [DEFAULT_PERIOD])
+
+
+def column_memory(df):
+    """Deep memory usage per column, in bytes."""
+    usage = df.memory_usage(deep=True, index=False)
+    return {str(column): int(nbytes) for column, nbytes in usage.items()}
+
+
+def memory_report(df):
+    """One-line summary of the frame's memory against its uncompacted size."""
+    after = sum(column_memory(df).values())
+    before = df.attrs.get('raw_memory_bytes')
+    if not before:
+        return f"Memory: {after / 2**20:,.1f} MiB"
+    return (f"Memory: {before / 2**20:,.1f} MiB -> {after / 2**20:,.1f} MiB "
+            f"({after / before:.0%} of source dtypes)")
+
+
+def column_hash(values):
+    """Content hash of one column (values and dtype, not the index)."""
+    digest = hashlib.sha256(str(values.dtype).encode())
+    digest.update(pd.util.hash_pandas_object(values, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _cache_paths(source):
+    cache_dir = Path(source).parent / ".cache"
+    return cache_dir / f"{DATASET_NAME}.parquet", cache_dir / f"{DATASET_NAME}.json"
+
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(meta_path, meta):
+    tmp_path = meta_path.with_suffix('.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, meta_path)
+
+
+def cache_is_current(source, meta):
+    """Check cache metadata against the source, re-hashing only if mtime/size moved."""
+    if not meta or meta.get('version') != CACHE_VERSION:
+        return False
+    st = os.stat(source)
+    if meta.get('mtime_ns') == st.st_mtime_ns and meta.get('size') == st.st_size:
+        return True
+    # Touched or copied but possibly unchanged: fall back to the content hash
+    if meta.get('size') == st.st_size and meta.get('sha256') == file_hash(source):
+        meta['mtime_ns'] = st.st_mtime_ns
+        return True
+    return False
+
+
+def build_cache(source, columns=None):
+    """Convert the source to a column-pruned Parquet file and return its metadata."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    source = Path(source)
+    cache_path, meta_path = _cache_paths(source)
+    cache_path.parent.mkdir(exist_ok=True, parents=True)
+
+    print(f"Building Parquet cache from {source.name}...")
+    df = read_source(source)
+    wanted = PHEV_COLUMNS if columns is None else list(dict.fromkeys(PHEV_COLUMNS + list(columns)))
+    # Before pruning: current_cache() checks requests against the full source
+    source_columns = [str(c) for c in df.columns]
+    keep = [c for c in wanted if c in df.columns]
+    df = df[keep].copy()
+    raw_memory = column_memory(df)
+    df = apply_schema(df)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+
+    tmp_path = cache_path.with_suffix('.parquet.tmp')
+    pq.write_table(table, tmp_path, compression='zstd')
+    os.replace(tmp_path, cache_path)
+
+    st = os.stat(source)
+    meta = {
+        'version': CACHE_VERSION,
+        'source': source.name,
+        'mtime_ns': st.st_mtime_ns,
+        'size': st.st_size,
+        'sha256': file_hash(source),
+        'columns': keep,
+        'source_columns': source_columns,
+        'rows': len(df),
+        'raw_memory': raw_memory,
+        'column_hashes': {c: column_hash(df[c]) for c in keep},
+    }
+    _write_meta(meta_path, meta)
+    return meta
+
+
+def current_cache(source, columns=PHEV_COLUMNS, refresh=False):
+    """Make sure the Parquet cache is up to date for `columns`; return its metadata."""
+    cache_path, meta_path = _cache_paths(source)
+    meta = None if refresh else _read_meta(meta_path)
+    cached_mtime = meta.get('mtime_ns') if meta else None
+    if not cache_path.exists() or not cache_is_current(source, meta):
+        meta = build_cache(source, columns)
+    elif any(c not in meta['columns'] and c in meta['source_columns'] for c in columns):
+        # A figure asked for a source column the cache was pruned without
+        meta = build_cache(source, meta['columns'] + list(columns))
+    elif meta['mtime_ns'] != cached_mtime:
+        _write_meta(meta_path, meta)
+    return meta
+
+
+def column_fingerprints(columns=None, directory=data_dir):
+    """Content hashes of `columns`, from the cache metadata (no data is read).
+
+    Columns absent from the source map to None. Returns None when pyarrow is
+    not installed, since there is then no cache to take hashes from.
+    """
+    columns = PHEV_COLUMNS if columns is None else list(columns)
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return None
+    meta = current_cache(find_source(directory), columns)
+    return {c: meta['column_hashes'].get(c) for c in columns}
+
+
+def load_phevs(columns=None, directory=data_dir, refresh=False):
+    """Load the PHEV dataset, reading only `columns` (default: PHEV_COLUMNS).
+
+    Requested columns that do not exist in the source are skipped, so figures
+    can ask for optional variables such as 'year' or 'AER_to_Mass'. With the
+    cache, df.attrs['dataset_version'] is the source's content hash.
+    """
+    source = find_source(directory)
+    columns = PHEV_COLUMNS if columns is None else list(columns)
+
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        # No Arrow: parse the source directly, as before the cache existed
+        df = read_source(source)
+        df = df[[c for c in columns if c in df.columns]].copy()
+        df.attrs['raw_memory_bytes'] = sum(column_memory(df).values())
+        return apply_schema(df)
+
+    cache_path, _ = _cache_paths(source)
+    meta = current_cache(source, columns, refresh)
+
+    present = [c for c in columns if c in meta['columns']]
+    table = pq.read_table(cache_path, columns=present, memory_map=True)
+    df = apply_schema(table.to_pandas())
+    df.attrs['raw_memory_bytes'] = sum(meta.get('raw_memory', {}).get(c, 0) for c in present)
+    df.attrs['dataset_version'] = meta['sha256']
+    return df
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    source = find_source()
+    meta = build_cache(source) if '--refresh' in argv else current_cache(source)
+    print(f"Cache for {meta['source']}: {meta['rows']:,} rows, "
+          f"{len(meta['columns'])} columns")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Flag breakdown tables from the packed PHEV quality-flag mask.
+
+The vehicles are counted once per (OEM, Model, flag mask) with a single
+value_counts(). Everything else is summed from that small table: the bits
+of each distinct mask are unpacked and weighted by its count, which gives
+the flagged vehicles per step for every OEM, Model and OEM x Model without
+going back to the rows. The flag combinations (UpSet-style) are a
+value_counts() over the integer mask.
+
+The tables have the layout of the R output in tables/: one row per key and
+step with the key's share of the step's flagged vehicles, the `top` keys
+per step, missing keys written as NA.
+
+Usage:
+    python3 phev_flag_breakdown.py phevs_flagged.parquet
+    python3 phev_flag_breakdown.py phevs.csv --vfn PHEVs_VFN_obfcm_ok.csv --top 50
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from phev_flags import FLAG_MASK, FLAG_RULES, flag_mask, model_column, read_table
+
+script_dir = Path(__file__).parent.absolute()
+table_dir = script_dir / "tables"
+
+# Keys per step kept in the breakdown tables
+TOP_KEYS = 30
+
+# Breakdown table name -> key columns
+BREAKDOWNS = {
+    'filtering_oem_breakdown.csv': ['OEM'],
+    'filtering_model_breakdown.csv': ['Model'],
+    'filtering_oem_model_breakdown.csv': ['OEM', 'Model'],
+}
+COMBINATIONS_TABLE = 'filtering_flag_combinations.csv'
+
+
+def mask_counts(df, mask=None):
+    """Vehicles per (OEM, Model, flag mask); the only pass over the rows."""
+    mask = df[FLAG_MASK] if mask is None else mask
+    keys = pd.DataFrame({'OEM': df['OEM'].to_numpy(),
+                         'Model': df[model_column(df)].to_numpy(),
+                         FLAG_MASK: np.asarray(mask, dtype=np.uint8)})
+    return keys.value_counts(dropna=False, sort=False).rename('n').reset_index()
+
+
+def step_weights(counts):
+    """Flagged vehicles per step for each row of mask_counts(), one column per step."""
+    bits = np.unpackbits(counts[FLAG_MASK].to_numpy(dtype=np.uint8)[:, None], axis=1,
+                         bitorder='little')
+    weighted = bits[:, [step - 1 for step in FLAG_RULES]] * counts['n'].to_numpy()[:, None]
+    return pd.DataFrame(weighted, columns=list(FLAG_RULES), index=counts.index)
+
+
+def step_breakdown(counts, by, top=TOP_KEYS, weights=None):
+    """Flagged vehicles per key of `by` and step, as in tables/filtering_*_breakdown.csv.
+
+    Columns: the keys, n_flagged, step (its label) and pct, the key's share
+    of the step's flagged vehicles. Steps are in order, keys by n_flagged
+    (the `top` largest per step); steps that flag nobody are left out.
+    """
+    if weights is None:
+        weights = step_weights(counts)
+    per_key = weights.groupby([counts[column] for column in by], dropna=False, sort=True).sum()
+    long = per_key.rename_axis(columns='step').stack().rename('n_flagged').reset_index()
+    long = long[long['n_flagged'] > 0]
+    totals = long.groupby('step')['n_flagged'].transform('sum')
+    long['pct'] = (long['n_flagged'] / totals * 100).round(2)
+    long = long.sort_values(['step', 'n_flagged'], ascending=[True, False], kind='stable')
+    long = long.groupby('step', sort=False).head(top)
+    long['step'] = long['step'].map({step: rule.label for step, rule in FLAG_RULES.items()})
+    return long[by + ['n_flagged', 'step', 'pct']].reset_index(drop=True)
+
+
+def flag_combinations(mask):
+    """Vehicles per exact combination of failed steps, most frequent first.
+
+    Columns: flag_mask, steps (e.g. '1+4', 'none'), n_flags, n and pct of
+    all vehicles.
+    """
+    return combination_table(pd.Series(np.asarray(mask, dtype=np.uint8)).value_counts())
+
+
+def combination_table(counts):
+    """flag_combinations() from vehicle counts indexed by mask value."""
+    values = counts.index.to_numpy(dtype=np.uint8)
+    n = counts.to_numpy()
+    bits = np.unpackbits(values[:, None], axis=1, bitorder='little')
+    steps = ['+'.join(str(step) for step in FLAG_RULES if row[step - 1]) or 'none' for row in bits]
+    return pd.DataFrame({FLAG_MASK: values,
+                         'steps': steps,
+                         'n_flags': bits.sum(axis=1),
+                         'n': n,
+                         'pct': (n / max(n.sum(), 1) * 100).round(2)})
+
+
+def write_table(table, path):
+    # R's write.csv conventions: NA for missing keys, 100 rather than 100.0
+    table.to_csv(path, index=False, na_rep='NA', float_format='%.15g')
+
+
+def write_breakdowns(df, mask=None, out_dir=table_dir, top=TOP_KEYS):
+    """Write the three breakdown tables and the combination counts; return the paths."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    counts = mask_counts(df, mask)
+    weights = step_weights(counts)
+    paths = []
+    for name, by in BREAKDOWNS.items():
+        write_table(step_breakdown(counts, by, top, weights), out_dir / name)
+        paths.append(out_dir / name)
+    combinations = counts.groupby(FLAG_MASK)['n'].sum().sort_values(ascending=False, kind='stable')
+    write_table(combination_table(combinations), out_dir / COMBINATIONS_TABLE)
+    paths.append(out_dir / COMBINATIONS_TABLE)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write the flag breakdown tables.")
+    parser.add_argument('data', type=Path,
+                        help=f"PHEV records (.csv, .parquet or .pkl), flagged with a '{FLAG_MASK}' "
+                             "column or flagged here")
+    parser.add_argument('--vfn', type=Path,
+                        help="VFN validation table for step 5, when flagging here")
+    parser.add_argument('--output-dir', '-o', type=Path, default=table_dir,
+                        help="directory for the tables (default: tables/)")
+    parser.add_argument('--top', type=int, default=TOP_KEYS,
+                        help=f"keys per step in the breakdown tables (default: {TOP_KEYS})")
+    args = parser.parse_args(argv)
+
+    df = read_table(args.data)
+    mask = None
+    if FLAG_MASK not in df.columns:
+        try:
+            mask, skipped = flag_mask(df, read_table(args.vfn) if args.vfn else None)
+        except KeyError as e:
+            print(f"Error: {e.args[0]}")
+            return 1
+        for step, reason in skipped.items():
+            print(f"{FLAG_RULES[step].label} skipped: {reason}")
+
+    start = time.perf_counter()
+    paths = write_breakdowns(df, mask, args.output_dir, args.top)
+    print(f"Broke down {len(df):,} records in {time.perf_counter() - start:.2f}s")
+    for path in paths:
+        print(f"  Saved: {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Quality flags for the PHEV records, ported from the R cleaning pipeline.
+
+The eight cleaning steps of data_cleaning_docs/DATA_CLEANING_DOCUMENTATION.md
+are registered as vectorized rules: each one reads whole columns and returns
+a boolean mask. flag_mask() evaluates them once each and packs the results
+into one uint8 per vehicle, bit `step - 1` set when the vehicle fails that
+step, so nothing is filtered and no pass depends on an earlier one (vehicles
+are flagged, not removed; see FLAGGING_APPROACH_EXPLANATION.md).
+
+Column names follow the R code (Mileage_CS, FC_CS, RW_EC, OEM, Modelup,
+EDSd, EnTot100km, ...). Mileage_CS and FC_CS are derived from the mode
+totals when absent, and 'Model' stands in for 'Modelup'. Step 5 needs the
+external VFN validation table and is skipped without it, as in R.
+
+Usage:
+    python3 phev_flags.py phevs.parquet
+    python3 phev_flags.py phevs.csv --vfn PHEVs_VFN_obfcm_ok.csv -o phevs_flagged.parquet
+"""
+
+import argparse
+import sys
+import time
+from collections import namedtuple
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from phev_stats import group_codes, sorted_groups, sorted_quantile
+
+# Name of the packed mask column
+FLAG_MASK = 'flag_mask'
+
+# Step 4: OEM_Model x year groups whose 95th percentile RW_EC is at most
+# this report zeros systematically (case A) ...
+RW_EC_P95_ZERO = 0.0
+# ... otherwise only the zero RW_EC entries of groups with more than this
+# share of zeros are flagged (case B)
+RW_EC_ZERO_SHARE = 0.30
+
+# Step 8: allowed |EnTot - (EnEl + EnICE)|
+ENERGY_TOLERANCE = 1e-6
+
+# Candidate names of the reporting year column, first match wins
+YEAR_COLUMNS = ('year', 'OBFCM_ReportingPeriod')
+
+# Columns derived when the data does not carry them
+DERIVED_COLUMNS = {
+    'Mileage_CS': ('Mileage_Tot', '-Mileage_CD_Eng_On', '-Mileage_CD_Eng_Off', '-Mileage_CI'),
+    'FC_CS': ('FC_Tot', '-FC_CD', '-FC_CI'),
+}
+
+# Flag registry, in step order
+FlagRule = namedtuple('FlagRule', ['step', 'column', 'label', 'rule'])
+FLAG_RULES = {}
+
+
+def flag_rule(step, column, label):
+    """Register rule(inputs) -> boolean array as cleaning step `step` (bit step - 1)."""
+    def register(rule):
+        FLAG_RULES[step] = FlagRule(step, column, label, rule)
+        return rule
+    return register
+
+
+def model_column(df):
+    """Name of the harmonised model column of `df`."""
+    return 'Modelup' if 'Modelup' in df.columns else 'Model'
+
+
+class SkipStep(Exception):
+    """Raised by a rule that cannot be evaluated on this data (e.g. no VFN table)."""
+
+
+class FlagInputs:
+    """Column access for the rules: each column is converted to NumPy once.
+
+    num() gives float64 values with NaN for missing entries, missing() the
+    missing-value mask of any column, key() the OEM_Model x year group codes.
+    """
+
+    def __init__(self, df, vfn_ok=None):
+        self.df = df
+        self.vfn_ok = vfn_ok
+        self._num = {}
+        self._key = None
+        self.ngroups = 0
+
+    def has(self, name):
+        return name in self.df.columns or (name in DERIVED_COLUMNS and all(
+            part.lstrip('-') in self.df.columns for part in DERIVED_COLUMNS[name]))
+
+    def num(self, name):
+        if name not in self._num:
+            if name in self.df.columns:
+                values = pd.to_numeric(self.df[name], errors='coerce')
+                values = values.to_numpy(dtype=np.float64, na_value=np.nan)
+            elif name in DERIVED_COLUMNS:
+                first, *rest = DERIVED_COLUMNS[name]
+                values = self.num(first).copy()
+                for part in rest:
+                    values -= self.num(part.lstrip('-'))
+            else:
+                raise KeyError(f"Flagging needs column '{name}'")
+            self._num[name] = values
+        return self._num[name]
+
+    def missing(self, name):
+        if name in self.df.columns and self.df[name].dtype.kind not in 'fiu':
+            return self.df[name].isna().to_numpy()
+        return np.isnan(self.num(name))
+
+    def model(self):
+        return model_column(self.df)
+
+    def year(self, df=None):
+        """Name of the reporting year column of `df` (default: the data)."""
+        df = self.df if df is None else df
+        for name in YEAR_COLUMNS:
+            if name in df.columns:
+                return name
+        raise KeyError(f"Flagging needs a year column (one of {', '.join(YEAR_COLUMNS)})")
+
+    def key(self):
+        """OEM_Model x year group code per row (-1 where any part is missing)."""
+        if self._key is None:
+            keys = pd.DataFrame({'OEM': self.df['OEM'], 'Model': self.df[self.model()],
+                                 'year': self.df[self.year()]}, index=self.df.index)
+            self._key, groups = group_codes(keys, ['OEM', 'Model', 'year'])
+            self.ngroups = len(groups)
+        return self._key
+
+
+def _gt(x, threshold):
+    # Comparisons with NaN are False, like R's filter() dropping NA conditions
+    return np.greater(x, threshold, where=~np.isnan(x), out=np.zeros(len(x), dtype=bool))
+
+
+def _ge(x, threshold):
+    return np.greater_equal(x, threshold, where=~np.isnan(x), out=np.zeros(len(x), dtype=bool))
+
+
+def _lt(x, threshold):
+    return np.less(x, threshold, where=~np.isnan(x), out=np.zeros(len(x), dtype=bool))
+
+
+#==============================================================================
+# The eight cleaning steps
+#==============================================================================
+@flag_rule(1, 'flag_cs_invalid', 'Step 1: CS Invalid')
+def cs_invalid(c):
+    """Negative or missing charge-sustaining mileage or fuel consumption."""
+    mileage, fc = c.num('Mileage_CS'), c.num('FC_CS')
+    return np.isnan(mileage) | np.isnan(fc) | (mileage < 0) | (fc < 0)
+
+
+@flag_rule(2, 'flag_missing_rw_ec', 'Step 2: Missing RW_EC')
+def missing_rw_ec(c):
+    """No real-world electric energy consumption."""
+    return c.missing('RW_EC')
+
+
+@flag_rule(3, 'flag_missing_oem_model', 'Step 3: Missing OEM/Model')
+def missing_oem_model(c):
+    """No manufacturer or no (harmonised) model."""
+    return c.missing('OEM') | c.missing(c.model())
+
+
+@flag_rule(4, 'flag_rw_ec_zero', 'Step 4: RW_EC Zero')
+def rw_ec_zero(c):
+    """Systematic (p95 == 0) or partial (> 30 % zeros) zero RW_EC reporting per OEM_Model x year.
+
+    Case A flags the whole group, case B only its zero entries. Missing
+    RW_EC values are left out of the percentile and the zero share.
+    """
+    codes = c.key()
+    rw_ec = c.num('RW_EC')
+    ngroups = c.ngroups
+    sorted_values, starts, counts = sorted_groups(codes, rw_ec, ngroups)
+    p95 = sorted_quantile(sorted_values, starts, counts, 0.95)
+    valid = (codes >= 0) & ~np.isnan(rw_ec)
+    zeros = np.bincount(codes[valid], weights=rw_ec[valid] == 0, minlength=ngroups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        share = zeros / counts
+    systematic = np.append(p95 <= RW_EC_P95_ZERO, False)
+    partial = np.append((p95 > RW_EC_P95_ZERO) & (share > RW_EC_ZERO_SHARE), False)
+    # Code -1 indexes the appended False
+    return systematic[codes] | (partial[codes] & (rw_ec == 0))
+
+
+@flag_rule(5, 'flag_vfn_issue', 'Step 5: VFN Issue')
+def vfn_issue(c):
+    """VFN x year combinations marked obfcm_ok == 0 in the external validation table."""
+    if c.vfn_ok is None:
+        raise SkipStep("no VFN validation table")
+    bad = c.vfn_ok[c.vfn_ok['obfcm_ok'] == 0]
+    bad_pairs = pd.MultiIndex.from_arrays([
+        bad['VFN_corr'].astype(str),
+        pd.to_numeric(bad[c.year(bad)], errors='coerce').astype('float64')])
+    pairs = pd.MultiIndex.from_arrays([c.df['VFN_corr'].astype(str), c.num(c.year())])
+    return pairs.isin(bad_pairs) & ~c.missing('VFN_corr')
+
+
+@flag_rule(6, 'flag_physics_co2_fc', 'Step 6: Physics CO2/FC')
+def physics_co2_fc(c):
+    """Physically implausible PHEV CO2 / fuel consumption values."""
+    return _gt(c.num('FCgap_perc'), 1800) | _ge(c.num('TA_CO2'), 190) | _gt(c.num('RW_CO2'), 800)
+
+
+@flag_rule(7, 'flag_mileage_fc_incons', 'Step 7: Mileage/FC Inconsistency')
+def mileage_fc_inconsistency(c):
+    """Fuel used without distance in a mode, or long CS distance without fuel."""
+    cs_mileage, cs_fc = c.num('Mileage_CS'), c.num('FC_CS')
+    return ((c.num('Mileage_CD_Eng_On') == 0) & _gt(c.num('FC_CD'), 0.1)
+            | (cs_mileage == 0) & _gt(cs_fc, 0.1)
+            | (c.num('Mileage_CI') == 0) & _gt(c.num('FC_CI'), 3)
+            | _gt(cs_mileage, 100) & (cs_fc == 0))
+
+
+@flag_rule(8, 'flag_eds_energy_violation', 'Step 8: EDS/Energy Violation')
+def eds_energy_violation(c):
+    """EDS outside 0-100 % or EDSpel > EDSd, negative energies, or EnTot != EnEl + EnICE."""
+    eds_d, eds_pel, eds_en = c.num('EDSd'), c.num('EDSpel'), c.num('EDSen')
+    out = _gt(eds_pel - eds_d, 0)
+    for eds in (eds_d, eds_pel, eds_en):
+        out |= _lt(eds, 0) | _gt(eds, 100)
+    for energy in ('EnEl', 'EnICE', 'EnTot', 'EnTot100km'):
+        out |= _lt(c.num(energy), 0)
+    out |= _gt(np.abs(c.num('EnTot') - (c.num('EnEl') + c.num('EnICE'))), ENERGY_TOLERANCE)
+    return out
+
+
+#==============================================================================
+# Engine
+#==============================================================================
+def flag_mask(df, vfn_ok=None, steps=None):
+    """Packed quality flags of every row of `df`, with the steps that were skipped.
+
+    Returns (mask, skipped): mask is a uint8 array with bit `step - 1` set
+    where the row fails that step; skipped maps each step that could not be
+    evaluated (e.g. step 5 without `vfn_ok`, a frame with VFN_corr, a year
+    column and obfcm_ok) to the reason. Missing input columns raise KeyError.
+    """
+    inputs = FlagInputs(df, vfn_ok)
+    mask = np.zeros(len(df), dtype=np.uint8)
+    skipped = {}
+    for step in steps or FLAG_RULES:
+        rule = FLAG_RULES[step]
+        try:
+            failed = np.asarray(rule.rule(inputs), dtype=bool)
+        except SkipStep as e:
+            skipped[step] = str(e)
+            continue
+        mask |= failed.astype(np.uint8) << np.uint8(step - 1)
+    return mask, skipped
+
+
+def step_counts(mask):
+    """Number of rows flagged by each step, {step: count}."""
+    bits = np.unpackbits(np.asarray(mask, dtype=np.uint8)[:, None], axis=1, bitorder='little')
+    totals = bits.sum(axis=0)
+    return {step: int(totals[step - 1]) for step in FLAG_RULES}
+
+
+def flag_columns(mask):
+    """One boolean column per step (flag_cs_invalid, ...), as in the R output."""
+    mask = np.asarray(mask, dtype=np.uint8)
+    return pd.DataFrame({rule.column: ((mask >> np.uint8(step - 1)) & 1) == 1
+                         for step, rule in FLAG_RULES.items()})
+
+
+def flag_summary(mask, skipped=()):
+    """Per-step statistics table in the layout of FLAGGING_STATISTICS_TABLE.md."""
+    n = len(mask)
+    flagged = int(np.count_nonzero(mask))
+    lines = [f"Total PHEVs: {n:,}",
+             f"Clean PHEVs (no flags): {n - flagged:,} ({(n - flagged) / max(n, 1):.1%})",
+             f"Flagged PHEVs (>=1 flag): {flagged:,} ({flagged / max(n, 1):.1%})",
+             "",
+             f"{'Step':<34} {'Flagged':>10} {'% of PHEVs':>11}"]
+    for step, count in step_counts(mask).items():
+        label = FLAG_RULES[step].label
+        if step in skipped:
+            lines.append(f"{label:<34} {'skipped':>10}   ({skipped[step]})")
+        else:
+            lines.append(f"{label:<34} {count:>10,} {count / max(n, 1):>10.2%}")
+    return "\n".join(lines)
+
+
+def read_table(path):
+    """Read a CSV, Parquet or pickle file into a DataFrame."""
+    path = Path(path)
+    if path.suffix == '.parquet':
+        return pd.read_parquet(path)
+    if path.suffix == '.pkl':
+        return pd.read_pickle(path)
+    return pd.read_csv(path, low_memory=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Flag PHEV records with the 8 cleaning steps.")
+    parser.add_argument('data', type=Path, help="PHEV records (.csv, .parquet or .pkl)")
+    parser.add_argument('--vfn', type=Path,
+                        help="VFN validation table (VFN_corr, year or OBFCM_ReportingPeriod, "
+                             "obfcm_ok) for step 5")
+    parser.add_argument('--output', '-o', type=Path,
+                        help=f"write the data with a '{FLAG_MASK}' column (.parquet or .pkl)")
+    args = parser.parse_args(argv)
+
+    df = read_table(args.data)
+    vfn_ok = read_table(args.vfn) if args.vfn else None
+    start = time.perf_counter()
+    try:
+        mask, skipped = flag_mask(df, vfn_ok)
+    except KeyError as e:
+        print(f"Error: {e.args[0]}")
+        return 1
+    print(f"Flagged {len(df):,} records in {time.perf_counter() - start:.2f}s\n")
+    print(flag_summary(mask, skipped))
+
+    if args.output:
+        df[FLAG_MASK] = mask
+        if args.output.suffix == '.pkl':
+            df.to_pickle(args.output)
+        else:
+            df.to_parquet(args.output, index=False)
+        print(f"\nSaved: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Reproducible row samples for the Paper A scatter panels.
+
+sample_indices() draws a seeded sample of row positions, optionally
+stratified so every stratum (e.g. Country, OEM or mass category) keeps its
+share of the rows. The positions are cached in memory and under
+data/processed/.cache/samples, keyed on the dataset version (the source
+file's content hash, set by load_phevs()), so the same dataset always gives
+the same points and the figures can be reused by the build manifest.
+
+Panels take their points with take_sample(), which indexes only the columns
+they plot instead of copying the frame the way DataFrame.sample() does.
+"""
+
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from phev_data import data_dir, mass_category
+
+SAMPLE_SEED = 0
+SAMPLE_CACHE_DIR = data_dir / ".cache" / "samples"
+
+# Pseudo-column accepted in `strata`: Light/Medium/Heavy class of 'Mass'
+MASS_CATEGORY = 'mass_category'
+
+_samples = {}
+
+
+def strata_codes(df, strata):
+    """Integer stratum per row (-1 where a key is missing) and the stratum count."""
+    keys = {}
+    for column in strata:
+        keys[column] = mass_category(df['Mass']) if column == MASS_CATEGORY else df[column]
+    grouper = pd.DataFrame(keys, index=df.index).groupby(list(strata), observed=True, sort=True)
+    return grouper.ngroup().to_numpy(), grouper.ngroups
+
+
+def allocate(sizes, n):
+    """Split `n` draws across strata of `sizes` proportionally (largest remainder)."""
+    sizes = np.asarray(sizes, dtype=np.int64)
+    total = sizes.sum()
+    if n >= total:
+        return sizes
+    quota = sizes * (n / total)
+    alloc = np.floor(quota).astype(np.int64)
+    short = n - alloc.sum()
+    if short:
+        alloc[np.argsort(alloc - quota, kind='stable')[:short]] += 1
+    return alloc
+
+
+def draw_indices(n_rows, n, seed=SAMPLE_SEED, codes=None, ngroups=1):
+    """Sorted positions of an `n`-row sample of `n_rows` rows.
+
+    Every row gets a seeded random priority and each stratum keeps its
+    allocated number of lowest-priority rows. Rows with code -1 are never drawn.
+    """
+    priority = np.random.default_rng(seed).random(n_rows)
+    if codes is None:
+        if n >= n_rows:
+            return np.arange(n_rows)
+        return np.sort(np.argpartition(priority, n)[:n])
+
+    codes = np.asarray(codes, dtype=np.int64)
+    valid = np.flatnonzero(codes >= 0)
+    codes = codes[valid]
+    order = np.lexsort((priority[valid], codes))
+    sizes = np.bincount(codes, minlength=ngroups)
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    ranked = codes[order]
+    rank = np.arange(len(order)) - starts[ranked]
+    keep = rank < allocate(sizes, n)[ranked]
+    return np.sort(valid[order[keep]])
+
+
+def _cache_path(version, n_rows, n, seed, strata):
+    key = repr((version, n_rows, n, seed, tuple(strata)))
+    return SAMPLE_CACHE_DIR / f"{hashlib.sha256(key.encode()).hexdigest()[:16]}.npy"
+
+
+def sample_indices(df, n, seed=SAMPLE_SEED, strata=()):
+    """Row positions of a reproducible `n`-row sample of `df`.
+
+    With `strata` (column names, or MASS_CATEGORY) the sample is stratified
+    proportionally. Results are cached per dataset version; frames without a
+    version (df.attrs['dataset_version']) are sampled afresh but still
+    deterministically.
+    """
+    strata = [strata] if isinstance(strata, str) else list(strata)
+    version = df.attrs.get('dataset_version')
+    key = (version, len(df), n, seed, tuple(strata))
+    if version and key in _samples:
+        return _samples[key]
+
+    path = _cache_path(version, len(df), n, seed, strata) if version else None
+    if path is not None and path.exists():
+        indices = np.load(path)
+    else:
+        if strata:
+            codes, ngroups = strata_codes(df, strata)
+            indices = draw_indices(len(df), n, seed, codes, ngroups)
+        else:
+            indices = draw_indices(len(df), n, seed)
+        if path is not None:
+            path.parent.mkdir(exist_ok=True, parents=True)
+            tmp_path = path.with_suffix('.tmp.npy')
+            np.save(tmp_path, indices)
+            os.replace(tmp_path, path)
+
+    if version:
+        _samples[key] = indices
+    return indices
+
+
+def take_sample(df, columns, indices):
+    """The sampled rows of `columns` only, as a new (small) frame."""
+    return pd.DataFrame({c: df[c].iloc[indices].to_numpy() for c in columns})
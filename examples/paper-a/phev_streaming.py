@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+"""
+Streaming, out-of-core aggregation for the Paper A figures.
+
+Reads a CSV of PHEV records in chunks and keeps only mergeable aggregates:
+
+- GroupedSketch: a fixed-bin histogram per group key. Quantiles read from it
+  are exact to within one bin width (range / SKETCH_BINS), and its counts
+  feed the FFT KDE directly. Count, mean, min and max are exact.
+- TrendSums: least-squares sufficient statistics for the Figure 4 fits.
+- Reservoir: a seeded, fixed-size uniform sample for the scatter panels.
+
+Peak memory is bounded by the chunk size plus the (data-size independent)
+aggregates. figure_summaries() turns the aggregates into the same
+per-figure summaries the in-memory compute functions return, so the
+plotting code does not care where they came from.
+
+The CSV must carry the figure columns (see PHEV_COLUMNS). The raw OBFCM
+release does not: EDSen_mech and the *_final100km energies are derived by
+the R cleaning pipeline. Pass a `transform` callable to derive or rename
+columns per chunk.
+"""
+
+import numpy as np
+import pandas as pd
+
+from phev_data import MASS_LABELS, PHEV_COLUMNS, apply_schema, mass_category, period_labels
+from phev_stats import KDE_BINS, kde_from_bins, trend_line
+
+SKETCH_BINS = KDE_BINS
+DEFAULT_CHUNKSIZE = 250_000
+RESERVOIR_SIZE = 50_000
+
+# Sketch ranges per column; values outside are counted in the end bins
+SKETCH_RANGES = {
+    'EDSen_mech': (0.0, 100.0),
+    'EnTot_final100km': (0.0, 250.0),
+    'EnICE_final100km': (0.0, 250.0),
+    'EnEl_final100km': (0.0, 250.0),
+    'Mass': (500.0, 4000.0),
+}
+
+# Figure 5 / Figure 7 binning
+EDS_BINS = 20
+MASS_GRID_BINS = 20
+
+ENERGY_COLUMNS = ['EnTot_final100km', 'EnICE_final100km', 'EnEl_final100km']
+TREND_COLUMNS = ['Electric_range', 'Mileage_Tot', 'Mass', 'AER_to_Mass']
+LOG_TREND_COLUMNS = {'Mileage_Tot'}
+
+
+class GroupedSketch:
+    """Mergeable fixed-bin histogram of one value column per group key."""
+
+    def __init__(self, lo, hi, bins=SKETCH_BINS):
+        self.lo, self.hi, self.bins = float(lo), float(hi), int(bins)
+        self.width = (self.hi - self.lo) / self.bins
+        self.keys = []
+        self._rows = {}
+        self.counts = np.zeros((0, self.bins), dtype=np.int64)
+        self.total = np.zeros(0)
+        self.total_sq = np.zeros(0)
+        self.vmin = np.zeros(0)
+        self.vmax = np.zeros(0)
+
+    def _grow(self, new_keys):
+        for key in new_keys:
+            self._rows[key] = len(self.keys)
+            self.keys.append(key)
+        extra = len(new_keys)
+        self.counts = np.vstack([self.counts, np.zeros((extra, self.bins), dtype=np.int64)])
+        self.total = np.concatenate([self.total, np.zeros(extra)])
+        self.total_sq = np.concatenate([self.total_sq, np.zeros(extra)])
+        self.vmin = np.concatenate([self.vmin, np.full(extra, np.inf)])
+        self.vmax = np.concatenate([self.vmax, np.full(extra, -np.inf)])
+
+    def _row_codes(self, keys):
+        codes, uniques = pd.factorize(np.asarray(keys, dtype=object))
+        new_keys = [key for key in uniques if key not in self._rows]
+        if new_keys:
+            self._grow(new_keys)
+        return np.array([self._rows[key] for key in uniques], dtype=np.int64)[codes]
+
+    def update(self, values, keys=None):
+        """Add one chunk of values, grouped by `keys` (default: a single group)."""
+        x = np.asarray(values, dtype=np.float64)
+        valid = np.isfinite(x)
+        if keys is None:
+            keys = np.zeros(len(x), dtype=np.int64)
+        else:
+            keys = np.asarray(pd.Series(keys).astype(object))
+            valid &= pd.notna(keys)
+        x, keys = x[valid], keys[valid]
+        if not len(x):
+            return
+        rows = self._row_codes(keys)
+        ngroups = len(self.keys)
+        b = np.clip(((x - self.lo) / self.width).astype(np.int64), 0, self.bins - 1)
+        self.counts += np.bincount(rows * self.bins + b,
+                                   minlength=ngroups * self.bins).reshape(ngroups, self.bins)
+        self.total += np.bincount(rows, weights=x, minlength=ngroups)
+        self.total_sq += np.bincount(rows, weights=x * x, minlength=ngroups)
+        np.minimum.at(self.vmin, rows, x)
+        np.maximum.at(self.vmax, rows, x)
+
+    def merge(self, other):
+        """Fold another sketch with the same range and bins into this one."""
+        new_keys = [key for key in other.keys if key not in self._rows]
+        if new_keys:
+            self._grow(new_keys)
+        rows = np.array([self._rows[key] for key in other.keys], dtype=np.int64)
+        self.counts[rows] += other.counts
+        self.total[rows] += other.total
+        self.total_sq[rows] += other.total_sq
+        self.vmin[rows] = np.minimum(self.vmin[rows], other.vmin)
+        self.vmax[rows] = np.maximum(self.vmax[rows], other.vmax)
+        return self
+
+    @property
+    def n(self):
+        return self.counts.sum(axis=1)
+
+    def mean(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.total / self.n
+
+    def std(self):
+        n = self.n
+        with np.errstate(invalid='ignore', divide='ignore'):
+            var = (self.total_sq - self.total ** 2 / n) / (n - 1)
+        return np.sqrt(np.maximum(var, 0))
+
+    def centres(self):
+        return self.lo + self.width * (np.arange(self.bins) + 0.5)
+
+    def quantile(self, q):
+        """Per-group quantile, linear within the bin holding the target rank."""
+        n = self.n
+        out = np.full(len(self.keys), np.nan)
+        cum = np.cumsum(self.counts, axis=1)
+        for row in np.flatnonzero(n):
+            rank = q * (n[row] - 1) + 0.5
+            i = min(int(np.searchsorted(cum[row], rank, side='left')), self.bins - 1)
+            before = cum[row, i - 1] if i else 0
+            frac = (rank - before) / self.counts[row, i] if self.counts[row, i] else 0.5
+            value = self.lo + self.width * (i + frac)
+            out[row] = min(max(value, self.vmin[row]), self.vmax[row])
+        return out
+
+    def stats(self, name, stats=('n', 'median', 'q25', 'q75', 'mean'), key_name='key'):
+        """grouped_stats()-style frame: key column plus '<name>_<stat>' columns."""
+        levels = {'median': 0.5, 'q25': 0.25, 'q75': 0.75}
+        result = pd.DataFrame({key_name: self.keys})
+        for stat in stats:
+            if stat == 'n':
+                result[f'{name}_n'] = self.n
+            elif stat == 'mean':
+                result[f'{name}_mean'] = self.mean()
+            elif stat == 'iqr':
+                result[f'{name}_iqr'] = self.quantile(0.75) - self.quantile(0.25)
+            else:
+                result[f'{name}_{stat}'] = self.quantile(levels[stat])
+        return result
+
+    def histogram(self, key, bins=100):
+        """Density histogram of one group over its exact [min, max]."""
+        row = self._rows[key]
+        edges = np.linspace(self.vmin[row], self.vmax[row], bins + 1)
+        fine_edges = self.lo + self.width * np.arange(self.bins + 1)
+        cdf = np.concatenate(([0], np.cumsum(self.counts[row])))
+        mass = np.diff(np.interp(edges, fine_edges, cdf))
+        return mass / (mass.sum() * np.diff(edges)), edges
+
+    def kde(self, key, grid):
+        """Scott-bandwidth Gaussian KDE of one group on `grid`."""
+        row = self._rows[key]
+        bandwidth = self.std()[row] * self.n[row] ** (-1 / 5)
+        return kde_from_bins(self.counts[row], self.centres(), bandwidth, grid)
+
+
+class TrendSums:
+    """Mergeable least-squares sums for y = slope * x + intercept."""
+
+    def __init__(self):
+        self.n = 0
+        self.sx = self.sy = self.sxx = self.sxy = 0.0
+        self.xmin, self.xmax = np.inf, -np.inf
+
+    def update(self, x, y):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        valid = np.isfinite(x) & np.isfinite(y)
+        x, y = x[valid], y[valid]
+        if not len(x):
+            return
+        self.n += len(x)
+        self.sx += x.sum()
+        self.sy += y.sum()
+        self.sxx += x @ x
+        self.sxy += x @ y
+        self.xmin = min(self.xmin, x.min())
+        self.xmax = max(self.xmax, x.max())
+
+    def merge(self, other):
+        self.n += other.n
+        self.sx += other.sx
+        self.sy += other.sy
+        self.sxx += other.sxx
+        self.sxy += other.sxy
+        self.xmin = min(self.xmin, other.xmin)
+        self.xmax = max(self.xmax, other.xmax)
+        return self
+
+    def fit(self):
+        """(slope, intercept) of the ordinary least-squares line."""
+        denominator = self.n * self.sxx - self.sx ** 2
+        slope = (self.n * self.sxy - self.sx * self.sy) / denominator
+        return slope, (self.sy - slope * self.sx) / self.n
+
+
+class Reservoir:
+    """Uniform fixed-size sample of rows: the rows with the smallest random keys."""
+
+    def __init__(self, size=RESERVOIR_SIZE, seed=0):
+        self.size = size
+        self.rng = np.random.default_rng(seed)
+        self.priority = np.zeros(0)
+        self.rows = None
+
+    def _keep(self, rows, priority):
+        if len(rows) > self.size:
+            keep = np.argpartition(priority, self.size - 1)[:self.size]
+            rows, priority = rows.iloc[keep], priority[keep]
+        self.rows = rows.reset_index(drop=True)
+        self.priority = priority
+
+    def update(self, chunk):
+        self.merge_rows(chunk, self.rng.random(len(chunk)))
+
+    def merge_rows(self, rows, priority):
+        if self.rows is not None:
+            rows = pd.concat([self.rows, rows], ignore_index=True)
+            priority = np.concatenate([self.priority, priority])
+        self._keep(rows, priority)
+
+    def merge(self, other):
+        if other.rows is not None:
+            self.merge_rows(other.rows, other.priority)
+        return self
+
+
+def _sketch(column):
+    return GroupedSketch(*SKETCH_RANGES[column])
+
+
+class FigureAggregates:
+    """Everything the nine figures need, accumulated chunk by chunk."""
+
+    def __init__(self, seed=0):
+        self.n_records = 0
+        self.eds = _sketch('EDSen_mech')                      # Figures 1, 2, 3
+        self.eds_by_country = _sketch('EDSen_mech')
+        self.eds_by_period = _sketch('EDSen_mech')
+        self.energy = _sketch('EnTot_final100km')             # Figure 6
+        self.energy_by_eds_bin = {c: _sketch(c) for c in ENERGY_COLUMNS}   # Figure 5
+        self.energy_by_cell = _sketch('EnTot_final100km')     # Figure 7
+        self.region = {c: _sketch(c) for c in ('EnTot_final100km', 'EDSen_mech')}  # Figure 8
+        self.mass_cat = {c: _sketch(c) for c in ('EDSen_mech', 'EnTot_final100km', 'Mass')}  # Figure 9
+        self.trends = {c: TrendSums() for c in TREND_COLUMNS}  # Figure 4
+        self.sample = Reservoir(seed=seed)
+        self.columns = set()
+
+    def update(self, chunk):
+        """Fold one chunk (a DataFrame with some of PHEV_COLUMNS) into the aggregates."""
+        self.n_records += len(chunk)
+        self.columns.update(chunk.columns)
+        eds = chunk['EDSen_mech']
+
+        self.eds.update(eds)
+        if 'Country' in chunk.columns:
+            self.eds_by_country.update(eds, chunk['Country'])
+        self.eds_by_period.update(eds, period_labels(chunk))
+        self.energy.update(chunk['EnTot_final100km'])
+
+        complete = chunk[['EDSen_mech'] + ENERGY_COLUMNS].dropna()
+        eds_bin = eds_bin_codes(complete['EDSen_mech'])
+        for column, sketch in self.energy_by_eds_bin.items():
+            sketch.update(complete[column], eds_bin)
+
+        cells = chunk[['Mass', 'EDSen_mech', 'EnTot_final100km']].dropna()
+        mass_lo, mass_hi = SKETCH_RANGES['Mass']
+        mass_bin = np.clip(((cells['Mass'].to_numpy() - mass_lo)
+                            / (mass_hi - mass_lo) * MASS_GRID_BINS).astype(np.int64),
+                           0, MASS_GRID_BINS - 1)
+        self.energy_by_cell.update(cells['EnTot_final100km'],
+                                   mass_bin * EDS_BINS + eds_bin_codes(cells['EDSen_mech']))
+
+        if 'Region' in chunk.columns:
+            regional = chunk[['Region', 'EnTot_final100km', 'EDSen_mech']].dropna()
+            for column, sketch in self.region.items():
+                sketch.update(regional[column], regional['Region'])
+
+        by_mass = cells.assign(mass_cat=mass_category(cells['Mass'])).dropna()
+        for column, sketch in self.mass_cat.items():
+            sketch.update(by_mass[column], by_mass['mass_cat'])
+
+        for column, sums in self.trends.items():
+            if column in chunk.columns:
+                x = chunk[column].to_numpy(dtype=np.float64, na_value=np.nan)
+                if column in LOG_TREND_COLUMNS:
+                    with np.errstate(divide='ignore', invalid='ignore'):
+                        x = np.log10(x)
+                sums.update(x, eds.to_numpy(dtype=np.float64, na_value=np.nan))
+
+        self.sample.update(chunk[[c for c in ['EDSen_mech'] + TREND_COLUMNS
+                                  if c in chunk.columns]])
+
+    def merge(self, other):
+        """Fold aggregates computed on another part of the data into these."""
+        self.n_records += other.n_records
+        self.columns |= other.columns
+        for name in ('eds', 'eds_by_country', 'eds_by_period', 'energy', 'energy_by_cell'):
+            getattr(self, name).merge(getattr(other, name))
+        for name in ('energy_by_eds_bin', 'region', 'mass_cat', 'trends'):
+            for column, part in getattr(other, name).items():
+                getattr(self, name)[column].merge(part)
+        self.sample.merge(other.sample)
+        return self
+
+
+def eds_bin_codes(eds):
+    """Figure 5/7 EDS bin (0..EDS_BINS-1) over the fixed 0-100 % range."""
+    lo, hi = SKETCH_RANGES['EDSen_mech']
+    codes = ((np.asarray(eds, dtype=np.float64) - lo) / (hi - lo) * EDS_BINS).astype(np.int64)
+    return np.clip(codes, 0, EDS_BINS - 1)
+
+
+def read_chunks(path, chunksize=DEFAULT_CHUNKSIZE, columns=PHEV_COLUMNS, transform=None):
+    """Yield schema-compacted DataFrame chunks of `columns` from a CSV file."""
+    header = pd.read_csv(path, nrows=0)
+    usecols = None if transform else [c for c in columns if c in header.columns]
+    for chunk in pd.read_csv(path, usecols=usecols, chunksize=chunksize, low_memory=False):
+        if transform is not None:
+            chunk = transform(chunk)
+            chunk = chunk[[c for c in columns if c in chunk.columns]]
+        yield apply_schema(chunk)
+
+
+def aggregate_csv(path, chunksize=DEFAULT_CHUNKSIZE, transform=None, seed=0):
+    """Stream a CSV through FigureAggregates, one chunk in memory at a time."""
+    aggregates = FigureAggregates(seed=seed)
+    for chunk in read_chunks(path, chunksize, transform=transform):
+        aggregates.update(chunk)
+    return aggregates
+
+
+def _distribution(sketch, n_records, points=200):
+    key = sketch.keys[0]
+    row = sketch._rows[key]
+    density, edges = sketch.histogram(key)
+    kde_x = np.linspace(sketch.vmin[row], sketch.vmax[row], points)
+    return dict(n_records=n_records, edges=edges, density=density,
+                kde_x=kde_x, kde_y=sketch.kde(key, kde_x),
+                median=sketch.quantile(0.5)[row], q25=sketch.quantile(0.25)[row],
+                q75=sketch.quantile(0.75)[row])
+
+
+def _curves(sketch, order, label, points=200):
+    rows = [sketch._rows[key] for key in order if key in sketch._rows]
+    x_range = np.linspace(sketch.vmin[rows].min(), sketch.vmax[rows].max(), points)
+    return [(label(key), x_range, sketch.kde(key, x_range))
+            for key in order if key in sketch._rows and sketch.n[sketch._rows[key]] > 1]
+
+
+def figure_summaries(agg, fig_ids):
+    """Per-figure summaries from the aggregates, shaped like compute_figureNN()."""
+    out = {}
+    eds_lo, eds_hi = SKETCH_RANGES['EDSen_mech']
+    eds_centres = eds_lo + (np.arange(EDS_BINS) + 0.5) * (eds_hi - eds_lo) / EDS_BINS
+
+    if 'figure01' in fig_ids:
+        out['figure01'] = _distribution(agg.eds, agg.n_records)
+
+    if 'figure02' in fig_ids:
+        out['figure02'] = {'country_eds': agg.eds_by_country.stats(
+            'EDSen_mech', ('n', 'median', 'q25', 'q75'), key_name='Country')}
+
+    if 'figure03' in fig_ids:
+        periods = sorted(agg.eds_by_period.keys)
+        eds_by_period = agg.eds_by_period.stats('EDSen_mech', ('n', 'median', 'mean'),
+                                                key_name='period')
+        out['figure03'] = {
+            'curves': _curves(agg.eds_by_period, periods, lambda p: f'Period {p}'),
+            'eds_by_period': eds_by_period.sort_values('period').reset_index(drop=True),
+        }
+
+    if 'figure04' in fig_ids:
+        sample = agg.sample.rows
+        panels = []
+        for column in TREND_COLUMNS:
+            sums = agg.trends[column]
+            if column not in agg.columns or sums.n < 2:
+                panels.append(None)
+                continue
+            slope, intercept = sums.fit()
+            points = sample[[column, 'EDSen_mech']].dropna()
+            log = column in LOG_TREND_COLUMNS
+            x_min, x_max = (10 ** sums.xmin, 10 ** sums.xmax) if log else (sums.xmin, sums.xmax)
+            line_x, line_y = trend_line(slope, intercept, x_min, x_max, log)
+            panels.append(dict(x=points[column].to_numpy(dtype=np.float64),
+                               y=points['EDSen_mech'].to_numpy(dtype=np.float64),
+                               line_x=line_x, line_y=line_y))
+        out['figure04'] = {'panels': panels}
+
+    if 'figure05' in fig_ids:
+        frames = [sketch.stats(column, ('median',), key_name='eds_bin')
+                  for column, sketch in agg.energy_by_eds_bin.items()]
+        energy_by_eds = frames[0]
+        for frame in frames[1:]:
+            energy_by_eds = energy_by_eds.merge(frame, on='eds_bin')
+        energy_by_eds = energy_by_eds.rename(
+            columns={f'{c}_median': c for c in ENERGY_COLUMNS}).sort_values('eds_bin')
+        energy_by_eds['eds_center'] = eds_centres[energy_by_eds['eds_bin'].astype(int)]
+        out['figure05'] = {'energy_by_eds': energy_by_eds.reset_index(drop=True)}
+
+    if 'figure06' in fig_ids:
+        out['figure06'] = _distribution(agg.energy, agg.n_records)
+
+    if 'figure07' in fig_ids:
+        mass_lo, mass_hi = SKETCH_RANGES['Mass']
+        mass_centres = mass_lo + (np.arange(MASS_GRID_BINS) + 0.5) * (mass_hi - mass_lo) / MASS_GRID_BINS
+        cells = agg.energy_by_cell.stats('EnTot_final100km', ('median',), key_name='cell')
+        cells['mass_center'] = mass_centres[cells['cell'].astype(int) // EDS_BINS]
+        cells['eds_center'] = eds_centres[cells['cell'].astype(int) % EDS_BINS]
+        out['figure07'] = {'heatmap': cells.pivot(index='mass_center', columns='eds_center',
+                                                  values='EnTot_final100km_median')}
+
+    if 'figure08' in fig_ids:
+        if 'Region' not in agg.columns:
+            print("Region variable not found, skipping Figure 8")
+            out['figure08'] = None
+        else:
+            energy = agg.region['EnTot_final100km'].stats(
+                'EnTot_final100km', ('n', 'median', 'q25', 'q75'), key_name='Region')
+            eds = agg.region['EDSen_mech'].stats(
+                'EDSen_mech', ('n', 'median', 'q25', 'q75'), key_name='Region')
+            out['figure08'] = {'regional_summary': energy.merge(eds, on='Region')
+                               .sort_values('Region').reset_index(drop=True)}
+
+    if 'figure09' in fig_ids:
+        order = [label for label in MASS_LABELS if label in agg.mass_cat['EDSen_mech'].keys]
+        mass_summary = None
+        for column, sketch in agg.mass_cat.items():
+            frame = sketch.stats(column, ('n', 'median'), key_name='mass_cat')
+            mass_summary = frame if mass_summary is None else mass_summary.merge(frame, on='mass_cat')
+        mass_summary = mass_summary.set_index('mass_cat').loc[order].reset_index()
+        out['figure09'] = {'curves': _curves(agg.mass_cat['EDSen_mech'], order, str),
+                           'mass_summary': mass_summary}
+
+    return out
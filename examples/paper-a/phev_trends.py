@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Batched trend fits for the Figure 4 panels.
+
+trend_sums() reduces EDS against every candidate regressor to the
+least-squares sufficient statistics (n, Σx, Σy, Σxx, Σxy) in one pass,
+each regressor over its own complete rows, and solve_trends() solves all
+the 2 x 2 normal equations at once. binned_trend() is the nonparametric
+companion: the mean and median of y in bins of x over the full data,
+from the sorted-group engine in phev_stats.
+
+The bootstrap bands never refit on resampled rows. The rows are split
+into TREND_GROUPS random groups and the sufficient statistics are kept
+per group; a bootstrap replicate resamples groups, so its statistics are
+one weighted sum, and all replicates together are a single matrix product
+followed by solve_trends(). For iid rows, resampling random groups is a
+bootstrap of the rows in blocks of n / TREND_GROUPS.
+"""
+
+import numpy as np
+
+from phev_stats import bin_centres, binned_stats
+
+# Random row groups kept for the bootstrap
+TREND_GROUPS = 256
+BOOTSTRAP_REPLICATES = 1000
+BOOTSTRAP_SEED = 0
+# Two-sided coverage of the bootstrap bands
+BAND_LEVEL = 0.95
+# Bins of the binned smoother, spread over this central quantile range of x
+SMOOTH_BINS = 30
+SMOOTH_RANGE = (0.005, 0.995)
+# Bins with fewer rows are left out of the smoother
+SMOOTH_MIN_COUNT = 50
+
+# Order of the sufficient statistics in the last axis of trend_sums()
+SUMS = ('n', 'sx', 'sy', 'sxx', 'sxy')
+
+
+def trend_sums(x, y, groups=None, ngroups=1):
+    """Sufficient statistics of y against each column of `x`.
+
+    `x` is (n,) or (n, k), `y` (n,). Rows where either value is missing are
+    left out per column. Returns an array of shape (ngroups, k, 5) holding
+    SUMS per group code in `groups` (default: one group).
+    """
+    x = np.asarray(x, dtype=np.float64)
+    x = x[:, None] if x.ndim == 1 else x
+    y = np.asarray(y, dtype=np.float64)
+    groups = np.zeros(len(y), dtype=np.intp) if groups is None else np.asarray(groups)
+
+    valid = np.isfinite(x) & np.isfinite(y)[:, None]
+    xv = np.where(valid, x, 0.0)
+    yv = np.where(valid, y[:, None], 0.0)
+    terms = (valid, xv, yv, xv * xv, xv * yv)
+    sums = np.empty((ngroups, x.shape[1], len(SUMS)))
+    for j in range(x.shape[1]):
+        for s, term in enumerate(terms):
+            sums[:, j, s] = np.bincount(groups, weights=term[:, j], minlength=ngroups)
+    return sums
+
+
+def solve_trends(sums):
+    """(slope, intercept) arrays from sufficient statistics of shape (..., 5).
+
+    Closed-form solution of every 2 x 2 normal equation at once; NaN where
+    a regressor has fewer than two distinct values.
+    """
+    n, sx, sy, sxx, sxy = np.moveaxis(np.asarray(sums, dtype=np.float64), -1, 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = (n * sxy - sx * sy) / (n * sxx - sx * sx)
+        intercept = (sy - slope * sx) / n
+    return slope, intercept
+
+
+def group_labels(n, ngroups=TREND_GROUPS, seed=BOOTSTRAP_SEED):
+    """Seeded random group per row, for the bootstrap."""
+    return np.random.default_rng(seed).integers(ngroups, size=n)
+
+
+def bootstrap_weights(ngroups, replicates=BOOTSTRAP_REPLICATES, seed=BOOTSTRAP_SEED):
+    """(replicates, ngroups) times each group is drawn, resampling groups with replacement."""
+    rng = np.random.default_rng(seed)
+    return rng.multinomial(ngroups, np.full(ngroups, 1 / ngroups), size=replicates).astype(np.float64)
+
+
+def bootstrap_trends(group_sums, weights):
+    """(slopes, intercepts) of every replicate, each of shape (replicates, k)."""
+    return solve_trends(np.tensordot(weights, group_sums, axes=1))
+
+
+def line_band(slopes, intercepts, grid, level=BAND_LEVEL):
+    """Pointwise percentile band of the replicate lines over `grid`: (lower, upper)."""
+    lines = slopes[:, None] * grid[None, :] + intercepts[:, None]
+    alpha = (1 - level) / 2
+    lower, upper = np.nanquantile(lines, [alpha, 1 - alpha], axis=0)
+    return lower, upper
+
+
+def smooth_edges(x, bins=SMOOTH_BINS, quantiles=SMOOTH_RANGE):
+    """Equal-width bin edges over the central quantile range of the finite `x`."""
+    x = np.asarray(x, dtype=np.float64)
+    lo, hi = np.quantile(x[np.isfinite(x)], quantiles)
+    if lo == hi:
+        lo, hi = lo - 0.5, hi + 0.5
+    return np.linspace(lo, hi, bins + 1)
+
+
+def equal_width_codes(x, edges):
+    """Bin index per value for equal-width `edges`, -1 when missing or outside.
+
+    Arithmetic rather than a search, so O(n); values on an inner edge may
+    land in either neighbouring bin.
+    """
+    nbins = len(edges) - 1
+    lo, hi = edges[0], edges[-1]
+    with np.errstate(invalid='ignore'):
+        inside = (x >= lo) & (x <= hi)
+        codes = np.minimum(((x - lo) * (nbins / (hi - lo))).astype(np.intp), nbins - 1)
+    codes[~inside] = -1
+    return codes
+
+
+def binned_trend(x, y, edges, groups=None, weights=None, stats=('n', 'mean', 'median'),
+                 level=BAND_LEVEL, min_count=SMOOTH_MIN_COUNT):
+    """Statistics of y per bin of x, for equal-width `edges` (see smooth_edges()).
+
+    Returns a dict of arrays over the bins with at least `min_count` rows:
+    'x' (bin centres) and `stats` (binned_stats() names; must include 'n').
+    With row `groups` and bootstrap `weights` (as for bootstrap_trends()),
+    also the bootstrap band of the means, 'mean_lower' and 'mean_upper'.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    nbins = len(edges) - 1
+    codes = equal_width_codes(x, edges)
+    codes[~np.isfinite(y)] = -1
+    out = binned_stats(codes, nbins, y, stats)
+    out['x'] = bin_centres(edges)
+
+    if groups is not None and weights is not None:
+        ngroups = weights.shape[1]
+        keep = codes >= 0
+        cells = groups[keep] * nbins + codes[keep]
+        counts = np.bincount(cells, minlength=ngroups * nbins).reshape(ngroups, nbins)
+        totals = np.bincount(cells, weights=y[keep],
+                             minlength=ngroups * nbins).reshape(ngroups, nbins)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means = (weights @ totals) / (weights @ counts)
+        alpha = (1 - level) / 2
+        out['mean_lower'], out['mean_upper'] = np.nanquantile(means, [alpha, 1 - alpha], axis=0)
+
+    shown = out['n'] >= min_count
+    return {name: np.asarray(values)[shown] for name, values in out.items()}
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Per-stage timing and memory report for the figure script's --report mode.
+
+RunReport.stage(name) wraps one stage of a run (loading the data, a
+figure's compute, draw or save phase) and records its wall time, CPU time
+and how far it pushed the process's peak RSS. With trace_memory the stage
+is also traced with tracemalloc: the peak of Python allocations during the
+stage and the source lines holding the most new memory at its end.
+Tracing slows the run down several times, so it is opt-in.
+
+RunReport.profile(name) runs a block under cProfile and dumps the stats to
+<profile_dir>/<name>.pstats, for `python -m pstats` or snakeviz.
+
+The report is written as JSON or Markdown (save()), and the records are
+plain dicts so worker processes can send theirs back to the parent.
+"""
+
+import contextlib
+import cProfile
+import json
+import os
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+REPORT_VERSION = 1
+# Allocation sites listed per stage with trace_memory
+TOP_ALLOCATIONS = 5
+# tracemalloc frames kept per allocation
+TRACE_FRAMES = 1
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes, or None if unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _size(nbytes):
+    return f"{nbytes / 2**20:.1f} MiB" if nbytes >= 2**20 else f"{nbytes / 2**10:.1f} KiB"
+
+
+def _allocations(before, after, top):
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__),
+               tracemalloc.Filter(False, '<frozen importlib._bootstrap*>')]
+    diff = after.filter_traces(filters).compare_to(before.filter_traces(filters), 'lineno')
+    sites = []
+    for stat in diff:
+        if stat.size_diff <= 0:
+            continue
+        frame = stat.traceback[0]
+        sites.append({'where': f"{frame.filename}:{frame.lineno}",
+                      'bytes': stat.size_diff, 'count': stat.count_diff})
+        if len(sites) == top:
+            break
+    return sites
+
+
+class RunReport:
+    """Stage records of one run of the figure script."""
+
+    def __init__(self, trace_memory=False, profile_dir=None, top=TOP_ALLOCATIONS):
+        self.trace_memory = trace_memory
+        self.profile_dir = Path(profile_dir) if profile_dir else None
+        self.top = top
+        self.stages = []
+        self.profiles = []
+        self.imports = None
+        self.started = time.strftime('%Y-%m-%dT%H:%M:%S')
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACE_FRAMES)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Record the wall/CPU time and memory growth of the enclosed block."""
+        record = {'name': name, 'pid': os.getpid()}
+        rss_before = peak_rss()
+        snapshot = None
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            snapshot = tracemalloc.take_snapshot()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall'] = time.perf_counter() - wall
+            record['cpu'] = time.process_time() - cpu
+            rss_after = peak_rss()
+            record['peak_rss'] = rss_after
+            record['peak_rss_delta'] = (rss_after - rss_before
+                                        if rss_before is not None else None)
+            if snapshot is not None:
+                record['traced_peak'] = tracemalloc.get_traced_memory()[1]
+                record['allocations'] = _allocations(snapshot, tracemalloc.take_snapshot(),
+                                                     self.top)
+            self.stages.append(record)
+
+    @contextlib.contextmanager
+    def profile(self, name):
+        """Run the block under cProfile if a profile directory is set."""
+        if self.profile_dir is None:
+            yield None
+            return
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield profiler
+        finally:
+            profiler.disable()
+            self.profile_dir.mkdir(parents=True, exist_ok=True)
+            path = self.profile_dir / f"{name}.pstats"
+            profiler.dump_stats(path)
+            self.profiles.append(str(path))
+
+    def extend(self, stages, profiles=()):
+        """Add the records sent back by a worker process."""
+        self.stages.extend(stages)
+        self.profiles.extend(profiles)
+
+    def to_dict(self):
+        return {'version': REPORT_VERSION,
+                'started': self.started,
+                'python': sys.version.split()[0],
+                'trace_memory': self.trace_memory,
+                'stages': self.stages,
+                'profiles': self.profiles,
+                'imports': self.imports}
+
+    def to_markdown(self):
+        lines = [f"# Figure run report ({self.started})", "",
+                 "| Stage | Wall (s) | CPU (s) | Peak RSS +MiB | Traced peak MiB |",
+                 "|---|---:|---:|---:|---:|"]
+        for record in self.stages:
+            rss, traced = record.get('peak_rss_delta'), record.get('traced_peak')
+            rss_text = f"{rss / 2**20:.1f}" if rss is not None else "-"
+            traced_text = f"{traced / 2**20:.1f}" if traced is not None else "-"
+            lines.append(f"| {record['name']} | {record['wall']:.2f} | {record['cpu']:.2f} "
+                         f"| {rss_text} | {traced_text} |")
+        total_wall = sum(record['wall'] for record in self.stages)
+        total_cpu = sum(record['cpu'] for record in self.stages)
+        lines.append(f"| **total** | {total_wall:.2f} | {total_cpu:.2f} | | |")
+
+        allocating = [record for record in self.stages if record.get('allocations')]
+        if allocating:
+            lines += ["", "## Top allocations", ""]
+            for record in allocating:
+                lines.append(f"**{record['name']}**")
+                lines.append("")
+                for site in record['allocations']:
+                    lines.append(f"- {_size(site['bytes'])} in {site['count']:,} blocks: "
+                                 f"`{site['where']}`")
+                lines.append("")
+        if self.imports:
+            lines += ["", "## Imports", "",
+                      f"{self.imports['total']:.2f}s in {self.imports['modules']} modules", ""]
+            lines += [f"- {package}: {seconds * 1000:.1f} ms"
+                      for package, seconds in self.imports['packages']]
+        if self.profiles:
+            lines += ["", "## Profiles", ""] + [f"- `{path}`" for path in self.profiles]
+        return "\n".join(lines) + "\n"
+
+    def save(self, path):
+        """Write the report as Markdown (.md) or JSON (anything else)."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        text = (self.to_markdown() if path.suffix == '.md'
+                else json.dumps(self.to_dict(), indent=2) + "\n")
+        tmp_path = path.with_name(path.name + '.tmp')
+        tmp_path.write_text(text)
+        os.replace(tmp_path, path)
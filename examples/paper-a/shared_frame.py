@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+DataFrame columns in shared memory, for the figure server.
+
+SharedFrame.create() copies each column of a frame into its own
+multiprocessing.shared_memory block once; SharedFrame.attach() in another
+process maps the same blocks and frame() wraps them in a DataFrame without
+copying. Only a small, picklable spec (block names, dtypes, categories)
+crosses the process boundary.
+
+Column layouts: plain NumPy columns are one block; categoricals keep their
+codes in a block and their categories in the spec; nullable (masked)
+columns such as Int16 are a values block and a mask block. Other columns
+(strings, objects) are shared as categoricals. The attached arrays are
+read-only, so a figure cannot change the data under the others.
+"""
+
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+# Nullable array types stored as values + mask
+MASKED_ARRAYS = (pd.arrays.IntegerArray, pd.arrays.FloatingArray, pd.arrays.BooleanArray)
+
+
+def _share(array, blocks):
+    array = np.ascontiguousarray(array)
+    # Zero-size blocks are not allowed
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+    blocks.append(block)
+    return {'block': block.name, 'dtype': array.dtype.str}
+
+
+class SharedFrame:
+    """A frame whose columns live in shared memory blocks."""
+
+    def __init__(self, spec, blocks, owner=False):
+        self.spec = spec
+        self.blocks = {block.name: block for block in blocks}
+        self.owner = owner
+
+    @classmethod
+    def create(cls, df):
+        """Copy `df` into new shared memory blocks (the caller owns and unlinks them)."""
+        blocks = []
+        columns = []
+        try:
+            for name in df.columns:
+                values = df[name]
+                column = {'name': name}
+                if isinstance(values.array, MASKED_ARRAYS):
+                    mask = values.isna().to_numpy()
+                    filled = values.to_numpy(dtype=values.dtype.numpy_dtype,
+                                             na_value=values.dtype.numpy_dtype.type(0))
+                    column.update(kind='masked', dtype=str(values.dtype),
+                                  values=_share(filled, blocks), mask=_share(mask, blocks))
+                elif isinstance(values.dtype, np.dtype) and values.dtype.kind in 'biufcmM':
+                    column.update(kind='array', values=_share(values.to_numpy(), blocks))
+                else:
+                    categorical = values.astype('category').array
+                    column.update(kind='category', values=_share(categorical.codes, blocks),
+                                  categories=categorical.categories,
+                                  ordered=categorical.ordered)
+                columns.append(column)
+        except BaseException:
+            for block in blocks:
+                block.close()
+                block.unlink()
+            raise
+        spec = {'rows': len(df), 'columns': columns, 'attrs': dict(df.attrs)}
+        return cls(spec, blocks, owner=True)
+
+    @classmethod
+    def attach(cls, spec):
+        """Map the blocks of a frame shared by another process."""
+        names = [part['block'] for column in spec['columns']
+                 for part in (column['values'], column.get('mask')) if part]
+        return cls(spec, [shared_memory.SharedMemory(name=name) for name in names])
+
+    def _view(self, part):
+        array = np.ndarray((self.spec['rows'],), dtype=np.dtype(part['dtype']),
+                           buffer=self.blocks[part['block']].buf)
+        array.flags.writeable = False
+        return array
+
+    def frame(self):
+        """The shared data as a DataFrame of read-only, zero-copy views."""
+        data = {}
+        for column in self.spec['columns']:
+            values = self._view(column['values'])
+            if column['kind'] == 'masked':
+                dtype = pd.api.types.pandas_dtype(column['dtype'])
+                values = dtype.construct_array_type()(values, self._view(column['mask']),
+                                                      copy=False)
+            elif column['kind'] == 'category':
+                values = pd.Categorical.from_codes(values, dtype=pd.CategoricalDtype(
+                    column['categories'], column['ordered']), validate=False)
+            data[column['name']] = pd.Series(values, name=column['name'], copy=False)
+        df = pd.DataFrame(data, copy=False)
+        df.attrs.update(self.spec['attrs'])
+        return df
+
+    def nbytes(self):
+        return sum(block.size for block in self.blocks.values())
+
+    def close(self):
+        for block in self.blocks.values():
+            try:
+                block.close()
+            except BufferError:
+                # A frame from frame() is still alive; the mapping goes with the process
+                pass
+
+    def unlink(self):
+        """Close and, in the creating process, free the blocks."""
+        self.close()
+        if self.owner:
+            for block in self.blocks.values():
+                block.unlink()
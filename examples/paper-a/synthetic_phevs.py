@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Synthetic OBFCM-shaped PHEV data, for benchmarks and for trying the figure
+scripts without the private dataset.
+
+synthetic_phevs() draws a frame with the columns the figures read
+(PHEV_COLUMNS) plus OEM and Model, in the dtypes of the RDS source (doubles
+and strings), with plausible distributions and cardinalities: ~30 countries
+in 4 regions with a skewed fleet share, ~25 OEMs with ~120 models that set
+the mass and electric range, a bimodal EDS that rises with the range, and
+energies that add up (EnTot = EnEl + EnICE). A few percent of the
+measurements are missing. The numbers are only realistic in shape; nothing
+here is fitted to the real data.
+
+write_dataset() saves the frame as data/processed/obfcm_phevs_unflagged.pkl
+(or under another directory), the pickle fallback load_phevs() reads.
+
+Usage:
+    python3 synthetic_phevs.py --rows 1M --output-dir /tmp/phevs
+"""
+
+import argparse
+import os
+import pickle
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from phev_data import DATASET_NAME, data_dir
+
+SYNTHETIC_SEED = 0
+
+# Dataset sizes the benchmarks use
+SIZES = {'100k': 100_000, '1M': 1_000_000, '2.5M': 2_500_000}
+
+# Country (EU + IS, NO) -> region, roughly in order of PHEV fleet size
+COUNTRIES = {
+    'DE': 'Western Europe', 'FR': 'Western Europe', 'SE': 'Northern Europe',
+    'IT': 'Southern Europe', 'BE': 'Western Europe', 'NL': 'Western Europe',
+    'ES': 'Southern Europe', 'AT': 'Western Europe',
+    'DK': 'Northern Europe', 'FI': 'Northern Europe', 'NO': 'Northern Europe',
+    'PL': 'Eastern Europe', 'PT': 'Southern Europe',
+    'IE': 'Northern Europe', 'CZ': 'Eastern Europe', 'LU': 'Western Europe',
+    'HU': 'Eastern Europe', 'GR': 'Southern Europe', 'SK': 'Eastern Europe',
+    'RO': 'Eastern Europe', 'SI': 'Southern Europe', 'HR': 'Southern Europe',
+    'IS': 'Northern Europe', 'EE': 'Northern Europe', 'LT': 'Northern Europe',
+    'LV': 'Northern Europe', 'BG': 'Eastern Europe', 'CY': 'Southern Europe',
+    'MT': 'Southern Europe',
+}
+N_OEMS = 25
+N_MODELS = 120
+YEARS = (2021, 2022, 2023)
+# Share of missing values in each measurement column
+MISSING_SHARE = 0.02
+
+
+def _zipf_weights(n, exponent=1.1):
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def _model_table(rng):
+    """Per-model OEM, mass and electric range."""
+    oems = np.array([f'OEM {i:02d}' for i in range(1, N_OEMS + 1)])
+    models = pd.DataFrame({
+        'OEM': rng.choice(oems, N_MODELS, p=_zipf_weights(N_OEMS)),
+        'Model': [f'MODEL {i:03d}' for i in range(1, N_MODELS + 1)],
+        'mass': rng.normal(1950, 260, N_MODELS).clip(1350, 2900),
+        'range': rng.gamma(9, 6.5, N_MODELS).clip(25, 120),
+    })
+    return models, _zipf_weights(N_MODELS, 0.9)
+
+
+def synthetic_phevs(n, seed=SYNTHETIC_SEED):
+    """An `n`-row synthetic PHEV frame (same seed, same frame)."""
+    rng = np.random.default_rng(seed)
+    countries = np.array(list(COUNTRIES))
+    country = rng.choice(len(countries), n, p=_zipf_weights(len(countries)))
+    region = np.array([COUNTRIES[c] for c in countries])[country]
+
+    models, model_weights = _model_table(rng)
+    model = rng.choice(N_MODELS, n, p=model_weights)
+    mass = models['mass'].to_numpy()[model] + rng.normal(0, 60, n)
+    electric_range = (models['range'].to_numpy()[model] * rng.normal(1, 0.05, n)).clip(15, None)
+
+    # EDS: mostly-charged vehicles near the top, rarely-charged ones near 0,
+    # and the bulk in between, shifted up by the electric range
+    kind = rng.random(n)
+    eds = rng.beta(2 + electric_range / 30, 3, n)
+    eds = np.where(kind < 0.12, rng.beta(0.6, 8, n), eds)
+    eds = np.where(kind > 0.95, rng.beta(8, 0.8, n), eds) * 100
+
+    # kWh/100 km: heavier vehicles use more, electric kWh are cheaper than fuel
+    en_tot = rng.gamma(12, 4.2, n) * (mass / 1950) * (1 - 0.45 * eds / 100)
+    en_el = en_tot * (eds / 100) * rng.uniform(0.8, 1.0, n)
+    en_ice = en_tot - en_el
+
+    df = pd.DataFrame({
+        'EDSen_mech': eds,
+        'EnTot_final100km': en_tot,
+        'EnICE_final100km': en_ice,
+        'EnEl_final100km': en_el,
+        'Mass': mass.round(),
+        'Electric_range': electric_range.round(),
+        'Mileage_Tot': rng.lognormal(9.6, 0.75, n).round(),
+        'AER_to_Mass': electric_range / mass,
+        'Country': countries[country],
+        'Region': region,
+        'year': rng.choice(YEARS, n, p=[0.25, 0.35, 0.40]).astype(np.float64),
+        'OEM': models['OEM'].to_numpy()[model],
+        'Model': models['Model'].to_numpy()[model],
+    })
+    for column in ['EDSen_mech', 'EnTot_final100km', 'EnICE_final100km', 'EnEl_final100km',
+                   'Mileage_Tot']:
+        df.loc[rng.random(n) < MISSING_SHARE, column] = np.nan
+    return df
+
+
+def write_dataset(df, directory=data_dir):
+    """Save `df` as the pickle source load_phevs() reads; return its path."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{DATASET_NAME}.pkl"
+    tmp_path = path.with_suffix('.pkl.tmp')
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    return path
+
+
+def parse_rows(text):
+    """'100k', '1M', '2.5M' or a plain integer -> number of rows."""
+    if text in SIZES:
+        return SIZES[text]
+    scale = {'k': 1_000, 'M': 1_000_000}.get(text[-1:], 1)
+    return int(float(text[:-1] if scale > 1 else text) * scale)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic PHEV dataset.")
+    parser.add_argument('--rows', '-n', type=parse_rows, default=SIZES['1M'],
+                        help="rows, e.g. 100k, 1M or 2.5M (default: 1M)")
+    parser.add_argument('--seed', type=int, default=SYNTHETIC_SEED)
+    parser.add_argument('--output-dir', '-o', type=Path, required=True,
+                        help="directory for the dataset (use data/processed to replace the real one)")
+    args = parser.parse_args(argv)
+
+    path = write_dataset(synthetic_phevs(args.rows, args.seed), args.output_dir)
+    print(f"Saved: {path} ({args.rows:,} rows)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
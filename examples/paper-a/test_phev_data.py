@@ -0,0 +1,28 @@
+"""Tests for the Parquet cache in phev_data.py."""
+
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from phev_data import PHEV_COLUMNS, column_fingerprints, load_phevs  # noqa: E402
+from synthetic_phevs import synthetic_phevs, write_dataset  # noqa: E402
+
+
+def test_cache_adds_source_column_requested_later(tmp_path):
+    write_dataset(synthetic_phevs(1_000), tmp_path)
+    # First build: the default columns only, so OEM is pruned from the cache
+    assert 'OEM' not in load_phevs(None, tmp_path).columns
+    assert 'OEM' not in PHEV_COLUMNS
+
+    df = load_phevs(['OEM', 'Mass'], tmp_path)
+    assert list(df.columns) == ['OEM', 'Mass']
+    assert df['OEM'].notna().all()
+    hashes = column_fingerprints(['OEM', 'Model'], tmp_path)
+    assert hashes['OEM'] is not None and hashes['Model'] is not None
+
+
+def test_cache_skips_columns_missing_from_source(tmp_path):
+    write_dataset(synthetic_phevs(1_000), tmp_path)
+    load_phevs(None, tmp_path)
+    assert list(load_phevs(['Mass', 'not_a_column'], tmp_path).columns) == ['Mass']
+    assert column_fingerprints(['not_a_column'], tmp_path) == {'not_a_column': None}
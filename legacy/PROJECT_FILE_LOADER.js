@@ -31,7 +31,10 @@ class ProjectFileLoader {
       try {
         const response = await fetch(path);
         if (response.ok) {
-          this.manifest = await response.json();
+          const manifest = await response.json();
+          // Flat manifests (generate_file_manifest.py --format flat) are
+          // expanded back to the nested form; see file_listing_api.js
+          this.manifest = manifest.format === 'flat' ? expandFlatManifest(manifest) : manifest;
           this.files = this.manifest;
           console.log('Loaded manifest from:', path);
           return this.manifest;
@@ -18,7 +18,7 @@ async function fetchFileStructureFromAPI() {
       const response = await fetch('../file_manifest.json');
       if (response.ok) {
         const manifest = await response.json();
-        return manifest;
+        return manifest.format === 'flat' ? expandFlatManifest(manifest) : manifest;
       }
     } catch (e) {
       console.log('No file_manifest.json found, using hardcoded structure');
@@ -61,9 +61,49 @@ function generateFileManifest(structure) {
   };
 }
 
+/**
+ * Convert a flat manifest (generate_file_manifest.py --format flat) to the
+ * nested { version, generated, structure } form.
+ * Entry i is names[i], a folder ('d'), file ('f') or stub folder ('s') by
+ * types[i], inside the folder dirs[parents[i]]; folder entries appear in the
+ * same order as dirs.
+ */
+function expandFlatManifest(manifest) {
+  const extra = ['size', 'mtime', 'mime', 'hash'].filter(field => field in manifest);
+  const folders = [{ name: manifest.root, type: 'folder', children: [] }];
+  for (let i = 0; i < manifest.names.length; i++) {
+    const name = manifest.names[i];
+    const parent = manifest.parents[i];
+    let node;
+    if (manifest.types[i] === 'd') {
+      node = { name: name, type: 'folder', children: [] };
+      folders.push(node);
+    } else if (manifest.types[i] === 's') {
+      // Left out by the walk budget; fetch with --subtree <path>
+      const prefix = manifest.dirs[parent];
+      node = { name: name, type: 'folder', path: prefix ? prefix + '/' + name : name, stub: true, children: [] };
+    } else {
+      const prefix = manifest.dirs[parent];
+      node = { name: name, type: 'file', path: prefix ? prefix + '/' + name : name };
+      for (const field of extra) {
+        if (manifest[field][i] !== null) {
+          node[field] = manifest[field][i];
+        }
+      }
+    }
+    folders[parent].children.push(node);
+  }
+  return {
+    version: manifest.version,
+    generated: manifest.generated,
+    structure: folders[0]
+  };
+}
+
 // Export for use in other files
 if (typeof window !== 'undefined') {
   window.fetchFileStructureFromAPI = fetchFileStructureFromAPI;
   window.generateFileManifest = generateFileManifest;
+  window.expandFlatManifest = expandFlatManifest;
 }
 
@@ -4,96 +4,951 @@ Generate file manifest for the website file explorer.
 This script scans the project directory and creates a JSON manifest
 that the file explorer can use to display files.
 
+Files and folders matched by DEFAULT_EXCLUDES or the project's .gitignore
+and .cursorignore (gitignore syntax) are skipped without being walked.
+
 Usage:
     python3 generate_file_manifest.py > site/file_manifest.json
+    python3 generate_file_manifest.py --suffixes md,pdf,png --exclude 'drafts/'
+    python3 generate_file_manifest.py --incremental -o site/file_manifest.json
+    python3 generate_file_manifest.py --watch -o site/file_manifest.json
+    python3 generate_file_manifest.py --enrich --incremental -o site/file_manifest.json
+    python3 generate_file_manifest.py --format flat --compress gzip,br -o site/file_manifest.json
+    python3 generate_file_manifest.py --max-depth 4 -o site/file_manifest.json
+    python3 generate_file_manifest.py --subtree examples/paper-a/data --max-depth 4
+
+Output is compact JSON (--pretty to indent it). The default nested format is
+written while the tree is walked, unless --incremental, --watch or --enrich
+need the tree in memory. --format flat writes a path-prefix table and
+parallel arrays instead of nested objects (see flatten_tree()).
+
+The tree is walked without recursion and without a depth limit. With
+--max-depth/--max-entries, folders beyond the budget are written as stubs
+that --subtree PATH expands later; what was left out is reported on stderr.
 """
 
+import argparse
+import ctypes
+import ctypes.util
+import gzip
+import hashlib
 import os
 import json
+import mimetypes
+import re
+import select
+import struct
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 
-def should_include_file(file_path):
-    """Determine if a file should be included in the manifest."""
-    # Exclude common files/directories
-    exclude_patterns = [
-        '.git',
-        '.DS_Store',
-        '__pycache__',
-        'node_modules',
-        '.cursorignore',
-        '.gitignore',
-        '*.pyc',
-        '*.log',
-        '.backup',
-        '*.bak'
-    ]
-    
-    file_str = str(file_path)
-    for pattern in exclude_patterns:
-        if pattern in file_str:
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Always excluded, in .gitignore syntax
+DEFAULT_EXCLUDES = [
+    '.git/',
+    '.DS_Store',
+    '__pycache__/',
+    'node_modules/',
+    '.cursorignore',
+    '.gitignore',
+    '*.pyc',
+    '*.log',
+    '*.backup',
+    '*.bak'
+]
+
+# Project ignore files read from the root, in this order
+IGNORE_FILES = ['.gitignore', '.cursorignore']
+
+def glob_to_regex(pattern):
+    """Translate one gitignore glob (without '!' or a trailing '/') to a regex."""
+    anchored = '/' in pattern
+    pattern = pattern.lstrip('/')
+    out = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith('**/', i):
+            out.append('(?:.*/)?')
+            i += 3
+            continue
+        if pattern.startswith('/**', i) and i + 3 == len(pattern):
+            out.append('/.*')
+            break
+        if pattern.startswith('**', i):
+            out.append('.*')
+            i += 2
+            continue
+        if c == '*':
+            out.append('[^/]*')
+        elif c == '?':
+            out.append('[^/]')
+        elif c == '[':
+            end = pattern.find(']', i + 2)
+            if end < 0:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                out.append('[' + body.replace('\\', '\\\\') + ']')
+                i = end
+        elif c == '\\' and i + 1 < len(pattern):
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    body = ''.join(out)
+    # Unanchored patterns match the last path segment at any depth
+    return body if anchored else '(?:.*/)?' + body
+
+class ExclusionMatcher:
+    """Gitignore-style exclusion rules compiled into one regex.
+    
+    Paths are '/'-separated and relative to the project root. As in git, the
+    last matching rule wins, '!' re-includes, a trailing '/' only matches
+    directories, and a pattern containing '/' is anchored to the root.
+    """
+    
+    def __init__(self, patterns):
+        self.patterns = [line.rstrip('\n') for line in patterns]
+        self.rules = []
+        for line in self.patterns:
+            line = line.rstrip()
+            if not line or line.startswith('#'):
+                continue
+            negate = line.startswith('!')
+            if negate or line.startswith('\\!') or line.startswith('\\#'):
+                line = line[1:]
+            dir_only = line.endswith('/')
+            line = line.rstrip('/')
+            if line:
+                self.rules.append((re.compile(glob_to_regex(line) + r'\Z', re.S), negate, dir_only))
+        # One alternation over every rule: most paths match none of them
+        self.any_rule = re.compile('|'.join('(?:%s)' % rule.pattern for rule, _, _ in self.rules) or r'(?!)', re.S)
+    
+    @classmethod
+    def for_project(cls, project_root, extra=()):
+        """DEFAULT_EXCLUDES plus the project's ignore files and `extra` patterns."""
+        patterns = list(DEFAULT_EXCLUDES)
+        for name in IGNORE_FILES:
+            try:
+                with open(os.path.join(project_root, name), encoding='utf-8') as f:
+                    patterns.extend(f)
+            except OSError:
+                pass
+        patterns.extend(extra)
+        return cls(patterns)
+    
+    def excluded(self, path, is_dir=False):
+        """True if the relative `path` is excluded."""
+        if not self.any_rule.match(path):
             return False
+        for rule, negate, dir_only in reversed(self.rules):
+            if dir_only and not is_dir:
+                continue
+            if rule.match(path):
+                return not negate
+        return False
+
+DEFAULT_MATCHER = ExclusionMatcher(DEFAULT_EXCLUDES)
+
+def should_include_file(file_path, is_dir=False, matcher=None):
+    """Determine if a file should be included in the manifest."""
+    matcher = matcher or DEFAULT_MATCHER
+    return not matcher.excluded(str(file_path).replace(os.sep, '/'), is_dir)
+
+# File types listed in the manifest
+INCLUDED_SUFFIXES = {'.md', '.txt', '.csv', '.json', '.html', '.js', '.css', '.py', '.R', '.r', '.docx', '.pdf', '.png', '.jpg', '.jpeg'}
+
+def scan_directory(path, prefix='', matcher=None):
+    """List a directory once with os.scandir.
+    
+    Returns (dirs, files) as sorted lists of names. `prefix` is the
+    directory's path from the project root plus '/', for matching. Excluded
+    entries are dropped here, before anything below them is visited, and the
+    entry type comes from the DirEntry (no extra stat on most filesystems).
+    """
+    dirs, files = [], []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+                is_file = not is_dir and entry.is_file()
+            except OSError:
+                continue
+            if not should_include_file(prefix + entry.name, is_dir, matcher):
+                continue
+            if is_file:
+                files.append(entry.name)
+            elif is_dir:
+                dirs.append(entry.name)
+    dirs.sort(key=str.lower)
+    files.sort(key=str.lower)
+    return dirs, files
+
+class DirectoryState:
+    """Per-directory mtimes and entry lists, persisted between runs.
+    
+    A directory whose mtime is unchanged has the same entries, so list() only
+    re-scans directories that changed and records which ones did. Entries
+    modified within RACY_SECONDS of the previous run are re-scanned anyway,
+    since the filesystem's mtime resolution could hide a later change.
+    """
+    
+    VERSION = 1
+    RACY_SECONDS = 2
+    
+    def __init__(self, path, config):
+        self.path = path
+        self.config = config
+        self.previous = {}
+        self.scanned_ns = 0
+        self.directories = {}
+        self.changed = []
+        self.listed = set()
+        self.started_ns = time.time_ns()
+        try:
+            with open(path) as f:
+                state = json.load(f)
+            if state.get('version') == self.VERSION and state.get('config') == config:
+                self.scanned_ns = state['scanned_ns']
+                self.previous = state['directories']
+        except (OSError, ValueError, KeyError):
+            self.previous = {}
+    
+    def list(self, path, prefix='', matcher=None):
+        """scan_directory(), answered from the saved state when the directory is unchanged."""
+        key = prefix.rstrip('/')
+        mtime_ns = os.stat(path).st_mtime_ns
+        cached = self.previous.get(key)
+        if (cached and cached['mtime_ns'] == mtime_ns
+                and mtime_ns < self.scanned_ns - self.RACY_SECONDS * 10**9):
+            dirs, files = cached['dirs'], cached['files']
+        else:
+            dirs, files = scan_directory(path, prefix, matcher)
+            if not cached or cached['dirs'] != dirs or cached['files'] != files:
+                self.changed.append(key)
+        self.directories[key] = {'mtime_ns': mtime_ns, 'dirs': dirs, 'files': files}
+        self.listed.add(key)
+        return dirs, files
+    
+    def refresh(self, keys=()):
+        """Start another pass over the current listings, re-scanning `keys`."""
+        self.previous = dict(self.directories)
+        for key in keys:
+            self.previous.pop(key, None)
+        self.scanned_ns, self.started_ns = self.started_ns, time.time_ns()
+        self.changed = []
+        self.listed = set()
+    
+    def prune(self, root_key):
+        """Forget directories under `root_key` that the last pass did not list."""
+        for key in list(self.directories):
+            inside = root_key == '' or key == root_key or key.startswith(root_key + '/')
+            if inside and key not in self.listed:
+                del self.directories[key]
+    
+    def changed_subtrees(self):
+        """Topmost directories that were added, removed or changed since the last run."""
+        removed = [key for key in self.previous if key not in self.directories]
+        paths = sorted(set(self.changed + removed))
+        top = []
+        for key in paths:
+            if not any(key == t or t == '' or key.startswith(t + '/') for t in top):
+                top.append(key)
+        return [key or '.' for key in top]
+    
+    def save(self):
+        state = {'version': self.VERSION, 'config': self.config,
+                 'scanned_ns': self.started_ns, 'directories': self.directories}
+        write_atomic(self.path, json.dumps(state, separators=(',', ':')))
+
+def write_atomic(path, text):
+    """Replace `path` with `text` without ever leaving a partial file."""
+    tmp_path = '%s.tmp' % path
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+ROOT_NAME = 'MARKOS PROJECT'
+
+class WalkBudget:
+    """Depth and entry limits for one walk, and what the walk left out.
+    
+    Folders more than `max_depth` levels below the project root (for
+    --subtree, below that folder), or reached
+    once `max_entries` entries have been listed, are not walked: they are
+    emitted as stubs ({"type": "folder", "stub": true, "path": ...}) that
+    --subtree PATH expands. None means no limit.
+    """
+    
+    def __init__(self, max_depth=None, max_entries=None):
+        self.max_depth = max_depth
+        self.max_entries = max_entries
+        self.entries = 0
+        self.deepest = 0
+        self.stubs = []
+        self.loops = []
+    
+    def exhausted(self, depth):
+        return ((self.max_depth is not None and depth > self.max_depth)
+                or (self.max_entries is not None and self.entries >= self.max_entries))
+    
+    def report(self):
+        """One line for stderr: the walk's size and anything it left out."""
+        limits = []
+        if self.max_depth is not None:
+            limits.append('--max-depth %d' % self.max_depth)
+        if self.max_entries is not None:
+            limits.append('--max-entries %d' % self.max_entries)
+        line = 'Walked %d entries, %d levels deep' % (self.entries, self.deepest)
+        if self.stubs:
+            line += '; %d folders left as stubs (%s): %s' % (len(self.stubs), ', '.join(limits), ', '.join(self.stubs[:5]) + (', ...' if len(self.stubs) > 5 else ''))
+        if self.loops:
+            line += '; skipped symlink loops: %s' % ', '.join(self.loops)
+        return line
+
+def walk_tree(root_path, relative_path='', matcher=None, suffixes=INCLUDED_SUFFIXES, state=None, budget=None, depth=0):
+    """Walk a folder depth first with an explicit stack, yielding events.
+    
+    ('folder', name, path) when a folder is entered, ('file', name, path)
+    for each listed file, ('stub', name, path) for a folder the budget left
+    out, and ('end', None, None) when a folder is left. Paths are relative to
+    the project root; `relative_path` is the folder's ('' for the root) and
+    `depth` its level below the root. Folders come before files, each sorted.
+    Files are listed if their suffix is in `suffixes` and `matcher` (default:
+    DEFAULT_EXCLUDES only) does not exclude them. A folder that is its own
+    ancestor through a symlink (same st_dev and st_ino) is skipped. With a
+    DirectoryState, unchanged directories are not re-listed.
+    """
+    if budget is None:
+        budget = WalkBudget()
+    item = (os.fspath(root_path), relative_path, os.path.basename(relative_path) if relative_path else ROOT_NAME, depth, None)
+    stack = []
+    while True:
+        if item is not None:
+            path, key, name, level, ancestors = item
+            item = None
+            try:
+                st = os.stat(path)
+            except OSError:
+                st = None
+            if st is not None and os.path.isdir(path):
+                ident = (st.st_dev, st.st_ino)
+                link = ancestors
+                while link is not None and link[0] != ident:
+                    link = link[1]
+                if link is not None:
+                    budget.loops.append(key)
+                elif stack and budget.exhausted(level):
+                    budget.stubs.append(key)
+                    budget.entries += 1
+                    yield 'stub', name, key
+                else:
+                    prefix = key + '/' if key else ''
+                    try:
+                        if state is not None:
+                            dirs, files = state.list(path, prefix, matcher)
+                        else:
+                            dirs, files = scan_directory(path, prefix, matcher)
+                    except PermissionError:
+                        dirs, files = [], []
+                    if stack:
+                        budget.entries += 1
+                    budget.deepest = max(budget.deepest, level - depth)
+                    yield 'folder', name, key
+                    # Only include certain file types
+                    files = [f for f in files if os.path.splitext(f)[1] in suffixes]
+                    stack.append((iter(dirs), files, path, prefix, level, (ident, ancestors)))
+        if not stack:
+            return
+        dirs, files, path, prefix, level, ancestors = stack[-1]
+        name = next(dirs, None)
+        if name is not None:
+            item = (os.path.join(path, name), prefix + name, name, level + 1, ancestors)
+            continue
+        for name in files:
+            budget.entries += 1
+            yield 'file', name, prefix + name
+        stack.pop()
+        yield 'end', None, None
+
+def stub_node(name, path):
+    return {'name': name, 'type': 'folder', 'path': path, 'stub': True, 'children': []}
+
+def build_file_tree(root_path, relative_path='', matcher=None, suffixes=INCLUDED_SUFFIXES, state=None, budget=None, depth=0):
+    """Build the nested tree of a folder from walk_tree()'s events.
+    
+    Folders without entries are dropped (stubs are kept). Returns None if
+    `root_path` is not a directory.
+    """
+    stack = []
+    for event, name, path in walk_tree(root_path, relative_path, matcher, suffixes, state, budget, depth):
+        if event == 'folder':
+            stack.append({'name': name, 'type': 'folder', 'children': []})
+        elif event == 'file':
+            stack[-1]['children'].append({'name': name, 'type': 'file', 'path': path})
+        elif event == 'stub':
+            stack[-1]['children'].append(stub_node(name, path))
+        else:
+            node = stack.pop()
+            if not stack:
+                return node
+            if node['children']:
+                stack[-1]['children'].append(node)
+    return None
+
+def stream_file_tree(out, root_path, relative_path='', matcher=None, suffixes=INCLUDED_SUFFIXES, budget=None, depth=0):
+    """Write build_file_tree()'s structure for a folder to `out` as compact JSON while walking.
     
-    return True
+    Nothing is kept in memory beyond the stack of current listings. A
+    folder's header is only written with its first entry, so empty folders
+    are dropped as in build_file_tree(). Returns True if anything was written.
+    """
+    # Per open folder: [header, written]
+    frames = []
+    
+    def emit(text):
+        first = len(frames)
+        while first > 0 and not frames[first - 1][1]:
+            first -= 1
+        out.write(',' if first == len(frames) else '')
+        for i in range(first, len(frames)):
+            out.write((',' if i == first and i > 0 else '') + frames[i][0])
+            frames[i][1] = True
+        out.write(text)
+    
+    for event, name, path in walk_tree(root_path, relative_path, matcher, suffixes, None, budget, depth):
+        if event == 'folder':
+            frames.append(['{"name":%s,"type":"folder","children":[' % json.dumps(name), False])
+        elif event == 'file':
+            emit('{"name":%s,"type":"file","path":%s}' % (json.dumps(name), json.dumps(path)))
+        elif event == 'stub':
+            emit(json.dumps(stub_node(name, path), separators=(',', ':')))
+        else:
+            header, written = frames.pop()
+            if written:
+                out.write(']}')
+            elif not frames:
+                out.write(header + ']}')
+                written = True
+            if not frames:
+                return written
+    return False
+
+def flatten_tree(structure, fields=(), root_path=''):
+    """The flat form of a nested tree: a path-prefix table plus parallel arrays.
+    
+    Entries are in the nested order (depth first, folders before files).
+    `dirs` lists every folder's path (`root_path`, '' for the project root,
+    first) in the order of the folder entries; entry i is named `names[i]`,
+    is a folder, a file or a stub folder by `types[i]` ('d', 'f' or 's') and
+    lives in folder `dirs[parents[i]]`, so its path is that prefix, '/' and
+    its name. Each of `fields` (e.g. the --enrich metadata) becomes one more
+    array, null for folders.
+    """
+    flat = {'root': structure['name'], 'dirs': [root_path], 'names': [], 'types': [], 'parents': []}
+    for field in fields:
+        flat[field] = []
+    stack = [(iter(structure['children']), 0)]
+    while stack:
+        children, parent = stack[-1]
+        child = next(children, None)
+        if child is None:
+            stack.pop()
+            continue
+        flat['names'].append(child['name'])
+        flat['parents'].append(parent)
+        for field in fields:
+            flat[field].append(child.get(field))
+        if child.get('stub'):
+            flat['types'].append('s')
+        elif child['type'] == 'folder':
+            flat['types'].append('d')
+            prefix = flat['dirs'][parent]
+            flat['dirs'].append(prefix + '/' + child['name'] if prefix else child['name'])
+            stack.append((iter(child['children']), len(flat['dirs']) - 1))
+        else:
+            flat['types'].append('f')
+    flat['types'] = ''.join(flat['types'])
+    return flat
+
+HASH_CHUNK_SIZE = 1 << 20
+
+# Fields FileEnricher adds to file entries
+ENRICH_FIELDS = ('size', 'mtime', 'mime', 'hash')
+# Fixed-length digests only: shake_* need an output length for hexdigest()
+HASH_ALGORITHMS = sorted(name for name in hashlib.algorithms_guaranteed
+                         if not name.startswith('shake_'))
+
+def file_digest(path, algorithm='sha256'):
+    """Content hash of a file, read in 1 MiB chunks."""
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class FileEnricher:
+    """Adds size, mtime, MIME type and a content hash to file entries.
+    
+    Files are stat'ed and hashed on a thread pool. Hashes are cached by
+    (inode, size, mtime), in `cache_path` if given, so unchanged files are
+    never read again.
+    """
+    
+    VERSION = 1
+    
+    def __init__(self, project_root, cache_path=None, algorithm='sha256', workers=None):
+        self.project_root = os.fspath(project_root)
+        self.cache_path = cache_path
+        self.algorithm = algorithm
+        self.workers = workers or min(32, (os.cpu_count() or 1) + 4)
+        self.hashes = {}
+        self.seen = set()
+        if cache_path:
+            try:
+                with open(cache_path) as f:
+                    cache = json.load(f)
+                if cache.get('version') == self.VERSION and cache.get('algorithm') == algorithm:
+                    self.hashes = cache['files']
+            except (OSError, ValueError, KeyError):
+                self.hashes = {}
+    
+    def describe(self, path):
+        """(size, mtime, MIME type, hash) of the file at the relative `path`, or None."""
+        try:
+            st = os.stat(os.path.join(self.project_root, path))
+            key = [st.st_ino, st.st_size, st.st_mtime_ns]
+            cached = self.hashes.get(path)
+            if cached and cached[:3] == key:
+                digest = cached[3]
+            else:
+                digest = file_digest(os.path.join(self.project_root, path), self.algorithm)
+        except OSError:
+            return None
+        return key, digest, {
+            'size': st.st_size,
+            'mtime': datetime.fromtimestamp(st.st_mtime).isoformat(timespec='seconds'),
+            'mime': mimetypes.guess_type(path)[0] or 'application/octet-stream',
+            'hash': '%s:%s' % (self.algorithm, digest)
+        }
+    
+    def enrich(self, tree):
+        """Add the metadata to every file entry under the folder node `tree`, in place."""
+        files = []
+        stack = [tree]
+        while stack:
+            for child in stack.pop()['children']:
+                if child['type'] == 'folder':
+                    stack.append(child)
+                else:
+                    files.append(child)
+        with ThreadPoolExecutor(self.workers) as pool:
+            for node, described in zip(files, pool.map(self.describe, [n['path'] for n in files])):
+                if described is None:
+                    continue
+                key, digest, fields = described
+                self.hashes[node['path']] = key + [digest]
+                self.seen.add(node['path'])
+                node.update(fields)
+    
+    def save(self, prune=False):
+        """Persist the hash cache; with `prune`, drop files not enriched in this run."""
+        if prune:
+            self.hashes = {path: entry for path, entry in self.hashes.items() if path in self.seen}
+        if self.cache_path:
+            cache = {'version': self.VERSION, 'algorithm': self.algorithm, 'files': self.hashes}
+            write_atomic(self.cache_path, json.dumps(cache, separators=(',', ':')))
+
+def find_folder(tree, key):
+    """Folder nodes from the root towards `key`, as far as they exist in `tree`."""
+    nodes = [tree]
+    for name in key.split('/') if key else []:
+        node = next((c for c in nodes[-1]['children'] if c['type'] == 'folder' and c['name'] == name), None)
+        if node is None:
+            break
+        nodes.append(node)
+    return nodes
+
+def patch_tree(tree, project_root, key, matcher=None, suffixes=INCLUDED_SUFFIXES, state=None, budget=None):
+    """Rebuild the folder at `key` (or its nearest listed ancestor) in place.
+    
+    Folders that end up empty are dropped from their parent, as in a full
+    build, and the depth budget counts from the project root as it does
+    there. Returns the key of the subtree that was rebuilt.
+    """
+    parts = key.split('/') if key else []
+    nodes = find_folder(tree, key)
+    depth = len(nodes) - 1
+    key = '/'.join(parts[:depth])
+    if state is not None:
+        state.refresh([key])
+    new = build_file_tree(os.path.join(project_root, key), key, matcher, suffixes, state, budget, depth)
+    if state is not None:
+        state.prune(key)
+    if depth == 0:
+        tree.clear()
+        tree.update(new or {'name': ROOT_NAME, 'type': 'folder', 'children': []})
+        return key
+    
+    # Splice the new folder in, removing emptied folders on the way up
+    while depth > 0:
+        parent = nodes[depth - 1]
+        index = next(i for i, c in enumerate(parent['children']) if c is nodes[depth])
+        if new and (new['children'] or new.get('stub')):
+            parent['children'][index] = new
+            break
+        del parent['children'][index]
+        if parent['children']:
+            break
+        new, depth = parent, depth - 1
+    return key
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+WATCH_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+EVENT_HEADER = struct.Struct('iIII')
+
+class InotifyWatcher:
+    """Directory change events from Linux inotify, through ctypes."""
+    
+    def __init__(self, project_root, mask=WATCH_MASK):
+        libc_name = ctypes.util.find_library('c')
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self.libc, 'inotify_init1'):
+            raise OSError('inotify is not available')
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.project_root = os.fspath(project_root)
+        self.mask = mask
+        self.keys = {}
+        self.watches = {}
+    
+    def sync(self, keys):
+        """Watch every directory in `keys` that is not watched yet."""
+        for key in keys:
+            if key in self.watches:
+                continue
+            path = os.path.join(self.project_root, key).encode()
+            wd = self.libc.inotify_add_watch(self.fd, path, self.mask)
+            if wd >= 0:
+                self.keys[wd] = key
+                self.watches[key] = wd
+    
+    def wait(self, timeout):
+        """Keys of the directories that changed, waiting up to `timeout` seconds."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                changed.add('')
+            key = self.keys.get(wd)
+            if key is None:
+                continue
+            if mask & IN_IGNORED:
+                del self.keys[wd]
+                self.watches.pop(key, None)
+            elif mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                changed.add(key.rpartition('/')[0])
+            else:
+                changed.add(key)
+        return changed
+    
+    def close(self):
+        os.close(self.fd)
 
-def build_file_tree(root_path, relative_path='', max_depth=5, current_depth=0):
-    """Recursively build file tree structure."""
-    if current_depth >= max_depth:
-        return None
+class PollingWatcher:
+    """Fallback watcher: compares directory mtimes every `interval` seconds."""
+    
+    def __init__(self, project_root, state, interval=1.0):
+        self.project_root = os.fspath(project_root)
+        self.state = state
+        self.interval = interval
+        self.seen = {}
+    
+    def sync(self, keys):
+        """Poll the listed directories, starting from their listed mtimes."""
+        self.seen = {key: self.state.directories[key]['mtime_ns'] for key in keys}
     
-    root = Path(root_path)
-    if not root.exists():
-        return None
+    def wait(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        changed = set()
+        for key, seen in list(self.seen.items()):
+            try:
+                mtime_ns = os.stat(os.path.join(self.project_root, key)).st_mtime_ns
+            except OSError:
+                changed.add(key.rpartition('/')[0])
+                del self.seen[key]
+                continue
+            if mtime_ns != seen:
+                changed.add(key)
+                self.seen[key] = mtime_ns
+        return changed
+    
+    def close(self):
+        pass
+
+def top_keys(keys):
+    """Drop keys that lie inside another key of the set."""
+    top = []
+    for key in sorted(keys):
+        if not any(t == '' or key == t or key.startswith(t + '/') for t in top):
+            top.append(key)
+    return top
+
+def watch(write, project_root, tree, matcher, suffixes, state, debounce=0.5, max_delay=5.0, poll=False, enricher=None, budget=None):
+    """Keep the manifest current: patch the changed subtrees after each burst of
+    changes, then pass the tree to `write`.
     
-    structure = {
-        'name': root.name if relative_path else 'MARKOS PROJECT',
-        'type': 'folder',
-        'children': []
-    }
+    With an enricher, files written in place (not only created or removed)
+    also count as changes, under inotify. Each patch gets the limits of
+    `budget` afresh; folders left as stubs are not watched.
+    """
+    watcher = None
+    if not poll:
+        try:
+            watcher = InotifyWatcher(project_root, WATCH_MASK | IN_CLOSE_WRITE if enricher else WATCH_MASK)
+        except (OSError, AttributeError, TypeError) as e:
+            print('inotify unavailable (%s), polling instead' % e, file=sys.stderr)
+    if watcher is None:
+        watcher = PollingWatcher(project_root, state)
+    watcher.sync(state.directories)
+    print('Watching %s (Ctrl-C to stop)' % project_root, file=sys.stderr)
     
+    pending = set()
+    first = last = None
     try:
-        items = sorted(root.iterdir(), key=lambda x: (x.is_file(), x.name.lower()))
-        
-        for item in items:
-            if not should_include_file(item):
+        while True:
+            changed = watcher.wait(debounce if pending else 60)
+            now = time.monotonic()
+            if changed:
+                pending |= changed
+                first = first or now
+                last = now
+            if not pending or (now - last < debounce and now - first < max_delay):
                 continue
-            
-            if item.is_file():
-                # Only include certain file types
-                if item.suffix in ['.md', '.txt', '.csv', '.json', '.html', '.js', '.css', '.py', '.R', '.r', '.docx', '.pdf', '.png', '.jpg', '.jpeg']:
-                    structure['children'].append({
-                        'name': item.name,
-                        'type': 'file',
-                        'path': str(item.relative_to(Path(root_path).parent)) if relative_path else item.name
-                    })
-            elif item.is_dir():
-                child_tree = build_file_tree(item, str(item.relative_to(Path(root_path).parent)), max_depth, current_depth + 1)
-                if child_tree and child_tree['children']:
-                    structure['children'].append(child_tree)
-    
-    except PermissionError:
+            # A burst is over (or has gone on long enough): patch and rewrite once
+            limits = (budget.max_depth, budget.max_entries) if budget else ()
+            rebuilt = [patch_tree(tree, project_root, key, matcher, suffixes, state, WalkBudget(*limits)) for key in top_keys(pending)]
+            pending, first, last = set(), None, None
+            watcher.sync(state.directories)
+            state.save()
+            if enricher is not None:
+                for key in top_keys(rebuilt):
+                    nodes = find_folder(tree, key)
+                    if len(nodes) - 1 == len(key.split('/') if key else []):
+                        enricher.enrich(nodes[-1])
+                enricher.save()
+            write(tree)
+            print('Updated: %s' % ', '.join(key or '.' for key in top_keys(rebuilt)), file=sys.stderr)
+    except KeyboardInterrupt:
         pass
+    finally:
+        watcher.close()
+
+MANIFEST_FORMATS = ('nested', 'flat')
+COMPRESSIONS = {'gzip': '.gz', 'br': '.br'}
+
+def manifest_body(structure, fmt='nested', fields=(), subtree=''):
+    """The manifest for `structure` in format `fmt`, without its `generated` stamp.
+    
+    A manifest of one folder (see --subtree) records the folder's path.
+    """
+    body = {'version': '1.0', 'subtree': subtree} if subtree else {'version': '1.0'}
+    if fmt == 'flat':
+        return {**body, 'format': 'flat', **flatten_tree(structure, fields, subtree)}
+    return {**body, 'structure': structure}
+
+def write_manifest(output, structure, fmt='nested', fields=(), indent=None, compress=(), subtree=''):
+    """Write the manifest for `structure` to the `output` path, or stdout if None.
+    
+    JSON is compact unless `indent` is given; `compress` lists formats
+    ('gzip', 'br') to also write pre-compressed copies in.
+    """
+    manifest = {'generated': datetime.now().isoformat(), **manifest_body(structure, fmt, fields, subtree)}
+    text = json.dumps(manifest, indent=indent, separators=None if indent else (',', ':'))
+    if output:
+        write_atomic(output, text + '\n')
+        write_compressed(output, compress)
+    else:
+        print(text)
+
+def stream_manifest(output, project_root, matcher=None, suffixes=INCLUDED_SUFFIXES, compress=(), subtree='', budget=None):
+    """Walk `project_root` (or its `subtree`) and write the nested manifest as it goes."""
+    def write(out):
+        out.write('{"version":"1.0",%s"generated":%s,"structure":' % ('"subtree":%s,' % json.dumps(subtree) if subtree else '', json.dumps(datetime.now().isoformat())))
+        if not stream_file_tree(out, os.path.join(project_root, subtree), subtree, matcher, suffixes, budget):
+            out.write(json.dumps({'name': os.path.basename(subtree) or ROOT_NAME, 'type': 'folder', 'children': []}, separators=(',', ':')))
+        out.write('}\n')
     
-    return structure
+    if not output:
+        write(sys.stdout)
+        return
+    tmp_path = '%s.tmp' % output
+    with open(tmp_path, 'w') as f:
+        write(f)
+    os.replace(tmp_path, output)
+    write_compressed(output, compress)
 
-def main():
+def write_compressed(path, formats):
+    """Write pre-compressed copies of `path` (PATH.gz, PATH.br) for static serving."""
+    for fmt in formats:
+        target = path + COMPRESSIONS[fmt]
+        tmp_path = '%s.tmp' % target
+        with open(path, 'rb') as src, open(tmp_path, 'wb') as dst:
+            if fmt == 'gzip':
+                # mtime=0 keeps the output byte-identical for identical input
+                with gzip.GzipFile(fileobj=dst, mode='wb', compresslevel=9, mtime=0) as gz:
+                    for chunk in iter(lambda: src.read(HASH_CHUNK_SIZE), b''):
+                        gz.write(chunk)
+            else:
+                compressor = brotli.Compressor(quality=11)
+                for chunk in iter(lambda: src.read(HASH_CHUNK_SIZE), b''):
+                    dst.write(compressor.process(chunk))
+                dst.write(compressor.finish())
+        os.replace(tmp_path, target)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Generate the file explorer manifest.')
+    parser.add_argument('--suffixes', help='comma-separated file suffixes to list (default: %s)' % ','.join(sorted(INCLUDED_SUFFIXES)))
+    parser.add_argument('--exclude', action='append', default=[], metavar='PATTERN',
+                        help='extra gitignore-style exclusion pattern (repeatable)')
+    parser.add_argument('--output', '-o', help='write the manifest here (atomically) instead of to stdout')
+    parser.add_argument('--incremental', action='store_true',
+                        help='with --output: re-list only changed directories and rewrite the file only if the tree changed')
+    parser.add_argument('--watch', action='store_true',
+                        help='with --output: keep running and update the manifest when the tree changes')
+    parser.add_argument('--poll', action='store_true', help='with --watch: poll directory mtimes instead of using inotify')
+    parser.add_argument('--debounce', type=float, default=0.5,
+                        help='with --watch: seconds of quiet before a burst of changes is applied (default: 0.5)')
+    parser.add_argument('--enrich', action='store_true',
+                        help='add size, mtime, MIME type and content hash to each file')
+    parser.add_argument('--hash', default='sha256', choices=HASH_ALGORITHMS,
+                        help='with --enrich: hash algorithm (default: sha256)')
+    parser.add_argument('--format', default='nested', choices=MANIFEST_FORMATS,
+                        help='nested folder objects (default) or flat parallel arrays')
+    parser.add_argument('--pretty', action='store_true', help='indent the JSON')
+    parser.add_argument('--compress', default='', metavar='FORMATS',
+                        help='with --output: also write pre-compressed copies, comma-separated: %s' % ','.join(COMPRESSIONS))
+    parser.add_argument('--max-depth', type=int, metavar='N',
+                        help='list folders at most N levels below the root (or --subtree); deeper ones become stubs (default: no limit)')
+    parser.add_argument('--max-entries', type=int, metavar='N',
+                        help='stop listing folders after N entries; the rest become stubs (default: no limit)')
+    parser.add_argument('--subtree', metavar='PATH',
+                        help='write the manifest of the folder PATH only, e.g. to expand a stub')
+    args = parser.parse_args(argv)
+    if (args.incremental or args.watch) and not args.output:
+        parser.error('--incremental and --watch need --output')
+    if args.subtree is not None:
+        if args.incremental or args.watch:
+            parser.error('--subtree cannot be combined with --incremental or --watch')
+        args.subtree = os.path.normpath(args.subtree.strip('/')).replace(os.sep, '/')
+        if args.subtree == '.':
+            args.subtree = ''
+        if args.subtree == '..' or args.subtree.startswith('../'):
+            parser.error('--subtree must be inside the project')
+    else:
+        args.subtree = ''
+    args.compress = [c for c in args.compress.split(',') if c]
+    for fmt in args.compress:
+        if fmt not in COMPRESSIONS:
+            parser.error('unknown --compress format: %s' % fmt)
+    if args.compress and not args.output:
+        parser.error('--compress needs --output')
+    if 'br' in args.compress and brotli is None:
+        parser.error('--compress br needs the brotli package (pip install brotli)')
+    if args.suffixes:
+        args.suffixes = {s if s.startswith('.') else '.' + s for s in args.suffixes.split(',') if s}
+    else:
+        args.suffixes = INCLUDED_SUFFIXES
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    
     # Get the project root (parent of site directory)
     script_dir = Path(__file__).parent
     project_root = script_dir.parent
     
-    # Build file tree
-    file_structure = build_file_tree(project_root)
+    # Build file tree, skipping what .gitignore/.cursorignore exclude
+    matcher = ExclusionMatcher.for_project(project_root, args.exclude)
+    parts = args.subtree.split('/') if args.subtree else []
+    if (not os.path.isdir(os.path.join(project_root, args.subtree))
+            or any(matcher.excluded('/'.join(parts[:i]), True) for i in range(1, len(parts) + 1))):
+        print('Not a listed folder: %s' % args.subtree, file=sys.stderr)
+        return 2
+    budget = WalkBudget(args.max_depth, args.max_entries)
+    if args.format == 'nested' and not (args.pretty or args.incremental or args.watch or args.enrich):
+        stream_manifest(args.output, project_root, matcher, args.suffixes, args.compress, args.subtree, budget)
+        print(budget.report(), file=sys.stderr)
+        return 0
+    
+    state = None
+    if args.incremental or args.watch:
+        config = {'excludes': matcher.patterns, 'suffixes': sorted(args.suffixes)}
+        state = DirectoryState(args.output + '.state.json', config)
+    file_structure = build_file_tree(os.path.join(project_root, args.subtree), args.subtree, matcher, args.suffixes, state, budget)
+    print(budget.report(), file=sys.stderr)
+    enricher = None
+    if args.enrich:
+        enricher = FileEnricher(project_root, args.output + '.hashes.json' if args.output else None, args.hash)
+        enricher.enrich(file_structure)
+        enricher.save(prune=True)
+    
+    fields = ENRICH_FIELDS if args.enrich else ()
+    def write(tree):
+        write_manifest(args.output, tree, args.format, fields, 2 if args.pretty else None, args.compress, args.subtree)
     
-    # Create manifest
-    manifest = {
-        'version': '1.0',
-        'generated': datetime.now().isoformat(),
-        'structure': file_structure
-    }
+    if state is not None:
+        state.save()
+        changed = state.changed_subtrees()
+        try:
+            with open(args.output) as f:
+                previous = json.load(f)
+            previous.pop('generated', None)
+            unchanged = previous == manifest_body(file_structure, args.format, fields, args.subtree)
+        except (OSError, ValueError, AttributeError):
+            unchanged = False
+        if unchanged:
+            print('Manifest unchanged' + (' (re-listed: %s)' % ', '.join(changed) if changed else ''), file=sys.stderr)
+        else:
+            print('Changed: %s' % (', '.join(changed) or ('file contents or settings' if args.enrich else 'manifest settings')), file=sys.stderr)
+    if state is None or not unchanged:
+        write(file_structure)
     
-    # Output JSON
-    print(json.dumps(manifest, indent=2))
+    if args.watch:
+        watch(write, project_root, file_structure, matcher, args.suffixes, state,
+              debounce=args.debounce, poll=args.poll, enricher=enricher, budget=budget)
+    return 0
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
 